@@ -0,0 +1,145 @@
+# benchmark_retrieval.py
+#
+# Compare retrieval modes on a labelled query set:
+#
+#     python -m benchmark_retrieval --project NAME --queries queries.jsonl [--k 10] [--modes vector hybrid]
+#         [--top-files 10 50] [--build-file-index]
+#
+# Each line of the query file is a JSON object with the "query" and the
+# "expected" file paths that answer it. For every mode, the script reports
+# recall@k (the share of expected files found in the top k chunks, averaged
+# over queries) and the search latency. Each query is embedded once and the
+# embedding reused across modes, so latencies cover the search only.
+#
+# With --top-files, the vector and hybrid modes are also run in two stages
+# (files first, then their chunks) for each number of files, reported as
+# e.g. "vector+files@10". --build-file-index (re)builds the project's
+# file-level index from its chunk vectors before running.
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import MONGO_URL, MONGO_DB_NAME, HYBRID_ALPHA, HYBRID_FUSION
+from database import connect_weaviate, connect_weaviate_async
+from logging_config import setup_logging
+from utils.collection_names import get_active_weaviate_class_name, normalize_project_name
+from utils.embedding import get_embedding, get_project_embedding_model
+from utils.file_index import rebuild_file_index
+from utils.openai_clients import create_openai_client
+from utils.query_pipeline import search_chunks, RETRIEVAL_MODES
+
+
+def load_queries(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def recall_at_k(retrieved_files: List[str], expected_files: List[str]) -> float:
+    expected = set(expected_files)
+    return len(expected.intersection(retrieved_files)) / len(expected) if expected else 0.0
+
+
+def summarize_latencies(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "avg_ms": round(sum(ordered) / len(ordered), 2),
+        "p50_ms": round(ordered[len(ordered) // 2], 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+    }
+
+
+def get_variants(modes: List[str], top_files: List[int]) -> Dict[str, Dict[str, Any]]:
+    """The searches to compare, by name: every mode, then the two-stage runs of the vector-based ones."""
+    variants = {mode: {"mode": mode, "top_files": 0} for mode in modes}
+    for mode in modes:
+        if mode in ("vector", "hybrid"):
+            for n in top_files:
+                variants[f"{mode}+files@{n}"] = {"mode": mode, "top_files": n}
+    return variants
+
+
+async def run_benchmark(project: str, queries: List[Dict[str, Any]], k: int, modes: List[str],
+                        alpha: float, fusion: str, top_files: List[int] = (),
+                        build_file_index: bool = False) -> Dict[str, Any]:
+    mongo_client = AsyncIOMotorClient(MONGO_URL)
+    weaviate_async_client = await connect_weaviate_async()
+    openai_client = create_openai_client()
+    try:
+        project = normalize_project_name(project)
+        project_data = await mongo_client[MONGO_DB_NAME]["projects"].find_one({"normalized_name": project})
+        if not project_data:
+            raise SystemExit(f"Project '{project}' not found.")
+        class_name = get_active_weaviate_class_name(project_data)
+        model = get_project_embedding_model(project_data)
+        if build_file_index:
+            weaviate_client = connect_weaviate()
+            try:
+                await asyncio.to_thread(rebuild_file_index, weaviate_client, class_name)
+            finally:
+                weaviate_client.close()
+
+        variants = get_variants(modes, top_files)
+        recalls = {name: [] for name in variants}
+        latencies = {name: [] for name in variants}
+        for item in queries:
+            query_emb = await get_embedding(item["query"], openai_client, model)
+            for name, variant in variants.items():
+                started = time.monotonic()
+                chunks = await search_chunks(
+                    weaviate_async_client, class_name, query_emb, k,
+                    query_text=item["query"], alpha=alpha, fusion=fusion, **variant
+                )
+                latencies[name].append((time.monotonic() - started) * 1000)
+                recalls[name].append(recall_at_k([chunk["file"] for chunk in chunks], item["expected"]))
+
+        return {
+            "project": project,
+            "queries": len(queries),
+            "k": k,
+            "alpha": alpha,
+            "fusion": fusion,
+            "modes": {
+                name: {
+                    f"recall@{k}": round(sum(recalls[name]) / len(recalls[name]), 4),
+                    **summarize_latencies(latencies[name]),
+                }
+                for name in variants
+            },
+        }
+    finally:
+        mongo_client.close()
+        await weaviate_async_client.close()
+        await openai_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval modes by recall@k and latency.")
+    parser.add_argument("--project", required=True, help="Project to query.")
+    parser.add_argument("--queries", required=True, help="JSON lines file of {\"query\", \"expected\"} objects.")
+    parser.add_argument("--k", type=int, default=10, help="Number of chunks retrieved per query (default: 10).")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"], choices=RETRIEVAL_MODES)
+    parser.add_argument("--alpha", type=float, default=HYBRID_ALPHA, help="Hybrid alpha (1 is pure vector).")
+    parser.add_argument("--fusion", default=HYBRID_FUSION, choices=["ranked", "relativeScore"])
+    parser.add_argument("--top-files", nargs="*", type=int, default=[],
+                        help="Numbers of files selected by two-stage runs of the vector and hybrid modes.")
+    parser.add_argument("--build-file-index", action="store_true",
+                        help="Rebuild the project's file-level index from its chunk vectors first.")
+    args = parser.parse_args()
+
+    setup_logging()
+    queries = load_queries(args.queries)
+    if not queries:
+        raise SystemExit("No queries to run.")
+    report = asyncio.run(run_benchmark(
+        args.project, queries, args.k, args.modes, args.alpha, args.fusion, args.top_files, args.build_file_index
+    ))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
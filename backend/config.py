@@ -8,6 +8,7 @@ from loguru import logger
 WEAVIATE_HOST = os.environ.get("WEAVIATE_HOST", "localhost")
 WEAVIATE_PORT = os.environ.get("WEAVIATE_PORT", "8080")
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+MONGO_DB_NAME = "ai_demo_db"
 
 BINARY_EXTS = {
     ".png", ".jpg", ".jpeg", ".ico", ".gif", ".pdf", ".zip",
@@ -16,6 +17,138 @@ BINARY_EXTS = {
 
 CLASS_NAME = "CodeChunk"
 
+# Embeddings
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_COST_PER_1K_TOKENS = float(os.environ.get("EMBEDDING_COST_PER_1K_TOKENS", "0.0001"))
+EMBEDDING_MODEL_COSTS_PER_1K_TOKENS = {
+    "text-embedding-ada-002": 0.0001,
+    "text-embedding-3-small": 0.00002,
+    "text-embedding-3-large": 0.00013,
+}
+
+# Embedding-model migrations re-embed stored chunks in the background at this
+# rate, in batches of MIGRATION_BATCH_SIZE chunks per embedding request
+MIGRATION_CHUNKS_PER_SECOND = float(os.environ.get("MIGRATION_CHUNKS_PER_SECOND", "20"))
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", "50"))
+
+# Chunk and file digests: "blake2b", "xxhash" (if installed) or "sha256"
+# Stored digests of another algorithm are recomputed and upgraded in place on
+# the next analyze, which re-hashes every file but re-embeds nothing. xxhash
+# digests can only be verified while xxhash is installed: uninstalling it
+# re-embeds every file they were stored for.
+HASH_ALGORITHM = os.environ.get("HASH_ALGORITHM", "blake2b")
+
+# Shared OpenAI HTTP connection pool
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "60"))
+OPENAI_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_TIMEOUT_SECONDS", "120"))
+
+# Query embedding cache
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "1000"))
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = float(os.environ.get("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+QUERY_EMBEDDING_CACHE_PERSIST = os.environ.get("QUERY_EMBEDDING_CACHE_PERSIST", "false").lower() == "true"
+
+# Semantic answer cache: cosine distance under which a cached answer is reused
+ANSWER_CACHE_MAX_DISTANCE = float(os.environ.get("ANSWER_CACHE_MAX_DISTANCE", "0.05"))
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "200"))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+# Retrieval: "vector" (near_vector), "hybrid" (BM25 + vector) or "keyword" (BM25),
+# overridable per request with querySettings.retrievalMode, hybridAlpha and hybridFusion
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "vector")
+HYBRID_ALPHA = float(os.environ.get("HYBRID_ALPHA", "0.5"))
+HYBRID_FUSION = os.environ.get("HYBRID_FUSION", "relativeScore")
+KEYWORD_SEARCH_PROPERTIES = ["content", "filePath", "functionName"]
+
+# MMR diversification: over-fetch MMR_OVER_FETCH times the requested chunks with
+# their vectors and re-select them by Maximal Marginal Relevance (querySettings:
+# diversify, mmrLambda, mmrOverFetch)
+MMR_ENABLED = os.environ.get("MMR_ENABLED", "false").lower() == "true"
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", "0.7"))
+MMR_OVER_FETCH = int(os.environ.get("MMR_OVER_FETCH", "3"))
+
+# Completions
+COMPLETION_MODEL = os.environ.get("COMPLETION_MODEL", "gpt-4o")
+COMPLETION_MAX_TOKENS = int(os.environ.get("COMPLETION_MAX_TOKENS", "5000"))
+COMPLETION_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+
+# Context packing: tokens of retrieved code per prompt (querySettings.maxContextTokens
+# overrides it), capped by the model's context window minus the answer and
+# PROMPT_RESERVED_TOKENS for the history summary and the question
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.environ.get("DEFAULT_CONTEXT_TOKEN_BUDGET", "3000"))
+PROMPT_RESERVED_TOKENS = int(os.environ.get("PROMPT_RESERVED_TOKENS", "2000"))
+
+# Context compression (querySettings.contextCompression): 'none', 'whitespace',
+# 'comments' (also strips comments and docstrings) or 'signatures' (also
+# reduces the blocks ranked below the first CONTEXT_FULL_BLOCKS to their declarations)
+CONTEXT_COMPRESSION = os.environ.get("CONTEXT_COMPRESSION", "whitespace")
+CONTEXT_FULL_BLOCKS = int(os.environ.get("CONTEXT_FULL_BLOCKS", "3"))
+
+# Federated queries search at most FEDERATED_MAX_PROJECTS projects at once
+FEDERATED_MAX_PROJECTS = int(os.environ.get("FEDERATED_MAX_PROJECTS", "10"))
+
+# Query deadlines: each query must complete within QUERY_DEADLINE_SECONDS
+# (querySettings.deadlineSeconds), and each stage within its own budget.
+# The history summary is skipped, the context reduced or the completion
+# dropped (leaving the retrieved chunks) when time runs short; the completion
+# is not started with less than QUERY_MIN_COMPLETION_SECONDS left.
+QUERY_DEADLINE_SECONDS = float(os.environ.get("QUERY_DEADLINE_SECONDS", "30"))
+QUERY_EMBEDDING_TIMEOUT_SECONDS = float(os.environ.get("QUERY_EMBEDDING_TIMEOUT_SECONDS", "5"))
+QUERY_SEARCH_TIMEOUT_SECONDS = float(os.environ.get("QUERY_SEARCH_TIMEOUT_SECONDS", "5"))
+QUERY_SUMMARY_TIMEOUT_SECONDS = float(os.environ.get("QUERY_SUMMARY_TIMEOUT_SECONDS", "2"))
+QUERY_COMPLETION_TIMEOUT_SECONDS = float(os.environ.get("QUERY_COMPLETION_TIMEOUT_SECONDS", "25"))
+QUERY_MIN_COMPLETION_SECONDS = float(os.environ.get("QUERY_MIN_COMPLETION_SECONDS", "3"))
+
+# File-level index: when FILE_INDEX_ENABLED, analyze keeps one vector per file
+# (the mean of its chunk vectors) next to the chunks. Two-stage queries
+# (querySettings.twoStage) first select the FILE_INDEX_TOP_FILES closest files
+# (querySettings.topFiles), then search the chunks of those files only.
+FILE_INDEX_ENABLED = os.environ.get("FILE_INDEX_ENABLED", "false").lower() == "true"
+FILE_INDEX_TOP_FILES = int(os.environ.get("FILE_INDEX_TOP_FILES", "20"))
+
+# Symbol index: function and class definitions (and, with SYMBOL_INDEX_REFERENCES,
+# the names each chunk calls) are recorded in Mongo at ingestion. Questions naming
+# an identifier or a file are answered from those chunks without an embedding
+# call, unless SYMBOL_ROUTING_ENABLED is off (querySettings.symbolRouting).
+SYMBOL_INDEX_REFERENCES = os.environ.get("SYMBOL_INDEX_REFERENCES", "false").lower() == "true"
+SYMBOL_ROUTING_ENABLED = os.environ.get("SYMBOL_ROUTING_ENABLED", "true").lower() == "true"
+
+# Batch queries: at most BATCH_QUERY_MAX_QUERIES questions per request, with at
+# most BATCH_QUERY_CONCURRENCY completions in flight
+BATCH_QUERY_MAX_QUERIES = int(os.environ.get("BATCH_QUERY_MAX_QUERIES", "100"))
+BATCH_QUERY_CONCURRENCY = int(os.environ.get("BATCH_QUERY_CONCURRENCY", "4"))
+
+# Identical queries arriving while one is in flight share its computation
+QUERY_COALESCING_ENABLED = os.environ.get("QUERY_COALESCING_ENABLED", "true").lower() == "true"
+
+# Analyze planning: throughput is measured over the most recent analyze runs,
+# falling back to the default rate when no run has been recorded yet.
+ANALYZE_THROUGHPUT_WINDOW = int(os.environ.get("ANALYZE_THROUGHPUT_WINDOW", "10"))
+DEFAULT_EMBEDDED_CHUNKS_PER_SECOND = float(os.environ.get("DEFAULT_EMBEDDED_CHUNKS_PER_SECOND", "5"))
+
+# Ingestion work queue: analyze jobs are split into batches of files leased by workers
+WORK_QUEUE_BATCH_SIZE = int(os.environ.get("WORK_QUEUE_BATCH_SIZE", "20"))
+WORK_QUEUE_LEASE_SECONDS = int(os.environ.get("WORK_QUEUE_LEASE_SECONDS", "60"))
+WORK_QUEUE_MAX_ATTEMPTS = int(os.environ.get("WORK_QUEUE_MAX_ATTEMPTS", "3"))
+WORKER_POLL_INTERVAL_SECONDS = float(os.environ.get("WORKER_POLL_INTERVAL_SECONDS", "2"))
+
+# Ingestion scheduler: slots for embedding calls and writes, shared fairly
+# between projects (weighted by the project's "weight"), with a per-project
+# cap so one project never holds every slot. The limits apply per process:
+# the API and each worker have their own scheduler, so N workers allow up to
+# N times these slots in total
+SCHEDULER_EMBED_SLOTS = int(os.environ.get("SCHEDULER_EMBED_SLOTS", "8"))
+SCHEDULER_WRITE_SLOTS = int(os.environ.get("SCHEDULER_WRITE_SLOTS", "4"))
+SCHEDULER_PROJECT_EMBED_LIMIT = int(os.environ.get("SCHEDULER_PROJECT_EMBED_LIMIT", "4"))
+SCHEDULER_PROJECT_WRITE_LIMIT = int(os.environ.get("SCHEDULER_PROJECT_WRITE_LIMIT", "2"))
+
 # CORS Origins
 CORS_ORIGINS = [
     "http://localhost:13000",
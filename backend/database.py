@@ -9,44 +9,32 @@ from weaviate.connect import ConnectionParams
 from weaviate.exceptions import WeaviateStartUpError
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from config import WEAVIATE_HOST, WEAVIATE_PORT, MONGO_URL, CLASS_NAME, OPENAI_API_KEY
+from config import WEAVIATE_HOST, WEAVIATE_PORT, MONGO_URL, MONGO_DB_NAME, CLASS_NAME, OPENAI_API_KEY
 from logging_config import setup_logging
 from loguru import logger
 
 from fastapi import Request
 
-from utils.collection_names import get_mongo_chunk_hashes_collection_name, get_mongo_answers_collection_name
-
-@asynccontextmanager
-async def lifespan(app):
-    # --- Startup ---
-    # Initialize MongoDB client and store in app state
-    mongo_client = AsyncIOMotorClient(MONGO_URL)
-    app.state.mongo_client = mongo_client
-    app.state.db = mongo_client["ai_demo_db"]
-
-    # Initialize MongoDB "projects" collection
-    db = app.state.db
-    projects_collection = db["projects"]
-
-    # Create "projects" collection if it doesn't exist
-    collections = await db.list_collection_names()
-    if "projects" not in collections:
-        await db.create_collection("projects")
-        logger.info("Initialized 'projects' collection in MongoDB.")
-    else:
-        logger.info("'projects' collection already exists in MongoDB.")
-
-    # Create indexes for the projects collection
-    await projects_collection.create_index(
-        [("normalized_name", 1)],
-        unique=True,
-        name="unique_project_name"
-    )
-    logger.info("Indexes created for 'projects' collection.")
-    logger.info("MongoDB initialization completed successfully.")
-
-    # Initialize Weaviate client
+from utils.collection_names import (
+    get_mongo_chunk_hashes_collection_name,
+    get_mongo_answers_collection_name,
+    get_mongo_symbols_collection_name,
+    get_active_weaviate_class_name,
+)
+from utils.setup_weaviate_schema import ensure_filter_properties, backfill_path_property
+from utils.summarizer import ensure_answer_indexes, ensure_summary_indexes
+from utils.symbol_index import ensure_symbol_indexes
+from utils.work_queue import ensure_work_queue_indexes
+from utils.scheduler import IngestionScheduler
+from utils.openai_clients import create_openai_client
+from utils.embedding_cache import create_query_embedding_cache
+from utils.answer_cache import AnswerCache
+from utils.single_flight import SingleFlight
+from utils.embedding_migration import resume_migrations
+from utils.tokens import get_token_encoder
+
+def connect_weaviate() -> weaviate.WeaviateClient:
+    """Connect to Weaviate, retrying until it is ready."""
     while True:
         weaviate_client = weaviate.WeaviateClient(
             connection_params=ConnectionParams.from_params(
@@ -63,13 +51,13 @@ async def lifespan(app):
             skip_init_checks=False
         )
 
-    # Wait for Weaviate to be ready
+        # Wait for Weaviate to be ready
         try:
             logger.info("Trying to connect to Weaviate...")
             weaviate_client.connect()  # Call blocking method in a separate thread
             if weaviate_client.is_live():
                 logger.info("Connected to Weaviate successfully.")
-                break
+                return weaviate_client
             else:
                 logger.warning("Weaviate not ready yet. Retrying in 1 second...")
                 time.sleep(2)
@@ -79,7 +67,108 @@ async def lifespan(app):
             #await asyncio.sleep(1)
             time.sleep(2)
 
+async def connect_weaviate_async() -> weaviate.WeaviateAsyncClient:
+    """Connect the async Weaviate client used by the query path, retrying until it is ready."""
+    while True:
+        weaviate_async_client = weaviate.WeaviateAsyncClient(
+            connection_params=ConnectionParams.from_params(
+                http_host=WEAVIATE_HOST,
+                http_port=WEAVIATE_PORT,
+                http_secure=False,
+                grpc_host=WEAVIATE_HOST,
+                grpc_port=50051,
+                grpc_secure=False,
+            ),
+            additional_headers={
+                "X-OpenAI-Api-Key": OPENAI_API_KEY
+            },
+            skip_init_checks=False
+        )
+        try:
+            await weaviate_async_client.connect()
+            if await weaviate_async_client.is_live():
+                logger.info("Connected async Weaviate client successfully.")
+                return weaviate_async_client
+            logger.warning("Weaviate not ready yet. Retrying in 2 seconds...")
+        except Exception as e:
+            logger.warning(f"Error while connecting the async Weaviate client: {e}")
+        await asyncio.sleep(2)
+
+@asynccontextmanager
+async def lifespan(app):
+    # --- Startup ---
+    # Initialize MongoDB client and store in app state
+    mongo_client = AsyncIOMotorClient(MONGO_URL)
+    app.state.mongo_client = mongo_client
+    app.state.db = mongo_client[MONGO_DB_NAME]
+
+    # Initialize MongoDB "projects" collection
+    db = app.state.db
+    projects_collection = db["projects"]
+
+    # Create "projects" collection if it doesn't exist
+    collections = await db.list_collection_names()
+    if "projects" not in collections:
+        await db.create_collection("projects")
+        logger.info("Initialized 'projects' collection in MongoDB.")
+    else:
+        logger.info("'projects' collection already exists in MongoDB.")
+
+    # Create indexes for the projects collection
+    await projects_collection.create_index(
+        [("normalized_name", 1)],
+        unique=True,
+        name="unique_project_name"
+    )
+    logger.info("Indexes created for 'projects' collection.")
+
+    await db["analyze_runs"].create_index([("timestamp", -1)], name="analyze_runs_timestamp")
+    await ensure_work_queue_indexes(db)
+    await ensure_summary_indexes(db)
+    await db["embedding_migrations"].create_index([("project", 1), ("status", 1)], name="migrations_by_project")
+    logger.info("MongoDB initialization completed successfully.")
+
+    # Initialize Weaviate client
+    weaviate_client = connect_weaviate()
     app.state.weaviate_client = weaviate_client
+    app.state.weaviate_async_client = await connect_weaviate_async()
+
+    # Collections created before filtered retrieval lack the 'path' property and its values
+    existing_classes = weaviate_client.collections.list_all()
+    async for project_data in projects_collection.find(
+        {}, {"normalized_name": 1, "collectionName": 1, "pathBackfilled": 1}
+    ):
+        # History and rolling-summary reads sort a session's answers by timestamp
+        await ensure_answer_indexes(db[get_mongo_answers_collection_name(project_data["normalized_name"])])
+        await ensure_symbol_indexes(db[get_mongo_symbols_collection_name(project_data["normalized_name"])])
+        class_name = get_active_weaviate_class_name(project_data)
+        if class_name in existing_classes:
+            ensure_filter_properties(weaviate_client, class_name)
+            if not project_data.get("pathBackfilled"):
+                await asyncio.to_thread(backfill_path_property, weaviate_client, class_name)
+                await projects_collection.update_one(
+                    {"_id": project_data["_id"]}, {"$set": {"pathBackfilled": True}}
+                )
+
+    # Shared, pooled OpenAI client for embeddings and completions
+    app.state.openai_client = create_openai_client()
+    app.state.embedding_cache = await create_query_embedding_cache(db)
+    app.state.answer_cache = AnswerCache()
+    # Identical in-flight queries share one computation
+    app.state.single_flight = SingleFlight()
+
+    # Load the tokenizer once, before the first request needs it
+    app.state.token_encoder = get_token_encoder()
+
+    # Scheduler shared by every analyze request of this process (workers have their own)
+    app.state.scheduler = IngestionScheduler()
+
+    # Fire-and-forget tasks such as rolling-summary updates
+    app.state.background_tasks = set()
+
+    # Background embedding-model migrations, by project
+    app.state.migration_tasks = {}
+    await resume_migrations(app)
 
     yield  # Application is running
 
@@ -88,9 +177,14 @@ async def lifespan(app):
     mongo_client.close()
     logger.info("MongoDB connection closed.")
 
-    # Close Weaviate client
+    # Close Weaviate clients
     weaviate_client.close()
-    logger.info("Weaviate client closed.")
+    await app.state.weaviate_async_client.close()
+    logger.info("Weaviate clients closed.")
+
+    # Close the OpenAI connection pool
+    await app.state.openai_client.close()
+    logger.info("OpenAI client closed.")
 
 def get_db(request: Request) -> AsyncIOMotorClient:
     return request.app.state.mongo_client
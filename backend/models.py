@@ -1,19 +1,65 @@
 # models.py
 
 from pydantic import BaseModel, validator
-from typing import Optional
+from typing import List, Optional
 
 class AnalyzeRequest(BaseModel):
     project: str
+    useWorkers: bool = False
 
 class QuerySettings(BaseModel):
     querySettings: dict
     historySummarizerSettings: dict
 
+class QueryFilters(BaseModel):
+    languages: Optional[List[str]] = None
+    pathPrefix: Optional[str] = None
+    pathGlob: Optional[str] = None
+    functionName: Optional[str] = None
+    minLine: Optional[int] = None
+    maxLine: Optional[int] = None
+
+def validate_session_id(value):
+    if value is not None and (not value.strip() or len(value) > 100):
+        raise ValueError("Session id must be a non-empty string of at most 100 characters.")
+    return value
+
 class QueryRequest(BaseModel):
     query: str
     project: str
     settings: QuerySettings
+    filters: Optional[QueryFilters] = None
+    # Further projects searched along with `project`, which keeps the history
+    projects: Optional[List[str]] = None
+    # The conversation the query belongs to; queries without one share the project's
+    sessionId: Optional[str] = None
+
+    _validate_session_id = validator("sessionId")(validate_session_id)
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    project: str
+    settings: QuerySettings
+    filters: Optional[QueryFilters] = None
+    sessionId: Optional[str] = None
+
+    _validate_session_id = validator("sessionId")(validate_session_id)
+
+class SearchRequest(BaseModel):
+    query: str
+    project: str
+    mode: str = "vector"
+    alpha: Optional[float] = None
+    limit: int = 10
+    skip: int = 0
+    includeSnippet: bool = False
+    snippetLines: int = 5
+    filters: Optional[QueryFilters] = None
+
+class EmbeddingMigrationRequest(BaseModel):
+    project: str
+    model: str
+    chunksPerSecond: Optional[float] = None
 
 class ProjectDeleteRequest(BaseModel):
     name: str
@@ -8,6 +8,10 @@ from .hashes import router as hashes_router
 from .history import router as history_router
 from .projects import router as projects_router
 from .chunked_files import router as chunked_files_router
+from .scheduler import router as scheduler_router
+from .migrations import router as migrations_router
+from .metrics import router as metrics_router
+from .search import router as search_router
 
 def include_routers(app):
     app.include_router(analyze_router)
@@ -18,4 +22,8 @@ def include_routers(app):
     app.include_router(history_router)
     app.include_router(projects_router)
     app.include_router(chunked_files_router)
+    app.include_router(scheduler_router)
+    app.include_router(migrations_router)
+    app.include_router(metrics_router)
+    app.include_router(search_router)
 
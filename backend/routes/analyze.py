@@ -1,7 +1,9 @@
 # routes/analyze.py
 
+import asyncio
 import glob
 import os
+import time
 from typing import List, Optional
 from datetime import datetime
 
@@ -10,20 +12,40 @@ from loguru import logger
 
 from models import AnalyzeRequest, ProjectValidator
 from utils import (
-    chunk_file,
-    calculate_hash,
-    looks_like_binary,
-    get_embedding,
     get_filtered_file_paths,
     get_mongo_chunk_hashes_collection_name,
-    get_weaviate_class_name,
 )
+from utils.collection_names import get_active_weaviate_class_name, get_mongo_symbols_collection_name
+from utils.embedding import get_project_embedding_model, estimate_embedding_cost
+from utils.embedding_migration import get_running_migration
+from utils.file_index import open_file_index
+from utils.symbol_index import ensure_symbols_backfilled
+from utils.index_version import bump_index_version
 from utils.validators import validate_project
+from utils.ingestion import index_file
+from utils.work_queue import (
+    enqueue_analyze_job,
+    start_inline_job,
+    touch_inline_job,
+    finish_inline_job,
+    cancel_analyze_job,
+    format_job,
+    ANALYZE_JOBS_COLLECTION,
+)
+from utils.analysis_plan import (
+    get_embedding_encoder,
+    load_stored_hashes,
+    plan_file_changes,
+    get_recent_throughput,
+    estimate_duration,
+)
 
 
 from database import get_db
-from config import CLASS_NAME
+from config import CLASS_NAME, FILE_INDEX_ENABLED
 import weaviate
+from bson import ObjectId
+from bson.errors import InvalidId
 from motor.motor_asyncio import AsyncIOMotorClient
 
 router = APIRouter()
@@ -47,108 +69,191 @@ async def analyze_code(
         raise HTTPException(status_code=400, detail=f"Folder path '{folder_path}' does not exist.")
 
     chunk_hashes_collection = get_mongo_chunk_hashes_collection_name(project_data['normalized_name'])
-    weaviate_class_name = get_weaviate_class_name(project_data['normalized_name'])
+    weaviate_class_name = get_active_weaviate_class_name(project_data)
+    embedding_model = get_project_embedding_model(project_data)
     hashes_collection = db[chunk_hashes_collection]
 
+    if await get_running_migration(db, project_data['normalized_name']):
+        logger.warning(f"Analyze refused: an embedding migration is running for '{project_data['name']}'.")
+        raise HTTPException(status_code=409, detail="An embedding migration is running for this project. Retry once it completes.")
+
     logger.debug(f"MongoDB chunk hashes collection: {chunk_hashes_collection}")
     logger.debug(f"Weaviate class name: {weaviate_class_name}")
 
     file_paths = get_filtered_file_paths(folder_path)
     logger.debug(f"Filtered file paths: {file_paths}")
 
-    chunked_files = []
-    ignored_files = []
-
     if not file_paths:
         logger.warning(f"No files found in {folder_path}.")
         return {"message": f"No files found in {folder_path}."}
 
+    symbols_collection = db[get_mongo_symbols_collection_name(project_data['normalized_name'])]
+    # Unchanged files are not re-chunked: index the symbols of the chunks already stored
+    needs_backfill = not project_data.get("symbolIndexed")
+
+    if analyze_request.useWorkers:
+        job_id = await enqueue_analyze_job(db, project_data, file_paths)
+        if await get_running_migration(db, project_data['normalized_name']):
+            # Started between the first check and the job being recorded
+            await cancel_analyze_job(db, job_id)
+            raise HTTPException(status_code=409, detail="An embedding migration is running for this project. Retry once it completes.")
+        if needs_backfill:
+            # Off the request path: workers skip the files they index meanwhile
+            task = asyncio.create_task(ensure_symbols_backfilled(
+                db, project_data['normalized_name'],
+                request.app.state.weaviate_client.collections.get(weaviate_class_name), symbols_collection
+            ))
+            request.app.state.background_tasks.add(task)
+            task.add_done_callback(request.app.state.background_tasks.discard)
+        return {
+            "message": "Code analysis queued.",
+            "job_id": str(job_id),
+            "total_files": len(file_paths),
+        }
+
+    # Recorded as a running job so that no migration starts copying the
+    # collection while its chunks are being rewritten
+    job_id = await start_inline_job(db, project_data, len(file_paths))
+    if await get_running_migration(db, project_data['normalized_name']):
+        await finish_inline_job(db, job_id, "cancelled")
+        raise HTTPException(status_code=409, detail="An embedding migration is running for this project. Retry once it completes.")
+    heartbeat_task = asyncio.create_task(touch_inline_job(db, job_id))
+    try:
+        return await _analyze_inline(
+            request, project_data, file_paths, hashes_collection, weaviate_class_name, embedding_model,
+            symbols_collection, needs_backfill, job_id
+        )
+    except BaseException:
+        await finish_inline_job(db, job_id, "failed")
+        raise
+    finally:
+        heartbeat_task.cancel()
+
+
+async def _analyze_inline(request: Request, project_data: dict, file_paths: List[str], hashes_collection,
+                          weaviate_class_name: str, embedding_model: str, symbols_collection,
+                          needs_backfill: bool, job_id):
+    """Index the files of an analyze in this process, for its recorded inline job."""
+    db = request.app.state.db
+    chunked_files = []
+    ignored_files = []
+    chunks_embedded = 0
+    started_at = time.monotonic()
+
+    weaviate_client = request.app.state.weaviate_client
+    chunk_collection = weaviate_client.collections.get(weaviate_class_name)
+    if needs_backfill:
+        await ensure_symbols_backfilled(db, project_data['normalized_name'], chunk_collection, symbols_collection)
+    file_collection = None
+    if FILE_INDEX_ENABLED:
+        # Built from the stored chunk vectors the first time, then kept in step file by file
+        file_collection = await open_file_index(
+            db, weaviate_client, project_data["normalized_name"], weaviate_class_name
+        )
+
     for fp in file_paths:
         logger.debug(f"Processing file: {fp}")
         try:
-            _, ext = os.path.splitext(fp)
-            if looks_like_binary(ext):
-                logger.debug(f"File '{fp}' identified as binary and will be ignored.")
-                ignored_files.append(fp)
-                continue
-
-            chunks = chunk_file(fp)
-            logger.debug(f"Number of chunks generated for file '{fp}': {len(chunks)}")
-            if not chunks:
-                logger.debug(f"No chunks generated for file '{fp}'")
-                ignored_files.append(fp)
-                continue
-
-            # Check for changes in chunk hashes
-            file_changed = False
-            for ch in chunks:
-                text = ch["content"].strip()
-                if not text:
-                    logger.debug(f"Skipping empty chunk in file '{fp}'")
-                    continue
-
-                content_hash = calculate_hash(text)
-                existing_hash = await hashes_collection.find_one({"filePath": ch["filePath"], "hash": content_hash})
-                if not existing_hash:
-                    file_changed = True
-                    break
-
-            if file_changed:
-                # Delete all chunks for this file in Weaviate and MongoDB
-                weaviate_client = request.app.state.weaviate_client
-                chunk_collection = weaviate_client.collections.get(weaviate_class_name)
-
-                logger.debug(f"Executing deletion for file '{fp}'.")
-                response = chunk_collection.data.delete_many(
-                    where=Filter.by_property(name="filePath").equal(fp)
-                )
-                await hashes_collection.delete_many({"filePath": fp})
-
-                # Re-chunk the file and insert new chunks
-                for ch in chunks:
-                    text = ch["content"].strip()
-                    if not text:
-                        continue
-
-                    content_hash = calculate_hash(text)
-                    embedding = get_embedding(text)
-                    logger.debug(f"Generated embedding for chunk in file '{fp}'")
-
-                    data_object = {
-                        "content": ch["content"],
-                        "filePath": ch["filePath"],
-                        "language": ch["language"],
-                        "functionName": ch["functionName"],
-                        "startLine": ch["startLine"],
-                        "endLine": ch["endLine"],
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-                    chunk_collection.data.insert(properties=data_object, vector=embedding)
-                    logger.debug(f"Inserted chunk into Weaviate for file '{fp}'")
-
-                    await hashes_collection.update_one(
-                        {"filePath": ch["filePath"], "hash": content_hash},
-                        {"$set": {"hash": content_hash}},
-                        upsert=True
-                    )
-                    logger.debug(f"Updated MongoDB for chunk in file '{fp}'")
-
-                chunked_files.append(fp)
-            else:
-                logger.debug(f"No changes detected for file '{fp}'. Skipping re-chunking.")
-                chunked_files.append(fp)
-
+            result = await index_file(
+                fp, hashes_collection, chunk_collection, request.app.state.openai_client, request.app.state.scheduler,
+                project_data["normalized_name"], project_data.get("weight", 1.0), embedding_model,
+                file_collection, symbols_collection
+            )
         except Exception as e:
             logger.error(f"Failed to process file '{fp}': {e}")
             ignored_files.append(fp)
             continue
 
+        if result["status"] == "ignored":
+            ignored_files.append(fp)
+        else:
+            chunked_files.append(fp)
+        chunks_embedded += result["chunks_embedded"]
+
+    await bump_index_version(db, project_data["normalized_name"])
+    await finish_inline_job(db, job_id, "completed", {
+        "chunkedFiles": len(chunked_files),
+        "ignoredFiles": len(ignored_files),
+        "chunksEmbedded": chunks_embedded,
+    })
+
+    # Record the run so the planner can estimate durations from recent throughput
+    await db["analyze_runs"].insert_one({
+        "project": project_data["normalized_name"],
+        "chunks_embedded": chunks_embedded,
+        "duration_seconds": time.monotonic() - started_at,
+        "timestamp": datetime.utcnow(),
+    })
+
     logger.info(f"Code analysis completed for project: {project_data['name']}")
     return {
         "message": "Code analysis completed.",
+        "job_id": str(job_id),
         "total_files": len(file_paths),
         "chunked_files": len(chunked_files),
         "ignored_files": len(ignored_files),
         "details": {"chunked": chunked_files, "ignored": ignored_files},
     }
 
+
+@router.get("/api/analyze/jobs/{job_id}")
+async def get_analyze_job(request: Request, job_id: str):
+    """Fetch the progress of an analyze job, queued for the workers or run inline."""
+    try:
+        job = await request.app.state.db[ANALYZE_JOBS_COLLECTION].find_one({"_id": ObjectId(job_id)})
+    except InvalidId:
+        raise HTTPException(status_code=400, detail=f"Invalid job id '{job_id}'.")
+
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Analyze job '{job_id}' not found.")
+    return format_job(job)
+
+
+@router.post("/api/analyze/plan")
+async def plan_analysis(
+    request: Request,
+    analyze_request: AnalyzeRequest = Body(...),
+    project_data: dict = Depends(validate_project),
+):
+    """
+    Dry-run of /api/analyze: report which files and chunks would be embedded,
+    the tokens to embed, and the estimated cost and duration. Nothing is
+    embedded or written.
+    """
+    folder_path = os.path.join("codebase", project_data["folder"])
+    logger.debug(f"Planning analysis for project '{project_data['name']}' in '{folder_path}'")
+
+    if not os.path.exists(folder_path):
+        logger.error(f"Folder path '{folder_path}' does not exist.")
+        raise HTTPException(status_code=400, detail=f"Folder path '{folder_path}' does not exist.")
+
+    db = request.app.state.db
+    hashes_collection = db[get_mongo_chunk_hashes_collection_name(project_data['normalized_name'])]
+
+    try:
+        stored_hashes = await load_stored_hashes(hashes_collection)
+        file_paths = get_filtered_file_paths(folder_path)
+        embedding_model = get_project_embedding_model(project_data)
+        encoder = get_embedding_encoder(embedding_model)
+        # Chunking and tokenizing are CPU bound; keep them off the event loop
+        plan = await asyncio.to_thread(plan_file_changes, file_paths, stored_hashes, encoder)
+        throughput = await get_recent_throughput(db["analyze_runs"])
+    except Exception as e:
+        logger.error(f"Failed to plan analysis for project '{project_data['name']}': {e}")
+        raise HTTPException(status_code=500, detail="Failed to plan analysis.")
+
+    files = plan["files"]
+    chunks = plan["chunks"]
+    chunks_to_embed = chunks["new"] + chunks["changed"]
+
+    return {
+        "total_files": len(file_paths),
+        "files": {state: len(paths) for state, paths in files.items()},
+        "chunks": chunks,
+        "tokens_to_embed": plan["tokens_to_embed"],
+        "embedding_model": embedding_model,
+        "estimated_cost_usd": estimate_embedding_cost(plan["tokens_to_embed"], embedding_model),
+        "estimated_duration_seconds": estimate_duration(chunks_to_embed, throughput),
+        "throughput_chunks_per_second": throughput,
+        "details": {state: paths for state, paths in files.items() if state != "unchanged"},
+    }
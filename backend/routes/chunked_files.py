@@ -2,7 +2,12 @@
 
 from fastapi import APIRouter, Request, HTTPException
 from loguru import logger
-from utils import get_weaviate_class_name, normalize_project_name, get_mongo_chunk_hashes_collection_name
+from utils import normalize_project_name, get_mongo_chunk_hashes_collection_name
+from utils.collection_names import get_active_weaviate_class_name
+from utils.embedding_migration import get_running_migration
+from utils.file_index import delete_file_vector
+from utils.collection_names import get_file_weaviate_class_name, get_mongo_symbols_collection_name
+from utils.index_version import bump_index_version
 from weaviate.classes.query import Filter
 from pydantic import BaseModel
 
@@ -24,7 +29,8 @@ async def get_chunked_files(request: Request, projectName: str):
         project = normalize_project_name(projectName)
         logger.debug(f"Normalized project name: {project}")
 
-        weaviate_class_name = get_weaviate_class_name(project)
+        project_data = await request.app.state.db["projects"].find_one({"normalized_name": project}) or {"normalized_name": project}
+        weaviate_class_name = get_active_weaviate_class_name(project_data)
         weaviate_client = request.app.state.weaviate_client
         chunk_collection = weaviate_client.collections.get(weaviate_class_name)
 
@@ -74,7 +80,8 @@ async def delete_chunked_file(request: Request, data: FileDeleteRequest):
         hashes_collection_name = get_mongo_chunk_hashes_collection_name(project)
         hashes_collection = db[hashes_collection_name]
 
-        weaviate_class_name = get_weaviate_class_name(project)
+        project_data = await db["projects"].find_one({"normalized_name": project}) or {"normalized_name": project}
+        weaviate_class_name = get_active_weaviate_class_name(project_data)
         logger.debug("Weaviate class name: " + weaviate_class_name)
         weaviate_client = request.app.state.weaviate_client
         chunk_collection = weaviate_client.collections.get(weaviate_class_name)
@@ -85,6 +92,19 @@ async def delete_chunked_file(request: Request, data: FileDeleteRequest):
         )
 
         await hashes_collection.delete_many({"filePath": filePath})
+        await db[get_mongo_symbols_collection_name(project)].delete_many({"filePath": file_path})
+        if weaviate_client.collections.exists(get_file_weaviate_class_name(weaviate_class_name)):
+            delete_file_vector(
+                weaviate_client.collections.get(get_file_weaviate_class_name(weaviate_class_name)), file_path
+            )
+        await bump_index_version(db, project)
+
+        # Keep a running embedding migration's target in step
+        migration = await get_running_migration(db, project)
+        if migration:
+            weaviate_client.collections.get(migration["toCollection"]).data.delete_many(
+                where=Filter.by_property(name="filePath").equal(file_path)
+            )
 
         logger.debug(response)
         message = f"Delete operation completed:\n" \
@@ -7,8 +7,11 @@ from config import CLASS_NAME
 from utils import (
     setup_weaviate_schema,
     get_mongo_chunk_hashes_collection_name,
-    get_weaviate_class_name,
 )
+from utils.collection_names import get_active_weaviate_class_name, get_mongo_symbols_collection_name
+from utils.embedding import get_project_embedding_model
+from utils.embedding_migration import cancel_migration
+from utils.index_version import bump_index_version
 from utils.validators import validate_project
 from database import get_db
 
@@ -24,11 +27,14 @@ async def flush_databases(
     Drop the 'hashes' collection in MongoDB.
     """
     try:
-        weaviate_class_name = get_weaviate_class_name(project_data['normalized_name'])
+        await cancel_migration(request.app, project_data['normalized_name'])
+        weaviate_class_name = get_active_weaviate_class_name(project_data)
         weaviate_client = request.app.state.weaviate_client
         logger.debug(f"Trying to reset collection '{weaviate_class_name}'")
-        if weaviate_class_name in weaviate_client.collections.list_all():
-            weaviate_client.collections.delete(weaviate_class_name)
+        setup_weaviate_schema(
+            weaviate_client, project_data['normalized_name'], delete=True,
+            class_name=weaviate_class_name, embedding_model=get_project_embedding_model(project_data)
+        )
     except Exception as e:
         logger.error(f"Failed to reset Weaviate collection: {e}")
         raise HTTPException(status_code=500, detail="Failed to reset Weaviate collection.")
@@ -40,6 +46,9 @@ async def flush_databases(
         await db[chunk_hashes_collection].drop()
         await db.create_collection(chunk_hashes_collection)
         logger.info("MongoDB 'hashes' collection dropped successfully.")
+        # Symbols point at the deleted chunks
+        await db[get_mongo_symbols_collection_name(project_data['normalized_name'])].delete_many({})
+        await bump_index_version(db, project_data['normalized_name'])
     except Exception as e:
         logger.error(f"Failed to drop 'hashes' collection in MongoDB: {e}")
         raise HTTPException(status_code=500, detail="Failed to drop MongoDB collection.")
@@ -1,7 +1,7 @@
 # routes/history.py
 
 from fastapi import APIRouter, Request, HTTPException
-from typing import List
+from typing import List, Optional
 from loguru import logger
 from datetime import datetime
 from utils import (
@@ -12,12 +12,14 @@ from utils import (
 router = APIRouter()
 
 @router.get("/api/history")
-async def get_query_history(request: Request, project: str, limit: int = 10, skip: int = 0):
+async def get_query_history(request: Request, project: str, limit: int = 10, skip: int = 0,
+                            sessionId: Optional[str] = None):
     """
     Fetch query history from the database with optional pagination.
 
     Args:
         request: FastAPI request object.
+        sessionId (str): When set, only the history of this session is returned.
         limit (int): The maximum number of records to return. Default is 10.
         skip (int): The number of records to skip for pagination. Default is 0.
 
@@ -28,7 +30,8 @@ async def get_query_history(request: Request, project: str, limit: int = 10, ski
         # Access the MongoDB collection
         answers_collection = get_mongo_answers_collection_name(project)
         collection = request.app.state.db[answers_collection]
-        cursor = collection.find().sort("timestamp", -1).skip(skip).limit(limit)
+        query = {"sessionId": sessionId} if sessionId is not None else {}
+        cursor = collection.find(query).sort("timestamp", -1).skip(skip).limit(limit)
         history = await cursor.to_list(length=limit)
 
         # Format the records to ensure JSON serialization compatibility
@@ -36,6 +39,7 @@ async def get_query_history(request: Request, project: str, limit: int = 10, ski
             {
                 "query": record.get("query"),
                 "answer": record.get("answer"),
+                "sessionId": record.get("sessionId"),
                 "timestamp": record.get("timestamp").isoformat() if record.get("timestamp") else None,
             }
             for record in history
@@ -0,0 +1,24 @@
+# routes/metrics.py
+
+from fastapi import APIRouter, Request
+
+from utils.metrics import metrics
+from utils.openai_clients import pool_stats
+
+router = APIRouter()
+
+@router.get("/api/metrics")
+async def get_metrics(request: Request):
+    """
+    Report this process's counters and latency percentiles (e.g. query
+    time-to-first-token), the OpenAI connection pool utilization and the
+    hit rates of the query embedding and answer caches, and how many queries
+    were coalesced with an identical one in flight.
+    """
+    return {
+        **metrics.snapshot(),
+        "openai_pool": pool_stats(request.app.state.openai_client),
+        "query_embedding_cache": request.app.state.embedding_cache.stats(),
+        "answer_cache": request.app.state.answer_cache.stats(),
+        "single_flight": request.app.state.single_flight.stats(),
+    }
@@ -0,0 +1,81 @@
+# routes/migrations.py
+
+from fastapi import APIRouter, Request, Body, HTTPException
+from loguru import logger
+
+from models import EmbeddingMigrationRequest
+from utils.embedding import get_project_embedding_model
+from utils.embedding_migration import (
+    EMBEDDING_MIGRATIONS_COLLECTION,
+    get_running_migration,
+    create_migration,
+    start_migration,
+    cancel_migration,
+    format_migration,
+)
+from utils.validators import load_project
+from utils.work_queue import get_active_analyze_job
+from config import MIGRATION_CHUNKS_PER_SECOND
+
+router = APIRouter()
+
+@router.post("/api/embedding-migrations")
+async def start_embedding_migration(request: Request, body: EmbeddingMigrationRequest):
+    """
+    Re-embed a project's chunks with another embedding model in the background.
+    Queries are served from the current collection until the migration completes.
+    """
+    db = request.app.state.db
+    project_data = await load_project(db, body.project)
+    project = project_data["normalized_name"]
+
+    if body.model == get_project_embedding_model(project_data):
+        raise HTTPException(status_code=400, detail=f"Project '{body.project}' already uses '{body.model}'.")
+    if await get_running_migration(db, project):
+        raise HTTPException(status_code=409, detail=f"A migration is already running for project '{body.project}'.")
+    if await get_active_analyze_job(db, project):
+        raise HTTPException(status_code=409, detail=f"An analyze job is running for project '{body.project}'.")
+
+    try:
+        migration = await create_migration(
+            db, request.app.state.weaviate_client, project_data, body.model,
+            chunks_per_second=body.chunksPerSecond or MIGRATION_CHUNKS_PER_SECOND
+        )
+    except Exception as e:
+        logger.error(f"Failed to start embedding migration for project '{project}': {e}")
+        raise HTTPException(status_code=500, detail="Failed to start embedding migration.")
+
+    # An analyze that started while the migration was being recorded would
+    # change chunks behind the copy: the migration gives way to it
+    if await get_active_analyze_job(db, project):
+        await cancel_migration(request.app, project)
+        raise HTTPException(status_code=409, detail=f"An analyze job is running for project '{body.project}'.")
+
+    try:
+        start_migration(request.app, migration)
+    except Exception as e:
+        logger.error(f"Failed to start embedding migration for project '{project}': {e}")
+        raise HTTPException(status_code=500, detail="Failed to start embedding migration.")
+
+    return format_migration(migration)
+
+
+@router.get("/api/embedding-migrations")
+async def list_embedding_migrations(request: Request, project: str, limit: int = 10):
+    """Fetch a project's embedding migrations, most recent first, with progress and cost."""
+    project_data = await load_project(request.app.state.db, project)
+    migrations = await request.app.state.db[EMBEDDING_MIGRATIONS_COLLECTION].find(
+        {"project": project_data["normalized_name"]}
+    ).sort("createdAt", -1).limit(limit).to_list(length=limit)
+    return {
+        "embeddingModel": get_project_embedding_model(project_data),
+        "migrations": [format_migration(migration) for migration in migrations],
+    }
+
+
+@router.post("/api/embedding-migrations/cancel")
+async def cancel_embedding_migration(request: Request, project: str = Body(..., embed=True)):
+    """Cancel a project's running migration. The project keeps its current model."""
+    project_data = await load_project(request.app.state.db, project)
+    await cancel_migration(request.app, project_data["normalized_name"])
+    return {"message": f"Embedding migration of project '{project}' cancelled."}
@@ -4,10 +4,17 @@ from loguru import logger
 from utils.collection_names import (
     get_mongo_chunk_hashes_collection_name,
     get_mongo_answers_collection_name,
+    get_mongo_symbols_collection_name,
     get_weaviate_class_name,
     normalize_project_name,
 )
+from utils.collection_names import get_active_weaviate_class_name
 from utils.setup_weaviate_schema import setup_weaviate_schema
+from utils.embedding_migration import cancel_migration
+from utils.file_index import delete_file_index
+from utils.symbol_index import ensure_symbol_indexes
+from utils.summarizer import CONVERSATION_SUMMARIES_COLLECTION, ensure_answer_indexes
+from config import EMBEDDING_MODEL
 from models import ProjectDeleteRequest
 
 router = APIRouter()
@@ -34,7 +41,8 @@ async def get_projects(request: Request):
 async def create_project(
     request: Request, 
     name: str = Body(...), 
-    folder: str = Body(...)
+    folder: str = Body(...),
+    weight: float = Body(1.0, gt=0)
 ):
     """Create a new project."""
     try:
@@ -66,6 +74,9 @@ async def create_project(
         # Create the MongoDB collections for the project
         await db.create_collection(chunk_hashes_collection)
         await db.create_collection(answers_collection)
+        await ensure_answer_indexes(db[answers_collection])
+        await db[get_mongo_symbols_collection_name(normalized_name)].drop()
+        await ensure_symbol_indexes(db[get_mongo_symbols_collection_name(normalized_name)])
         logger.debug(f"MongoDB collections created for project '{name}'.")
 
         # Initialize the Weaviate schema for the project
@@ -78,6 +89,12 @@ async def create_project(
             "name": name,
             "normalized_name": normalized_name,
             "folder": folder,
+            "weight": weight,
+            "embeddingModel": EMBEDDING_MODEL,
+            "collectionName": weaviate_class_name,
+            # Nothing to backfill: symbols and paths are stored as files are analyzed
+            "symbolIndexed": True,
+            "pathBackfilled": True,
         }
         await projects_collection.insert_one(project_data)
         logger.info(f"Project '{name}' successfully created.")
@@ -97,13 +114,17 @@ async def delete_project(request: Request, name: str = Body(..., embed=True)):
         normalized_name = normalize_project_name(name)
         chunk_hashes_collection = get_mongo_chunk_hashes_collection_name(normalized_name)
         answers_collection = get_mongo_answers_collection_name(normalized_name)
-        weaviate_class_name = get_weaviate_class_name(normalized_name)
 
         db = request.app.state.db
+        project_data = await db["projects"].find_one({"normalized_name": normalized_name}) or {"normalized_name": normalized_name}
+        weaviate_class_name = get_active_weaviate_class_name(project_data)
+        await cancel_migration(request.app, normalized_name)
 
         # Drop the collections for the project
         await db[chunk_hashes_collection].drop()
         await db[answers_collection].drop()
+        await db[get_mongo_symbols_collection_name(normalized_name)].drop()
+        await db[CONVERSATION_SUMMARIES_COLLECTION].delete_many({"project": normalized_name})
         logger.debug(f"MongoDB collections dropped for project '{name}'.")
 
         # Delete the Weaviate collection for the project
@@ -112,6 +133,7 @@ async def delete_project(request: Request, name: str = Body(..., embed=True)):
         if weaviate_class_name in existing_classes:
             weaviate_client.collections.delete(weaviate_class_name)
             logger.info(f"Weaviate collection '{weaviate_class_name}' deleted.")
+        delete_file_index(weaviate_client, weaviate_class_name)
 
         # Remove the project from the "projects" collection
         projects_collection = db["projects"]
@@ -120,6 +142,7 @@ async def delete_project(request: Request, name: str = Body(..., embed=True)):
             logger.warning(f"Project '{name}' not found.")
             raise HTTPException(status_code=404, detail="Project not found.")
 
+        request.app.state.answer_cache.invalidate(normalized_name)
         logger.info(f"Project '{name}' successfully deleted.")
         return {"message": f"Project '{name}' deleted successfully."}
     except Exception as e:
@@ -136,7 +159,7 @@ async def delete_all_projects(request: Request):
         projects_collection = db["projects"]
 
         # Fetch all projects from the "projects" collection
-        projects = await projects_collection.find({}, {"normalized_name": 1}).to_list(length=None)
+        projects = await projects_collection.find({}, {"normalized_name": 1, "collectionName": 1}).to_list(length=None)
         logger.debug(f"Projects to delete: {projects}")
 
         if not projects:
@@ -149,11 +172,14 @@ async def delete_all_projects(request: Request):
             normalized_name = project["normalized_name"]
             chunk_hashes_collection = get_mongo_chunk_hashes_collection_name(normalized_name)
             answers_collection = get_mongo_answers_collection_name(normalized_name)
-            weaviate_class_name = get_weaviate_class_name(normalized_name)
+            weaviate_class_name = get_active_weaviate_class_name(project)
+            await cancel_migration(request.app, normalized_name)
+            request.app.state.answer_cache.invalidate(normalized_name)
 
             # Drop MongoDB collections
             await db[chunk_hashes_collection].drop()
             await db[answers_collection].drop()
+            await db[get_mongo_symbols_collection_name(normalized_name)].drop()
             logger.debug(f"Dropped MongoDB collections for project '{normalized_name}'.")
 
             # Delete Weaviate collection
@@ -161,9 +187,11 @@ async def delete_all_projects(request: Request):
             if weaviate_class_name in existing_classes:
                 weaviate_client.collections.delete(weaviate_class_name)
                 logger.info(f"Weaviate collection '{weaviate_class_name}' deleted.")
+            delete_file_index(weaviate_client, weaviate_class_name)
 
         # Clear the "projects" collection
         await projects_collection.delete_many({})
+        await db[CONVERSATION_SUMMARIES_COLLECTION].delete_many({})
         logger.info("All projects and their resources have been deleted.")
         return {"message": "All projects and their resources have been deleted."}
     except Exception as e:
@@ -1,27 +1,44 @@
-from typing import List
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from loguru import logger
-from datetime import datetime
 from pydantic import BaseModel
-from tiktoken import encoding_for_model
-
-from models import QueryRequest, QuerySettings
-from utils import (
-    get_embedding,
-    summarize_interactions,
-    sanitize_keys,
-    get_mongo_chunk_hashes_collection_name,
-    get_mongo_answers_collection_name,
-    get_weaviate_class_name,
-    normalize_project_name,
+
+from models import QueryRequest, QuerySettings, BatchQueryRequest
+from utils.embedding import get_project_embedding_model
+from utils.query_pipeline import (
+    retrieve_context,
+    parse_query_options,
+    load_query_scope,
+    start_history_lookup,
+    search_chunks,
+    build_prompt,
+    prepare_prompt,
+    has_time_for_completion,
+    format_chunk_refs,
+    generate_answer,
+    get_coalescing_key,
+    store_answer,
+    schedule_summary_update,
 )
+from utils.metrics import metrics
+from utils.openai_clients import get_openai_client
 from database import get_db
+from config import (
+    COMPLETION_MODEL,
+    COMPLETION_MAX_TOKENS,
+    BATCH_QUERY_MAX_QUERIES,
+    BATCH_QUERY_CONCURRENCY,
+    QUERY_COALESCING_ENABLED,
+    QUERY_COMPLETION_TIMEOUT_SECONDS,
+)
 
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from openai import OpenAI
-
-from weaviate.classes.query import MetadataQuery
+from openai import AsyncOpenAI
 
 router = APIRouter()
 
@@ -29,141 +46,366 @@ class QueryResponse(BaseModel):
     answer: str
     tokens_submitted: int
     tokens_returned: int
+    cached: bool = False
+    # Context tokens removed by compression
+    tokens_saved: int = 0
+    # Stages skipped or reduced to meet the query's deadline
+    degraded: List[str] = []
+    # The retrieved chunks, when the deadline left no time for an answer
+    chunks: Optional[List[Dict[str, Any]]] = None
+
+async def answer_query(request: Request, body: QueryRequest, openai_client: AsyncOpenAI) -> dict:
+    """
+    Retrieve the context of a query and answer it, or serve it from the
+    answer cache. When the deadline leaves no time for the completion, the
+    retrieved chunks are returned without an answer.
+    """
+    started = time.monotonic()
+    retrieval = await retrieve_context(request, body)
+    user_query = retrieval["user_query"]
+    retrieved_chunks = retrieval["retrieved_chunks"]
+    deadline = retrieval["deadline"]
+
+    if retrieval["cached_answer"] is not None:
+        ai_answer = retrieval["cached_answer"]
+        try:
+            await store_answer(retrieval["answers_collection"], user_query, ai_answer, retrieval["session_id"])
+            schedule_summary_update(request, retrieval)
+        except Exception as e:
+            logger.error(f"Failed to store Q&A in MongoDB: {str(e)}")
+        metrics.observe("query.cached_total_ms", (time.monotonic() - started) * 1000)
+        return {"answer": ai_answer, "tokens_submitted": 0, "tokens_returned": 0, "cached": True}
+
+    if not retrieved_chunks:
+        retrieval["summary_task"].cancel()
+        logger.info("No relevant code chunks found for the query.")
+        return {"answer": "No relevant code chunks found for your query.", "tokens_submitted": 0, "tokens_returned": 0,
+                "degraded": deadline.degraded}
+
+    # Limit context to prevent exceeding token limits
+    prompt, prompt_tokens, tokens_saved = await prepare_prompt(retrieval)
+
+    # Call OpenAI API
+    result = None
+    if has_time_for_completion(deadline):
+        try:
+            result = await deadline.run(
+                generate_answer(openai_client, prompt, prompt_tokens), QUERY_COMPLETION_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.error("OpenAI API call timed out.")
+            deadline.degrade("completion")
+    if result is None:
+        metrics.observe("query.total_ms", (time.monotonic() - started) * 1000)
+        return {"answer": "", "tokens_submitted": 0, "tokens_returned": 0,
+                "degraded": deadline.degraded, "chunks": format_chunk_refs(retrieved_chunks)}
+    ai_answer = result["answer"]
+    # Symbol-routed queries have no embedding to cache the answer under
+    if not result["failed"] and retrieval["query_emb"] is not None:
+        request.app.state.answer_cache.store(
+            retrieval["project_data"], retrieval["query_emb"], ai_answer, retrieval["answer_scope"]
+        )
+
+    try:
+        await store_answer(retrieval["answers_collection"], user_query, ai_answer, retrieval["session_id"])
+        schedule_summary_update(request, retrieval)
+    except Exception as e:
+        logger.error(f"Failed to store Q&A in MongoDB: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to store query and answer.")
+
+    metrics.observe("query.total_ms", (time.monotonic() - started) * 1000)
+    return {"answer": ai_answer, "tokens_submitted": result["tokens_submitted"], "tokens_returned": result["tokens_returned"],
+            "tokens_saved": tokens_saved, "degraded": deadline.degraded}
+
 
 @router.post("/api/query", response_model=QueryResponse)
 async def query_ai(
     request: Request,
     body: QueryRequest,
-    db: AsyncIOMotorClient = Depends(get_db)
+    db: AsyncIOMotorClient = Depends(get_db),
+    openai_client: AsyncOpenAI = Depends(get_openai_client),
 ):
-    user_query = body.query
-    project = normalize_project_name(body.project)
-    settings = body.settings
-
-    # Use settings in your logic as needed
-    nb_chunks_used_for_query = int(settings.querySettings.get("nbChunksUsedForQuery", 10))
-    nb_literal_items = int(settings.historySummarizerSettings.get("nbLiteralItems", 2))
-    max_total_history_items = int(settings.historySummarizerSettings.get("maxTotalHistoryItems", 10))
-    logger.debug(f'settings -  nb_chunks_used_for_query: {nb_chunks_used_for_query}')
-    logger.debug(f'settings -  nb_literal_items: {nb_literal_items}')
-    logger.debug(f'settings -  max_total_history_items: {max_total_history_items}')
-
-    # Input validation
-    if not user_query.strip():
-        logger.warning("Empty query received.")
-        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    """
+    Answer a query. Identical queries arriving while one is in flight wait
+    for it and receive the same answer, which is stored once.
+    """
+    if not QUERY_COALESCING_ENABLED:
+        return await answer_query(request, body, openai_client)
+    key = await get_coalescing_key(request, body)
+    return await request.app.state.single_flight.do(key, lambda: answer_query(request, body, openai_client))
+
+
+def sse_event(event: str, data) -> str:
+    """Format a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    if not project.strip():
-        logger.warning("Empty project name received.")
-        raise HTTPException(status_code=400, detail="Project name cannot be empty.")
 
+async def query_events(request: Request, retrieval: dict, openai_client: AsyncOpenAI, started: float):
+    """Generate the Server-Sent Events of a streamed answer."""
+    user_query = retrieval["user_query"]
+    retrieved_chunks = retrieval["retrieved_chunks"]
+    deadline = retrieval["deadline"]
+
+    if retrieval["cached_answer"] is not None:
+        yield sse_event("chunks", [])
+        yield sse_event("token", {"content": retrieval["cached_answer"]})
+        try:
+            await store_answer(
+                retrieval["answers_collection"], user_query, retrieval["cached_answer"], retrieval["session_id"]
+            )
+            schedule_summary_update(request, retrieval)
+        except Exception as e:
+            logger.error(f"Failed to store Q&A in MongoDB: {str(e)}")
+        duration = (time.monotonic() - started) * 1000
+        metrics.observe("query.cached_total_ms", duration)
+        yield sse_event("summary", {
+            "tokens_submitted": 0,
+            "tokens_returned": 0,
+            "cached": True,
+            "duration_ms": round(duration, 1),
+        })
+        return
+
+    yield sse_event("chunks", format_chunk_refs(retrieved_chunks))
+
+    if not retrieved_chunks:
+        retrieval["summary_task"].cancel()
+        yield sse_event("token", {"content": "No relevant code chunks found for your query."})
+        yield sse_event("summary", {"tokens_submitted": 0, "tokens_returned": 0, "degraded": deadline.degraded})
+        return
+
+    prompt, prompt_tokens, tokens_saved = await prepare_prompt(retrieval)
+    if not has_time_for_completion(deadline):
+        # The 'chunks' event already carried the retrieval results
+        yield sse_event("summary", {"tokens_submitted": 0, "tokens_returned": 0, "degraded": deadline.degraded})
+        return
+
+    # Each step of the stream waits at most until the completion's deadline
+    completion = deadline.stage(QUERY_COMPLETION_TIMEOUT_SECONDS)
+    parts = []
+    usage = None
+    time_to_first_token = None
+    stream = None
     try:
-        query_emb = get_embedding(user_query)
+        stream = await completion.run(openai_client.chat.completions.create(
+            model=COMPLETION_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=COMPLETION_MAX_TOKENS,
+            stream=True,
+            stream_options={"include_usage": True}
+        ))
+        events = stream.__aiter__()
+        while True:
+            try:
+                event = await completion.run(events.__anext__())
+            except StopAsyncIteration:
+                break
+            if event.usage:
+                usage = event.usage
+            if not event.choices or not event.choices[0].delta.content:
+                continue
+            if time_to_first_token is None:
+                time_to_first_token = (time.monotonic() - started) * 1000
+                metrics.observe("query.time_to_first_token_ms", time_to_first_token)
+            parts.append(event.choices[0].delta.content)
+            yield sse_event("token", {"content": event.choices[0].delta.content})
+    except asyncio.TimeoutError:
+        # The partial answer is neither cached nor stored
+        logger.error("OpenAI API call timed out.")
+        deadline.degrade("completion")
+        if stream is not None:
+            await stream.close()
+        yield sse_event("summary", {
+            "tokens_submitted": prompt_tokens,
+            "tokens_returned": len(parts),
+            "tokens_saved": tokens_saved,
+            "cached": False,
+            "degraded": deadline.degraded,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+        })
+        return
     except Exception as e:
-        logger.error(f"Embedding generation failed: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to generate embedding for query.")
+        logger.error(f"OpenAI API call failed: {e}")
+        yield sse_event("error", {"detail": f"Error calling OpenAI: {e}"})
+        return
 
-    # Database collections setup
-    try:
-        db = request.app.state.db
-        weaviate_class_name = get_weaviate_class_name(project)
-        hashes_collection_name = get_mongo_chunk_hashes_collection_name(project)
-        hashes_collection = db[hashes_collection_name]
-        answers_collection_name = get_mongo_answers_collection_name(project)
-        answers_collection = db[answers_collection_name]
-    except KeyError as e:
-        logger.error(f"Invalid project setup: {str(e)}")
-        raise HTTPException(status_code=400, detail="Project configuration is invalid.")
-
-    # Query Weaviate (Unchanged)
-    try:
-        weaviate_client = request.app.state.weaviate_client
-        chunk_collection = weaviate_client.collections.get(weaviate_class_name)
-        result = chunk_collection.query.near_vector(
-            near_vector=query_emb,
-            limit=nb_chunks_used_for_query,
-            return_metadata=MetadataQuery(distance=True)
+    ai_answer = "".join(parts).strip()
+    logger.info("AI responded successfully.")
+    if retrieval["query_emb"] is not None:
+        request.app.state.answer_cache.store(
+            retrieval["project_data"], retrieval["query_emb"], ai_answer, retrieval["answer_scope"]
         )
-        logger.debug("Weaviate query executed successfully.")
+    try:
+        await store_answer(retrieval["answers_collection"], user_query, ai_answer, retrieval["session_id"])
+        schedule_summary_update(request, retrieval)
     except Exception as e:
-        logger.error(f"Weaviate query failed: {e}")
-        raise HTTPException(status_code=500, detail="Weaviate query failed.")
+        logger.error(f"Failed to store Q&A in MongoDB: {str(e)}")
 
-    # Process retrieved chunks
-    retrieved_chunks = []
-    try:
-        for item in result.objects:
-            rec = {
-                "file": item.properties["filePath"],
-                "lines": f"{item.properties['startLine']}-{item.properties['endLine']}",
-                "content": item.properties["content"],
-            }
-            retrieved_chunks.append(rec)
-    except KeyError as e:
-        logger.warning("Unexpected response format from Weaviate.")
-        raise HTTPException(status_code=500, detail="Invalid response from Weaviate.")
+    duration = (time.monotonic() - started) * 1000
+    metrics.observe("query.stream_total_ms", duration)
+    yield sse_event("summary", {
+        "tokens_submitted": usage.prompt_tokens if usage else prompt_tokens,
+        # Without usage, count streamed deltas: each carries about one token
+        "tokens_returned": usage.completion_tokens if usage else len(parts),
+        "tokens_saved": tokens_saved,
+        "cached": False,
+        "time_to_first_token_ms": round(time_to_first_token, 1) if time_to_first_token else None,
+        "duration_ms": round(duration, 1),
+        "degraded": deadline.degraded,
+    })
 
-    if not retrieved_chunks:
-        logger.info("No relevant code chunks found for the query.")
-        return {"answer": "No relevant code chunks found for your query.", "tokens_submitted": 0, "tokens_returned": 0}
 
-    # Limit context to prevent exceeding token limits
-    encoder = encoding_for_model("gpt-4")
-    context = []
-    token_count = 0
-    max_token_length = 3000
-
-    for chunk in retrieved_chunks:
-        formatted_chunk = (
-            f"File: {chunk['file']}\nLines: {chunk['lines']}\nContent:\n{chunk['content']}"
+async def open_query_stream(request: Request, body: QueryRequest, openai_client: AsyncOpenAI):
+    """Retrieve the context of a query and return the generator of its events."""
+    started = time.monotonic()
+    # Validation, embedding and search errors are still returned as HTTP errors
+    retrieval = await retrieve_context(request, body)
+    return query_events(request, retrieval, openai_client, started)
+
+
+@router.post("/api/query/stream")
+async def query_ai_stream(
+    request: Request,
+    body: QueryRequest,
+    openai_client: AsyncOpenAI = Depends(get_openai_client),
+):
+    """
+    Streaming variant of /api/query over Server-Sent Events:
+
+    - 'chunks': the references of the retrieved chunks, sent before the completion starts
+    - 'token': each piece of the answer as it is generated (the whole answer
+      when it comes from the answer cache)
+    - 'summary': token counts (including the context 'tokens_saved' by
+      compression), latencies, whether the answer was cached and
+      the 'degraded' stages, once the answer is complete or was cut short by
+      the query's deadline
+    - 'error': sent instead of 'summary' when the completion fails
+
+    The Q&A record is stored once the answer is complete, before the summary event.
+
+    Identical queries arriving while one is streaming attach to it: each
+    receives every event from the first, then the rest as they are generated.
+    The shared stream runs to completion even if its first client disconnects.
+    """
+    if QUERY_COALESCING_ENABLED:
+        key = await get_coalescing_key(request, body)
+        events = await request.app.state.single_flight.stream(
+            key, lambda: open_query_stream(request, body, openai_client)
         )
-        chunk_token_count = len(encoder.encode(formatted_chunk))
-        if token_count + chunk_token_count <= max_token_length:
-            context.append(formatted_chunk)
-            token_count += chunk_token_count
-        else:
-            break
+    else:
+        events = await open_query_stream(request, body, openai_client)
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    summary = await summarize_interactions(answers_collection, max_literal=nb_literal_items, max_total=max_total_history_items)
-    context.append(summary)
-    context_str = "\n---\n".join(context)
-    prompt = f"Context:\n{context_str}\n\nQuestion: {user_query}\nAnswer:"
 
-    logger.info(f"Generated prompt for AI: {prompt}")
+@router.post("/api/query/batch")
+async def query_ai_batch(
+    request: Request,
+    body: BatchQueryRequest,
+    openai_client: AsyncOpenAI = Depends(get_openai_client),
+):
+    """
+    Answer several questions on one project, sharing the work between them:
+    the questions are embedded in a single request, searched concurrently and
+    answered with the same history context, with at most
+    BATCH_QUERY_CONCURRENCY completions in flight.
+
+    Results are streamed as Server-Sent Events in input order:
 
-    # Calculate tokens submitted
-    tokens_submitted = len(encoder.encode(prompt))
+    - 'result': the 'index', 'query', 'answer', token counts and whether the
+      answer was 'cached', or an 'error' for a question that failed
+    - 'summary': the number of questions and the total duration
+    """
+    started = time.monotonic()
+    options = parse_query_options(body.settings)
+    if not body.queries:
+        raise HTTPException(status_code=400, detail="At least one query is required.")
+    if len(body.queries) > BATCH_QUERY_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_QUERY_MAX_QUERIES} queries per batch.")
+    if any(not query.strip() for query in body.queries):
+        raise HTTPException(status_code=400, detail="Query cannot be empty.")
 
-    # Call OpenAI API (Unchanged)
+    scope = await load_query_scope(request, body.project, body.filters)
+    project_data = scope["project_data"]
+    summary_task = start_history_lookup(request, scope, options, body.sessionId)
     try:
-        openai_client = OpenAI()
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.0,
-            max_tokens=5000
+        query_embs = await request.app.state.embedding_cache.get_embeddings(
+            body.queries, openai_client, get_project_embedding_model(project_data)
         )
-        ai_answer = completion.choices[0].message.content.strip()
-        tokens_returned = len(encoder.encode(ai_answer))
-        logger.info("AI responded successfully.")
     except Exception as e:
-        ai_answer = f"Error calling OpenAI: {e}"
-        tokens_returned = 0
-        logger.error(f"OpenAI API call failed: {e}")
+        summary_task.cancel()
+        logger.error(f"Embedding generation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to generate embeddings for the queries.")
 
-    # Sanitize and store the result
-    doc = {
-        "query": user_query,
-        "answer": ai_answer,
-        "timestamp": datetime.utcnow()
-    }
-    sanitized_doc = sanitize_keys(doc)
+    answer_cache = request.app.state.answer_cache
+    completions = asyncio.Semaphore(BATCH_QUERY_CONCURRENCY)
 
-    try:
-        await answers_collection.insert_one(sanitized_doc)
-        logger.debug("Sanitized Q&A stored in MongoDB.")
-    except Exception as e:
-        logger.error(f"Failed to store Q&A in MongoDB: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to store query and answer.")
+    async def answer(query: str, query_emb) -> dict:
+        if options["use_answer_cache"]:
+            cached_answer = answer_cache.lookup(
+                project_data, query_emb, options["answer_cache_distance"], scope["answer_scope"]
+            )
+            if cached_answer is not None:
+                return {"answer": cached_answer, "tokens_submitted": 0, "tokens_returned": 0, "cached": True}
+
+        retrieved_chunks = await search_chunks(
+            request.app.state.weaviate_async_client, scope["weaviate_class_name"], query_emb, options["limit"],
+            query_text=query, filters=scope["chunk_filter"], symbols_collection=scope["symbols_collection"],
+            **options["search"]
+        )
+        if not retrieved_chunks:
+            return {"answer": "No relevant code chunks found for your query.",
+                    "tokens_submitted": 0, "tokens_returned": 0, "cached": False}
+
+        # Every question awaits the same history lookup; shielded so one
+        # cancelled question does not cancel it for the others
+        summary = await asyncio.shield(summary_task)
+        prompt, prompt_tokens, tokens_saved = build_prompt(
+            retrieved_chunks, summary, query, options["context_budget"], options["compression"]
+        )
+        async with completions:
+            result = await generate_answer(openai_client, prompt, prompt_tokens)
+        if not result.pop("failed"):
+            answer_cache.store(project_data, query_emb, result["answer"], scope["answer_scope"])
+        return {**result, "tokens_saved": tokens_saved, "cached": False}
+
+    tasks = [asyncio.create_task(answer(query, query_emb)) for query, query_emb in zip(body.queries, query_embs)]
+
+    async def event_stream():
+        try:
+            for index, (query, task) in enumerate(zip(body.queries, tasks)):
+                try:
+                    result = await task
+                except Exception as e:
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    logger.error(f"Batch query {index} failed: {detail}")
+                    yield sse_event("result", {"index": index, "query": query, "error": detail})
+                    continue
+                try:
+                    await store_answer(scope["answers_collection"], query, result["answer"], body.sessionId)
+                except Exception as e:
+                    logger.error(f"Failed to store Q&A in MongoDB: {str(e)}")
+                yield sse_event("result", {"index": index, "query": query, **result})
+
+            schedule_summary_update(
+                request, {**scope, "history_settings": options["history_settings"], "session_id": body.sessionId}
+            )
+            duration = (time.monotonic() - started) * 1000
+            metrics.observe("query.batch_total_ms", duration)
+            yield sse_event("summary", {"queries": len(body.queries), "duration_ms": round(duration, 1)})
+        finally:
+            # The client went away: drop the questions still in flight
+            for task in tasks:
+                task.cancel()
+            summary_task.cancel()
 
-    return {"answer": ai_answer, "tokens_submitted": tokens_submitted, "tokens_returned": tokens_returned}
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,14 @@
+# routes/scheduler.py
+
+from fastapi import APIRouter, Request
+
+router = APIRouter()
+
+@router.get("/api/scheduler")
+async def get_scheduler_stats(request: Request):
+    """
+    Report the ingestion scheduler's slots: usage, and the queue depth and
+    wait times of every project. These are the slots of this API process
+    only; workers have schedulers of their own.
+    """
+    return request.app.state.scheduler.stats()
@@ -0,0 +1,75 @@
+# routes/search.py
+
+import time
+
+from fastapi import APIRouter, Request, Body, HTTPException
+from loguru import logger
+
+from config import HYBRID_ALPHA
+from models import SearchRequest
+from utils.embedding import get_project_embedding_model
+from utils.metrics import metrics
+from utils.query_pipeline import load_query_scope, search_chunks, RETRIEVAL_MODES
+
+router = APIRouter()
+
+MAX_SEARCH_LIMIT = 100
+
+
+@router.post("/api/search")
+async def search_code(request: Request, body: SearchRequest = Body(...)):
+    """
+    Retrieval-only search: return the ranked chunks matching a query, without
+    history or completion. Vector and hybrid searches use the cached query
+    embedding; keyword and symbol searches need none.
+
+    Results are paged with 'limit' and 'skip'. Each result has the file path,
+    line range, function name and distance, and a snippet of its first
+    'snippetLines' lines when 'includeSnippet' is set.
+    """
+    started = time.monotonic()
+    if not body.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    if body.mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown search mode '{body.mode}'.")
+    if not 1 <= body.limit <= MAX_SEARCH_LIMIT or body.skip < 0:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_SEARCH_LIMIT} and skip non-negative.")
+
+    scope = await load_query_scope(request, body.project, body.filters)
+    query_emb = None
+    if body.mode in ("vector", "hybrid"):
+        try:
+            query_emb = await request.app.state.embedding_cache.get_embedding(
+                body.query, request.app.state.openai_client, get_project_embedding_model(scope["project_data"])
+            )
+        except Exception as e:
+            logger.error(f"Embedding generation failed: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to generate embedding for query.")
+
+    chunks = await search_chunks(
+        request.app.state.weaviate_async_client, scope["weaviate_class_name"], query_emb, body.limit,
+        query_text=body.query, mode=body.mode, alpha=body.alpha if body.alpha is not None else HYBRID_ALPHA,
+        filters=scope["chunk_filter"], offset=body.skip, symbols_collection=scope["symbols_collection"]
+    )
+
+    results = []
+    for chunk in chunks:
+        result = {
+            "filePath": chunk["file"],
+            "startLine": chunk["startLine"],
+            "endLine": chunk["endLine"],
+            "functionName": chunk["functionName"],
+            "distance": chunk["distance"],
+        }
+        if body.includeSnippet:
+            result["snippet"] = "\n".join(chunk["content"].split("\n")[:body.snippetLines])
+        results.append(result)
+
+    metrics.observe("search.total_ms", (time.monotonic() - started) * 1000)
+    return {
+        "results": results,
+        "limit": body.limit,
+        "skip": body.skip,
+        # A full page may be followed by more results
+        "nextSkip": body.skip + len(results) if len(results) == body.limit else None,
+    }
@@ -1,9 +1,9 @@
 # utils/__init__.py
 
-from .hashing import calculate_hash
+from .hashing import calculate_hash, digest_bytes, hash_chunks, compare_chunk_hashes, file_hash_matches
 from .setup_weaviate_schema import setup_weaviate_schema
-from .chunking import chunk_file, looks_like_binary
-from .embedding import get_embedding
+from .chunking import chunk_file, read_file_bytes, looks_like_binary
+from .embedding import get_embedding, get_embeddings
 from .sanitizer import sanitize_keys
 from .summarizer import summarize_interactions
 from .filtering import get_filtered_file_paths
@@ -13,10 +13,16 @@ from .collection_names import get_mongo_chunk_hashes_collection_name, get_mongo_
 
 __all__ = [
     'calculate_hash',
+    'digest_bytes',
+    'hash_chunks',
+    'compare_chunk_hashes',
+    'file_hash_matches',
     'chunk_file',
+    'read_file_bytes',
     'setup_weaviate_schema',
     'looks_like_binary',
     'get_embedding',
+    'get_embeddings',
     'sanitize_keys',
     'summarize_interactions',
     'get_filtered_file_paths',  # Exposed the filtering function
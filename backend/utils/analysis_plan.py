@@ -0,0 +1,126 @@
+# utils/analysis_plan.py
+
+import os
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from tiktoken import encoding_for_model, get_encoding
+
+from config import (
+    EMBEDDING_MODEL,
+    ANALYZE_THROUGHPUT_WINDOW,
+    DEFAULT_EMBEDDED_CHUNKS_PER_SECOND,
+)
+from utils.chunking import chunk_file, read_file_bytes, looks_like_binary
+from utils.hashing import digest_bytes, hash_chunks, compare_chunk_hashes, file_hash_matches
+
+
+def get_embedding_encoder(model: str = EMBEDDING_MODEL):
+    """Return the tiktoken encoder used to count tokens for an embedding model."""
+    try:
+        return encoding_for_model(model)
+    except KeyError:
+        logger.warning(f"No tiktoken encoding registered for '{model}'. Falling back to cl100k_base.")
+        return get_encoding("cl100k_base")
+
+
+async def load_stored_hashes(hashes_collection) -> Dict[str, List[Dict[str, Any]]]:
+    """Load every stored chunk hash document of a project, grouped by file path."""
+    stored: Dict[str, List[Dict[str, Any]]] = {}
+    cursor = hashes_collection.find({}, {"_id": 0, "filePath": 1, "hash": 1, "fileHash": 1})
+    async for doc in cursor:
+        stored.setdefault(doc["filePath"], []).append(doc)
+    return stored
+
+
+def plan_file_changes(file_paths: List[str], stored_hashes: Dict[str, List[Dict[str, Any]]], encoder) -> Dict[str, Any]:
+    """
+    Compare the files on disk against the stored chunk hashes, using the same
+    rules as /api/analyze: files whose raw bytes match the stored file digest
+    are unchanged, otherwise the chunk digests are compared, and a changed
+    file is re-embedded entirely.
+
+    Args:
+        file_paths: Paths returned by the walker.
+        stored_hashes: Stored chunk hash documents grouped by file path.
+        encoder: tiktoken encoder used to count the tokens to embed.
+
+    Returns:
+        A dict with the file and chunk change sets and the number of tokens to embed.
+    """
+    files = {"new": [], "changed": [], "unchanged": [], "deleted": [], "ignored": []}
+    chunks = {"new": 0, "changed": 0, "unchanged": 0, "deleted": 0}
+    tokens_to_embed = 0
+
+    for fp in file_paths:
+        _, ext = os.path.splitext(fp)
+        if looks_like_binary(ext):
+            files["ignored"].append(fp)
+            continue
+
+        raw = read_file_bytes(fp)
+        if raw is None:
+            files["ignored"].append(fp)
+            continue
+
+        existing = stored_hashes.get(fp)
+        if existing and file_hash_matches(digest_bytes(raw), existing):
+            files["unchanged"].append(fp)
+            chunks["unchanged"] += len(existing)
+            continue
+
+        hashed = hash_chunks(chunk_file(fp, raw))
+        if not hashed:
+            files["ignored"].append(fp)
+            continue
+
+        if existing is None:
+            files["new"].append(fp)
+            chunks["new"] += len(hashed)
+        else:
+            changed, _ = compare_chunk_hashes(hashed, existing)
+            if not changed:
+                files["unchanged"].append(fp)
+                chunks["unchanged"] += len(hashed)
+                continue
+            files["changed"].append(fp)
+            chunks["changed"] += len(hashed)
+            chunks["deleted"] += len({doc["hash"] for doc in existing} - {ch["hash"] for ch in hashed})
+
+        tokens_to_embed += sum(len(encoder.encode(ch["text"])) for ch in hashed)
+
+    seen = set(file_paths)
+    for fp, existing in stored_hashes.items():
+        if fp not in seen:
+            files["deleted"].append(fp)
+            chunks["deleted"] += len(existing)
+
+    return {"files": files, "chunks": chunks, "tokens_to_embed": tokens_to_embed}
+
+
+async def get_recent_throughput(runs_collection, window: int = ANALYZE_THROUGHPUT_WINDOW) -> Optional[float]:
+    """
+    Compute the embedded chunks per second over the last `window` analyze runs.
+
+    Returns:
+        The measured throughput, or None when no run embedded anything yet.
+    """
+    runs = await runs_collection.find(
+        {"chunks_embedded": {"$gt": 0}},
+        {"_id": 0, "chunks_embedded": 1, "duration_seconds": 1}
+    ).sort("timestamp", -1).limit(window).to_list(length=window)
+
+    total_chunks = sum(run["chunks_embedded"] for run in runs)
+    total_seconds = sum(run["duration_seconds"] for run in runs)
+    if not total_chunks or total_seconds <= 0:
+        return None
+    return total_chunks / total_seconds
+
+
+def estimate_duration(chunks_to_embed: int, throughput: Optional[float]) -> float:
+    """
+    Estimate the analyze duration in seconds. Analyze embeds one chunk per
+    request, so the round-trip count drives the duration rather than the token count.
+    """
+    rate = throughput or DEFAULT_EMBEDDED_CHUNKS_PER_SECOND
+    return round(chunks_to_embed / rate, 1)
@@ -0,0 +1,106 @@
+# utils/answer_cache.py
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import ANSWER_CACHE_MAX_DISTANCE, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS
+from utils.index_version import get_index_version
+from utils.metrics import metrics
+
+
+class _ProjectAnswers:
+    __slots__ = ("index_version", "vectors", "answers", "created")
+
+    def __init__(self, index_version):
+        self.index_version = index_version
+        self.vectors: Optional[np.ndarray] = None
+        self.answers: List[str] = []
+        self.created: List[float] = []
+
+
+class AnswerCache:
+    """
+    Semantic cache of answers, keyed on the query embedding.
+
+    A query is answered from the cache when the cosine distance between its
+    embedding and a cached query's is within the configured distance, for the
+    same project, index version and scope (the query filters). Entries of a
+    project are dropped as soon as its index version changes.
+    """
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._projects: Dict[Tuple[str, str], _ProjectAnswers] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _entries(self, project_data: dict, scope: str) -> _ProjectAnswers:
+        key = (project_data["normalized_name"], scope)
+        index_version = get_index_version(project_data)
+        entries = self._projects.get(key)
+        if entries is None or entries.index_version != index_version:
+            entries = self._projects[key] = _ProjectAnswers(index_version)
+        return entries
+
+    def _expire(self, entries: _ProjectAnswers) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = sum(1 for created in entries.created if created < cutoff)
+        if expired:
+            entries.vectors = entries.vectors[expired:] if expired < len(entries.answers) else None
+            del entries.answers[:expired]
+            del entries.created[:expired]
+
+    def lookup(self, project_data: dict, query_emb: List[float],
+               max_distance: float = ANSWER_CACHE_MAX_DISTANCE, scope: str = "") -> Optional[str]:
+        """Return the cached answer of the closest query within `max_distance`, if any."""
+        entries = self._entries(project_data, scope)
+        self._expire(entries)
+
+        answer = None
+        if entries.vectors is not None:
+            query = np.asarray(query_emb, dtype=np.float32)
+            query /= np.linalg.norm(query)
+            distances = 1.0 - entries.vectors @ query
+            best = int(np.argmin(distances))
+            if distances[best] <= max_distance:
+                answer = entries.answers[best]
+
+        if answer is None:
+            self.misses += 1
+            metrics.increment("answer_cache.misses")
+        else:
+            self.hits += 1
+            metrics.increment("answer_cache.hits")
+        return answer
+
+    def store(self, project_data: dict, query_emb: List[float], answer: str, scope: str = "") -> None:
+        """Cache the answer to a query, evicting the project's oldest entry when full."""
+        entries = self._entries(project_data, scope)
+        vector = np.asarray(query_emb, dtype=np.float32)
+        vector = (vector / np.linalg.norm(vector))[np.newaxis, :]
+
+        overflow = len(entries.answers) - self.max_size + 1
+        if overflow > 0:
+            entries.vectors = entries.vectors[overflow:]
+            del entries.answers[:overflow]
+            del entries.created[:overflow]
+        entries.vectors = vector if entries.vectors is None else np.vstack([entries.vectors, vector])
+        entries.answers.append(answer)
+        entries.created.append(time.monotonic())
+
+    def invalidate(self, project: str) -> None:
+        for key in [key for key in self._projects if key[0] == project]:
+            del self._projects[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(len(entries.answers) for entries in self._projects.values()),
+            "max_size_per_project": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -186,17 +186,34 @@ def chunk_by_lines(lines: List[str], max_lines: int, language_label: str, file_p
 
     return chunks
 
-def chunk_file(file_path: str) -> List[Dict[str, Any]]:
+def read_file_bytes(file_path: str) -> Optional[bytes]:
+    try:
+        with open(file_path, "rb") as f:
+            return f.read()
+    except Exception as e:
+        logger.error(f"Error reading {file_path}: {e}")
+        return None
+
+def chunk_file(file_path: str, raw: Optional[bytes] = None) -> List[Dict[str, Any]]:
+    """
+    Chunk a file. `raw` can be passed when the caller already read the file's
+    bytes (e.g. to digest them), so the file is read once and only decoded here.
+    """
     _, ext = os.path.splitext(file_path)
 
     if looks_like_binary(ext):
         logger.info(f"Skipping binary file: {file_path}")
         return []
 
+    if raw is None:
+        raw = read_file_bytes(file_path)
+        if raw is None:
+            return []
+
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-    except Exception as e:
+        # Universal newlines, as when the file is opened in text mode
+        content = raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    except UnicodeDecodeError as e:
         logger.error(f"Error reading {file_path}: {e}")
         return []
 
@@ -13,8 +13,27 @@ def get_mongo_answers_collection_name(project: str) -> str:
     normalized_name = normalize_project_name(project)
     return f"project_{normalized_name}_answers"
 
+def get_mongo_symbols_collection_name(project: str) -> str:
+    """Generate the MongoDB symbol index collection name for a project."""
+    normalized_name = normalize_project_name(project)
+    return f"project_{normalized_name}_symbols"
+
 def get_weaviate_class_name(project: str) -> str:
     """Generate the Weaviate class name for a project."""
     normalized_name = normalize_project_name(project)
     return f"{CLASS_NAME}_{normalized_name}"
 
+
+def get_model_weaviate_class_name(project: str, model: str) -> str:
+    """Generate the Weaviate class name holding a project's chunks embedded with `model`."""
+    normalized_name = normalize_project_name(project)
+    return f"{CLASS_NAME}_{normalized_name}_{normalize_project_name(model)}"
+
+def get_active_weaviate_class_name(project_data: dict) -> str:
+    """Weaviate class currently serving a project, as recorded on the project."""
+    return project_data.get("collectionName") or get_weaviate_class_name(project_data["normalized_name"])
+
+
+def get_file_weaviate_class_name(class_name: str) -> str:
+    """Weaviate class holding one vector per file for the chunk class `class_name`."""
+    return f"{class_name}_Files"
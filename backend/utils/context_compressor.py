@@ -0,0 +1,259 @@
+# utils/context_compressor.py
+
+import ast
+import io
+import os
+import re
+import textwrap
+import tokenize
+from typing import List, Optional, Set, Tuple
+
+# Cumulative: each level also applies the ones before it
+COMPRESSION_LEVELS = ("none", "whitespace", "comments", "signatures")
+
+_LANGUAGES = {
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".mjs": "javascript",
+    ".cjs": "javascript",
+    ".ts": "javascript",
+    ".md": "markdown",
+}
+
+# Characters after which a '/' starts a regular expression literal rather than a division
+_JS_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_JS_SIGNATURE = re.compile(
+    r"^\s*(export\s+)?(default\s+)?(async\s+)?"
+    r"(function\b|class\b"
+    r"|(const|let|var)\s+[\w$]+\s*=\s*(async\s+)?(function\b|\([^)]*\)\s*=>|[\w$]+\s*=>)"
+    r"|(?!(if|for|while|switch|catch|with|return|else)\b)(static\s+|async\s+|get\s+|set\s+)*[\w$]+\s*\([^)]*\)\s*\{)"
+)
+_PYTHON_SIGNATURE = re.compile(r"^\s*(async\s+def|def)\b")
+_MARKDOWN_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+
+
+def get_language(file_path: str) -> Optional[str]:
+    """The language a file is compressed as, from its extension."""
+    return _LANGUAGES.get(os.path.splitext(file_path)[1].lower())
+
+
+def normalize_whitespace(content: str) -> str:
+    """Strip trailing whitespace and common indentation, and collapse runs of blank lines."""
+    lines = [line.rstrip() for line in content.expandtabs(4).split("\n")]
+    text = textwrap.dedent("\n".join(lines))
+    return re.sub(r"\n{3,}", "\n\n", text).strip("\n")
+
+
+def _remove_spans(content: str, spans: List[Tuple[int, int]]) -> str:
+    """
+    Blank out character spans, keeping line breaks, then drop the lines that
+    only held removed text.
+    """
+    if not spans:
+        return content
+    chars = list(content)
+    for start, end in spans:
+        for i in range(start, end):
+            if chars[i] != "\n":
+                chars[i] = " "
+    kept = [
+        line for line, original in zip("".join(chars).split("\n"), content.split("\n"))
+        if line.strip() or not original.strip()
+    ]
+    return "\n".join(kept)
+
+
+def _python_comment_spans(content: str) -> List[Tuple[int, int]]:
+    """Comments and standalone string statements (docstrings) of Python code."""
+    line_offsets = [0]
+    for line in content.split("\n"):
+        line_offsets.append(line_offsets[-1] + len(line) + 1)
+
+    def offset(position):
+        return line_offsets[position[0] - 1] + position[1]
+
+    spans = []
+    statement_start = True
+    pending = None
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(content).readline):
+            if pending is not None:
+                if tok.type in (tokenize.NEWLINE, tokenize.COMMENT, tokenize.ENDMARKER):
+                    spans.append(pending)
+                pending = None
+            if tok.type == tokenize.COMMENT:
+                spans.append((offset(tok.start), offset(tok.end)))
+            elif tok.type == tokenize.STRING and statement_start:
+                pending = (offset(tok.start), offset(tok.end))
+                statement_start = False
+            elif tok.type in (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT):
+                statement_start = True
+            elif tok.type != tokenize.NL:
+                statement_start = False
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # Chunks may end inside a statement or string: keep what was found before
+        pass
+    return spans
+
+
+def _skip_js_literal(content: str, i: int, quote: str, multiline: bool = False) -> int:
+    """Index after the literal opened at `i` by `quote`."""
+    i += 1
+    while i < len(content):
+        c = content[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == quote:
+            return i + 1
+        if c == "\n" and not multiline:
+            return i
+        i += 1
+    return i
+
+
+def _js_comment_spans(content: str) -> List[Tuple[int, int]]:
+    """Comments of JavaScript code, found by scanning past string, template and regex literals."""
+    spans = []
+    previous = ""
+    i = 0
+    while i < len(content):
+        c = content[i]
+        following = content[i + 1] if i + 1 < len(content) else ""
+        if c in "\"'":
+            i = _skip_js_literal(content, i, c)
+        elif c == "`":
+            i = _skip_js_literal(content, i, c, multiline=True)
+        elif c == "/" and following == "/":
+            end = content.find("\n", i)
+            end = len(content) if end == -1 else end
+            spans.append((i, end))
+            i = end
+            continue
+        elif c == "/" and following == "*":
+            end = content.find("*/", i + 2)
+            end = len(content) if end == -1 else end + 2
+            spans.append((i, end))
+            i = end
+            continue
+        elif c == "/" and (not previous or previous in _JS_REGEX_PRECEDERS):
+            i = _skip_js_literal(content, i, "/")
+        else:
+            if not c.isspace():
+                previous = c
+            i += 1
+            continue
+        previous = c
+    return spans
+
+
+def strip_comments(content: str, language: Optional[str]) -> str:
+    """Remove comments, and docstrings for Python, from code of a known language."""
+    if language == "python":
+        return _remove_spans(content, _python_comment_spans(content))
+    if language == "javascript":
+        return _remove_spans(content, _js_comment_spans(content))
+    if language == "markdown":
+        return _remove_spans(content, [m.span() for m in _MARKDOWN_COMMENT.finditer(content)])
+    return content
+
+
+def _elide(lines: List[str], dropped: Set[int]) -> str:
+    """Replace each run of dropped lines with '...' at the indentation of its first line."""
+    out = []
+    for i, line in enumerate(lines):
+        if i not in dropped:
+            out.append(line)
+        elif i - 1 not in dropped:
+            out.append(line[:len(line) - len(line.lstrip())] + "...")
+    return "\n".join(out)
+
+
+def _python_body_lines(content: str, lines: List[str]) -> Set[int]:
+    """0-based indexes of the lines of Python function bodies."""
+    dropped = set()
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        tree = None
+
+    if tree is not None:
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                # One-line functions keep their line: the body follows the signature
+                dropped.update(range(max(node.body[0].lineno - 1, node.lineno), node.end_lineno))
+        return dropped
+
+    # Partial chunks do not parse: a body is what is indented below its signature
+    i = 0
+    while i < len(lines):
+        if not _PYTHON_SIGNATURE.match(lines[i]):
+            i += 1
+            continue
+        indent = len(lines[i]) - len(lines[i].lstrip())
+        while i < len(lines) and not lines[i].rstrip().endswith(":"):
+            i += 1
+        i += 1
+        while i < len(lines) and (not lines[i].strip() or len(lines[i]) - len(lines[i].lstrip()) > indent):
+            dropped.add(i)
+            i += 1
+    return dropped
+
+
+def _markdown_body_lines(lines: List[str]) -> Set[int]:
+    """0-based indexes of the Markdown lines that are not headings."""
+    dropped = set()
+    in_fence = False
+    for i, line in enumerate(lines):
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        if in_fence or not line.startswith("#"):
+            dropped.add(i)
+    return dropped
+
+
+def to_signatures(content: str, language: Optional[str]) -> str:
+    """
+    Keep the declarations of code and elide function bodies; for Markdown,
+    keep the headings. Content of other languages, or without any
+    declaration, is returned unchanged.
+    """
+    lines = content.split("\n")
+    if language == "python":
+        dropped = _python_body_lines(content, lines)
+    elif language == "javascript":
+        dropped = {i for i, line in enumerate(lines) if not _JS_SIGNATURE.match(line)}
+    elif language == "markdown":
+        dropped = _markdown_body_lines(lines)
+    else:
+        return content
+    if not dropped or len(dropped) == len(lines):
+        return content
+    return _elide(lines, dropped)
+
+
+def compress_content(content: str, file_path: str, level: str, signatures_only: bool = True) -> str:
+    """
+    Compress chunk content for the prompt.
+
+    Args:
+        content: The content of the chunk.
+        file_path: Its file, which determines the language.
+        level: One of COMPRESSION_LEVELS.
+        signatures_only: At the 'signatures' level, whether to elide function
+            bodies; well-ranked chunks keep them and only lose their comments.
+
+    Returns:
+        The compressed content.
+    """
+    if level == "none":
+        return content
+    language = get_language(file_path)
+    # Dedented first, so that chunks cut from nested code tokenize
+    content = normalize_whitespace(content)
+    if level in ("comments", "signatures"):
+        content = normalize_whitespace(strip_comments(content, language))
+    if level == "signatures" and signatures_only:
+        content = to_signatures(content, language)
+    return content
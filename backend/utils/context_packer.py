@@ -0,0 +1,150 @@
+# utils/context_packer.py
+
+from typing import Any, Dict, List, Optional
+
+from config import (
+    COMPLETION_MODEL,
+    COMPLETION_MAX_TOKENS,
+    COMPLETION_CONTEXT_WINDOWS,
+    CONTEXT_FULL_BLOCKS,
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    PROMPT_RESERVED_TOKENS,
+)
+from utils.context_compressor import compress_content
+from utils.tokens import estimate_token_count
+
+
+def get_context_budget(requested: Optional[int] = None, model: str = COMPLETION_MODEL) -> int:
+    """
+    Token budget for the retrieved context: the requested budget (or the
+    default), capped by what the model's context window leaves once the
+    answer and the rest of the prompt are reserved.
+    """
+    window = COMPLETION_CONTEXT_WINDOWS.get(model, 8192)
+    available = max(0, window - COMPLETION_MAX_TOKENS - PROMPT_RESERVED_TOKENS)
+    return min(requested or DEFAULT_CONTEXT_TOKEN_BUDGET, available)
+
+
+def _format_block(block: Dict[str, Any]) -> str:
+    return f"File: {block['file']}\nLines: {block['startLine']}-{block['endLine']}\nContent:\n{block['content']}"
+
+
+def _line_map(block: Dict[str, Any]) -> Optional[Dict[int, str]]:
+    lines = block["content"].split("\n")
+    if len(lines) != block["endLine"] - block["startLine"] + 1:
+        # Line range and content disagree; the block cannot be overlaid safely
+        return None
+    return {block["startLine"] + i: line for i, line in enumerate(lines)}
+
+
+def _merge(current: Dict[str, Any], following: Dict[str, Any]) -> bool:
+    """Merge `following` into `current` when their line ranges touch or overlap."""
+    if following["startLine"] > current["endLine"] + 1:
+        return False
+
+    if following["startLine"] == current["endLine"] + 1:
+        current["content"] += "\n" + following["content"]
+        current["tokens"] += following["tokens"]
+    elif following["endLine"] <= current["endLine"]:
+        # Contained: nothing new to add
+        pass
+    else:
+        current_lines, following_lines = _line_map(current), _line_map(following)
+        if current_lines is None or following_lines is None:
+            return False
+        new_lines = following["endLine"] - current["endLine"]
+        total_lines = following["endLine"] - following["startLine"] + 1
+        current_lines.update(following_lines)
+        current["content"] = "\n".join(current_lines[i] for i in range(current["startLine"], following["endLine"] + 1))
+        current["tokens"] += round(following["tokens"] * new_lines / total_lines)
+
+    current["endLine"] = max(current["endLine"], following["endLine"])
+    current["distance"] = min(current["distance"], following["distance"])
+    return True
+
+
+def merge_chunks(retrieved_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Drop chunks whose content duplicates a better-ranked chunk, then merge
+    contiguous or overlapping line ranges of the same file into single blocks
+    that keep the best distance of their members.
+    """
+    seen = set()
+    by_file: Dict[str, List[Dict[str, Any]]] = {}
+    for chunk in retrieved_chunks:
+        if chunk["content"] in seen:
+            continue
+        seen.add(chunk["content"])
+        by_file.setdefault(chunk["file"], []).append({
+            "file": chunk["file"],
+            "startLine": chunk["startLine"],
+            "endLine": chunk["endLine"],
+            "content": chunk["content"],
+            "tokens": chunk["tokens"],
+            "distance": chunk["distance"],
+        })
+
+    blocks = []
+    for chunks in by_file.values():
+        chunks.sort(key=lambda ch: (ch["startLine"], ch["endLine"]))
+        current = chunks[0]
+        for following in chunks[1:]:
+            if not _merge(current, following):
+                blocks.append(current)
+                current = following
+        blocks.append(current)
+    return blocks
+
+
+def compress_blocks(blocks: List[Dict[str, Any]], level: str, full_blocks: int = CONTEXT_FULL_BLOCKS) -> None:
+    """
+    Compress the content of merged blocks in place. At the 'signatures' level,
+    only the `full_blocks` best-ranked blocks keep their function bodies.
+    Token counts are scaled by the share of characters kept, and the tokens
+    removed are recorded in block['tokensSaved'].
+    """
+    ranked = sorted(blocks, key=lambda b: b["distance"] if b["distance"] is not None else 1.0)
+    for rank, block in enumerate(ranked):
+        compressed = compress_content(block["content"], block["file"], level, signatures_only=rank >= full_blocks)
+        tokens = round(block["tokens"] * len(compressed) / len(block["content"])) if block["content"] else 0
+        block["tokensSaved"] = block["tokens"] - tokens
+        block["content"] = compressed
+        block["tokens"] = tokens
+
+
+def pack_context(retrieved_chunks: List[Dict[str, Any]], budget: int, compression: str = "none") -> Dict[str, Any]:
+    """
+    Fill the token budget greedily by relevance per token: merged blocks are
+    taken in order of (1 - distance) / tokens, skipping those that no longer
+    fit, and the selected blocks are returned in order of relevance.
+
+    Blocks are compressed at the `compression` level before they are
+    measured, so that more of them fit.
+
+    Returns:
+        A dict with the formatted context 'blocks', their 'tokens' and the
+        'tokens_saved' by compressing them.
+    """
+    blocks = merge_chunks(retrieved_chunks)
+    if compression != "none":
+        compress_blocks(blocks, compression)
+
+    candidates = []
+    for block in blocks:
+        formatted = _format_block(block)
+        # Stored counts cover the content; estimate the header
+        tokens = block["tokens"] + estimate_token_count(formatted[:len(formatted) - len(block["content"])])
+        relevance = max(1.0 - (block["distance"] if block["distance"] is not None else 1.0), 0.0)
+        candidates.append((relevance / max(tokens, 1), block["distance"], tokens, formatted, block.get("tokensSaved", 0)))
+
+    selected = []
+    used = 0
+    saved = 0
+    for _, distance, tokens, formatted, tokens_saved in sorted(candidates, key=lambda c: c[0], reverse=True):
+        if used + tokens <= budget:
+            selected.append((distance, formatted))
+            used += tokens
+            saved += tokens_saved
+
+    selected.sort(key=lambda s: s[0] if s[0] is not None else 1.0)
+    return {"blocks": [formatted for _, formatted in selected], "tokens": used, "tokens_saved": saved}
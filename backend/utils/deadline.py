@@ -0,0 +1,54 @@
+# utils/deadline.py
+
+import asyncio
+import time
+from typing import Any, Awaitable, List, Optional
+
+from loguru import logger
+
+from utils.metrics import metrics
+
+
+class Deadline:
+    """
+    The time left to a request, shared by each stage of its pipeline.
+
+    A stage runs within its own budget, cut short by whatever remains of the
+    request's deadline. Stages that were skipped or cut down to meet the
+    deadline are recorded in `degraded`, in the order they happened.
+    """
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+        self.degraded: List[str] = []
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def budget(self, stage_seconds: Optional[float] = None) -> float:
+        """The time a stage may take: its own budget, within the time remaining."""
+        remaining = self.remaining()
+        return remaining if stage_seconds is None else min(stage_seconds, remaining)
+
+    def stage(self, stage_seconds: float) -> "Deadline":
+        """A deadline for a stage made of several steps, sharing the degraded stages."""
+        child = Deadline(self.budget(stage_seconds))
+        child.degraded = self.degraded
+        return child
+
+    async def run(self, awaitable: Awaitable[Any], stage_seconds: Optional[float] = None) -> Any:
+        """
+        Await `awaitable` within the stage's budget.
+
+        Raises:
+            asyncio.TimeoutError: When the budget runs out; the awaitable is cancelled.
+        """
+        return await asyncio.wait_for(awaitable, self.budget(stage_seconds))
+
+    def degrade(self, stage: str) -> None:
+        """Record that `stage` was skipped or reduced to meet the deadline."""
+        if stage not in self.degraded:
+            self.degraded.append(stage)
+            metrics.increment(f"query.degraded.{stage}")
+            logger.warning(f"Query degraded to meet its deadline: {stage}.")
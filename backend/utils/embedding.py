@@ -1,16 +1,17 @@
 # utils/embedding.py
 
-from typing import List
+from typing import List, Tuple
 from fastapi import HTTPException
 from loguru import logger
-from openai import OpenAI
+from openai import AsyncOpenAI
 
+from config import EMBEDDING_MODEL, EMBEDDING_COST_PER_1K_TOKENS, EMBEDDING_MODEL_COSTS_PER_1K_TOKENS
 
-def get_embedding(text: str) -> List[float]:
+
+async def get_embedding(text: str, openai_client: AsyncOpenAI, model: str = EMBEDDING_MODEL) -> List[float]:
     try:
-        openai_client = OpenAI()
-        response = openai_client.embeddings.create(
-            model="text-embedding-ada-002",
+        response = await openai_client.embeddings.create(
+            model=model,
             input=text
         )
         embedding = response.data[0].embedding
@@ -20,3 +21,34 @@ def get_embedding(text: str) -> List[float]:
         logger.error(f"Error generating embedding: {e}")
         raise HTTPException(status_code=500, detail="Embedding generation failed.")
 
+
+async def get_embeddings(texts: List[str], openai_client: AsyncOpenAI,
+                         model: str = EMBEDDING_MODEL) -> Tuple[List[List[float]], int]:
+    """
+    Embed several texts in a single request.
+
+    Returns:
+        The embeddings in input order and the number of tokens billed.
+    """
+    try:
+        response = await openai_client.embeddings.create(
+            model=model,
+            input=texts
+        )
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        logger.debug(f"Generated {len(embeddings)} embeddings with '{model}'.")
+        return embeddings, response.usage.total_tokens
+    except Exception as e:
+        logger.error(f"Error generating embeddings: {e}")
+        raise HTTPException(status_code=500, detail="Embedding generation failed.")
+
+
+def get_project_embedding_model(project_data: dict) -> str:
+    """Embedding model of a project's active collection."""
+    return project_data.get("embeddingModel") or EMBEDDING_MODEL
+
+
+def estimate_embedding_cost(tokens: int, model: str = EMBEDDING_MODEL) -> float:
+    """Estimate the cost in USD of embedding a number of tokens with `model`."""
+    price = EMBEDDING_MODEL_COSTS_PER_1K_TOKENS.get(model, EMBEDDING_COST_PER_1K_TOKENS)
+    return round(tokens / 1000 * price, 6)
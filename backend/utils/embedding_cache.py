@@ -0,0 +1,179 @@
+# utils/embedding_cache.py
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from openai import AsyncOpenAI
+
+from config import QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL_SECONDS, QUERY_EMBEDDING_CACHE_PERSIST
+from utils.embedding import get_embedding, get_embeddings
+from utils.metrics import metrics
+
+QUERY_EMBEDDINGS_COLLECTION = "query_embeddings"
+
+
+def normalize_query(query: str) -> str:
+    """Fold case and collapse whitespace so trivially different queries share a key."""
+    return " ".join(query.split()).casefold()
+
+
+class QueryEmbeddingCache:
+    """
+    LRU cache of query embeddings keyed on the normalized query and the model,
+    with entries expiring after a TTL. Only the key is normalized: the query
+    is embedded as written, since case matters for identifiers and error
+    messages.
+
+    When a Mongo collection is given, misses fall back to it and new
+    embeddings are written to it, so the cache survives restarts and is
+    shared by every API process.
+    """
+
+    def __init__(self, max_size: int = QUERY_EMBEDDING_CACHE_SIZE,
+                 ttl_seconds: float = QUERY_EMBEDDING_CACHE_TTL_SECONDS, store=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def _get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, embedding = entry
+        if time.monotonic() - created > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return embedding
+
+    def _put(self, key: Tuple[str, str], embedding: List[float]) -> None:
+        self._entries[key] = (time.monotonic(), embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_embedding(self, query: str, openai_client: AsyncOpenAI, model: str) -> List[float]:
+        """Return the embedding of a query, from the cache when possible."""
+        normalized = normalize_query(query)
+        key = (model, normalized)
+
+        embedding = self._get(key)
+        if embedding is not None:
+            self.hits += 1
+            metrics.increment("query_embedding_cache.hits")
+            return embedding
+
+        if self.store is not None:
+            try:
+                doc = await self.store.find_one({"model": model, "query": normalized}, {"embedding": 1})
+            except Exception as e:
+                logger.warning(f"Query embedding store lookup failed: {e}")
+                doc = None
+            if doc:
+                self.store_hits += 1
+                metrics.increment("query_embedding_cache.store_hits")
+                self._put(key, doc["embedding"])
+                return doc["embedding"]
+
+        self.misses += 1
+        metrics.increment("query_embedding_cache.misses")
+        embedding = await get_embedding(query, openai_client, model)
+        self._put(key, embedding)
+
+        if self.store is not None:
+            try:
+                await self.store.update_one(
+                    {"model": model, "query": normalized},
+                    {"$set": {"embedding": embedding, "createdAt": datetime.utcnow()}},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"Failed to persist query embedding: {e}")
+        return embedding
+
+    async def get_embeddings(self, queries: List[str], openai_client: AsyncOpenAI, model: str) -> List[List[float]]:
+        """
+        Return the embeddings of several queries, in input order. The queries
+        missing from the cache are embedded together in a single request.
+        """
+        embeddings: Dict[str, List[float]] = {}
+        missing: List[str] = []
+        # The first spelling of each normalized query is the one embedded
+        originals: Dict[str, str] = {}
+        for query in queries:
+            normalized = normalize_query(query)
+            if normalized in embeddings or normalized in missing:
+                continue
+            embedding = self._get((model, normalized))
+            if embedding is None:
+                missing.append(normalized)
+                originals[normalized] = query
+            else:
+                embeddings[normalized] = embedding
+        self.hits += len(embeddings)
+        metrics.increment("query_embedding_cache.hits", len(embeddings))
+
+        if missing and self.store is not None:
+            try:
+                async for doc in self.store.find({"model": model, "query": {"$in": missing}}, {"query": 1, "embedding": 1}):
+                    embeddings[doc["query"]] = doc["embedding"]
+                    self._put((model, doc["query"]), doc["embedding"])
+                    self.store_hits += 1
+                    metrics.increment("query_embedding_cache.store_hits")
+            except Exception as e:
+                logger.warning(f"Query embedding store lookup failed: {e}")
+            missing = [query for query in missing if query not in embeddings]
+
+        if missing:
+            self.misses += len(missing)
+            metrics.increment("query_embedding_cache.misses", len(missing))
+            new_embeddings, _ = await get_embeddings([originals[query] for query in missing], openai_client, model)
+            for normalized, embedding in zip(missing, new_embeddings):
+                embeddings[normalized] = embedding
+                self._put((model, normalized), embedding)
+            if self.store is not None:
+                try:
+                    now = datetime.utcnow()
+                    for normalized, embedding in zip(missing, new_embeddings):
+                        await self.store.update_one(
+                            {"model": model, "query": normalized},
+                            {"$set": {"embedding": embedding, "createdAt": now}},
+                            upsert=True
+                        )
+                except Exception as e:
+                    logger.warning(f"Failed to persist query embeddings: {e}")
+
+        return [embeddings[normalize_query(query)] for query in queries]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.store_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "persistent": self.store is not None,
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.store_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+async def create_query_embedding_cache(db) -> QueryEmbeddingCache:
+    """Create the process's query embedding cache, backed by Mongo when persistence is enabled."""
+    store = None
+    if QUERY_EMBEDDING_CACHE_PERSIST:
+        store = db[QUERY_EMBEDDINGS_COLLECTION]
+        await store.create_index([("model", 1), ("query", 1)], unique=True, name="unique_model_query")
+        # Mongo drops persisted entries after the same TTL as the in-process cache
+        await store.create_index(
+            [("createdAt", 1)], expireAfterSeconds=int(QUERY_EMBEDDING_CACHE_TTL_SECONDS), name="query_embeddings_ttl"
+        )
+    return QueryEmbeddingCache(store=store)
@@ -0,0 +1,223 @@
+# utils/embedding_migration.py
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from openai import AsyncOpenAI
+from weaviate.classes.data import DataObject
+
+from config import MIGRATION_CHUNKS_PER_SECOND, MIGRATION_BATCH_SIZE
+from utils.collection_names import get_active_weaviate_class_name, get_model_weaviate_class_name
+from utils.embedding import get_embeddings, get_project_embedding_model, estimate_embedding_cost
+from utils.file_index import delete_file_index, rebuild_file_index
+from utils.collection_names import get_file_weaviate_class_name
+from utils.setup_weaviate_schema import setup_weaviate_schema
+
+EMBEDDING_MIGRATIONS_COLLECTION = "embedding_migrations"
+
+
+async def get_running_migration(db, project: str) -> Optional[Dict[str, Any]]:
+    """Return the running embedding migration of a project, if any."""
+    return await db[EMBEDDING_MIGRATIONS_COLLECTION].find_one({"project": project, "status": "running"})
+
+
+async def create_migration(db, weaviate_client, project_data: dict, model: str,
+                           chunks_per_second: float = MIGRATION_CHUNKS_PER_SECOND) -> Dict[str, Any]:
+    """
+    Record a migration of a project's chunks to `model` and create its target
+    collection. The project keeps being served from its active collection.
+    """
+    project = project_data["normalized_name"]
+    source = get_active_weaviate_class_name(project_data)
+    target = get_model_weaviate_class_name(project, model)
+
+    total = weaviate_client.collections.get(source).aggregate.over_all(total_count=True).total_count
+    setup_weaviate_schema(weaviate_client, project, delete=True, class_name=target, embedding_model=model)
+
+    now = datetime.utcnow()
+    migration = {
+        "project": project,
+        "fromModel": get_project_embedding_model(project_data),
+        "toModel": model,
+        "fromCollection": source,
+        "toCollection": target,
+        "chunksPerSecond": chunks_per_second,
+        "status": "running",
+        "totalChunks": total,
+        "migratedChunks": 0,
+        "tokens": 0,
+        "costUsd": 0.0,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    result = await db[EMBEDDING_MIGRATIONS_COLLECTION].insert_one(migration)
+    migration["_id"] = result.inserted_id
+    logger.info(f"Created embedding migration {migration['_id']} for project '{project}': "
+                f"{migration['fromModel']} -> {model} ({total} chunks).")
+    return migration
+
+
+def _next_batch(iterator, size: int) -> List[Any]:
+    batch = []
+    for obj in iterator:
+        batch.append(obj)
+        if len(batch) >= size:
+            break
+    return batch
+
+
+async def run_migration(db, weaviate_client, openai_client: AsyncOpenAI, migration: Dict[str, Any]) -> None:
+    """
+    Re-embed the stored content of every chunk of the source collection into
+    the target collection at a throttled rate, then switch the project over.
+    """
+    migrations = db[EMBEDDING_MIGRATIONS_COLLECTION]
+    source = weaviate_client.collections.get(migration["fromCollection"])
+    target = weaviate_client.collections.get(migration["toCollection"])
+    model = migration["toModel"]
+    min_batch_seconds = MIGRATION_BATCH_SIZE / migration["chunksPerSecond"]
+
+    try:
+        iterator = source.iterator()
+        while True:
+            started = time.monotonic()
+            objects = await asyncio.to_thread(_next_batch, iterator, MIGRATION_BATCH_SIZE)
+            if not objects:
+                break
+
+            texts = [obj.properties["content"].strip() for obj in objects]
+            embeddings, tokens = await get_embeddings(texts, openai_client, model)
+            # Keep the object ids so references to chunks stay valid after the switch
+            result = await asyncio.to_thread(target.data.insert_many, [
+                DataObject(
+                    # Chunks stored before filtered retrieval have no 'path' yet
+                    properties={**obj.properties, "path": obj.properties.get("path") or obj.properties["filePath"]},
+                    vector=embedding,
+                    uuid=obj.uuid,
+                )
+                for obj, embedding in zip(objects, embeddings)
+            ])
+            if result.errors:
+                raise RuntimeError(f"Failed to insert {len(result.errors)} migrated chunks.")
+
+            await migrations.update_one(
+                {"_id": migration["_id"], "status": "running"},
+                {
+                    "$inc": {
+                        "migratedChunks": len(objects),
+                        "tokens": tokens,
+                        "costUsd": estimate_embedding_cost(tokens, model),
+                    },
+                    "$set": {"updatedAt": datetime.utcnow()},
+                }
+            )
+
+            # Throttle to the migration's rate so queries and analyze keep their quota
+            elapsed = time.monotonic() - started
+            if elapsed < min_batch_seconds:
+                await asyncio.sleep(min_batch_seconds - elapsed)
+
+        # File vectors are means of chunk vectors: rebuild them in the new model's space
+        switch = {"embeddingModel": model, "collectionName": migration["toCollection"]}
+        if weaviate_client.collections.exists(get_file_weaviate_class_name(migration["fromCollection"])):
+            await asyncio.to_thread(rebuild_file_index, weaviate_client, migration["toCollection"])
+            switch["fileIndexCollection"] = migration["toCollection"]
+
+        # Switch the project's reads and writes to the new collection
+        await db["projects"].update_one(
+            {"normalized_name": migration["project"]},
+            {
+                "$set": switch,
+                "$inc": {"indexVersion": 1},
+            }
+        )
+        await migrations.update_one(
+            {"_id": migration["_id"]},
+            {"$set": {"status": "completed", "completedAt": datetime.utcnow(), "updatedAt": datetime.utcnow()}}
+        )
+        logger.info(f"Embedding migration {migration['_id']} completed. "
+                    f"Project '{migration['project']}' now uses '{model}'.")
+
+        if migration["fromCollection"] in weaviate_client.collections.list_all():
+            weaviate_client.collections.delete(migration["fromCollection"])
+            logger.info(f"Deleted previous Weaviate collection '{migration['fromCollection']}'.")
+        delete_file_index(weaviate_client, migration["fromCollection"])
+
+    except asyncio.CancelledError:
+        # Left 'running' on shutdown so it resumes at the next startup;
+        # cancel_migration records explicit cancellations
+        logger.warning(f"Embedding migration {migration['_id']} interrupted.")
+        raise
+    except Exception as e:
+        logger.error(f"Embedding migration {migration['_id']} failed: {e}")
+        await migrations.update_one(
+            {"_id": migration["_id"]},
+            {"$set": {"status": "failed", "error": str(e), "updatedAt": datetime.utcnow()}}
+        )
+
+
+def start_migration(app, migration: Dict[str, Any]) -> None:
+    """Run a migration as a background task of the application."""
+    task = asyncio.create_task(
+        run_migration(app.state.db, app.state.weaviate_client, app.state.openai_client, migration)
+    )
+    app.state.migration_tasks[migration["project"]] = task
+    task.add_done_callback(lambda _: app.state.migration_tasks.pop(migration["project"], None))
+
+
+async def cancel_migration(app, project: str) -> None:
+    """Cancel a project's running migration and drop its partial target collection."""
+    migration = await get_running_migration(app.state.db, project)
+
+    task = app.state.migration_tasks.get(project)
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    if migration:
+        await app.state.db[EMBEDDING_MIGRATIONS_COLLECTION].update_one(
+            {"_id": migration["_id"]},
+            {"$set": {"status": "cancelled", "updatedAt": datetime.utcnow()}}
+        )
+        if migration["toCollection"] in app.state.weaviate_client.collections.list_all():
+            app.state.weaviate_client.collections.delete(migration["toCollection"])
+        delete_file_index(app.state.weaviate_client, migration["toCollection"])
+        logger.info(f"Embedding migration {migration['_id']} of project '{project}' cancelled.")
+
+
+async def resume_migrations(app) -> None:
+    """
+    Restart the migrations left running by a previous process. Their target
+    collections are recreated, since partial batches cannot be told apart.
+    """
+    migrations = app.state.db[EMBEDDING_MIGRATIONS_COLLECTION]
+    for migration in await migrations.find({"status": "running"}).to_list(length=None):
+        logger.info(f"Restarting embedding migration {migration['_id']} for project '{migration['project']}'.")
+        setup_weaviate_schema(
+            app.state.weaviate_client, migration["project"], delete=True,
+            class_name=migration["toCollection"], embedding_model=migration["toModel"]
+        )
+        await migrations.update_one(
+            {"_id": migration["_id"]},
+            {"$set": {"migratedChunks": 0, "tokens": 0, "costUsd": 0.0, "updatedAt": datetime.utcnow()}}
+        )
+        migration.update({"migratedChunks": 0, "tokens": 0, "costUsd": 0.0})
+        start_migration(app, migration)
+
+
+def format_migration(migration: Dict[str, Any]) -> Dict[str, Any]:
+    """Format a migration record for a JSON response."""
+    formatted = {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in migration.items()
+    }
+    formatted["_id"] = str(migration["_id"])
+    total = migration.get("totalChunks") or 0
+    formatted["progress"] = round(migration.get("migratedChunks", 0) / total, 4) if total else 1.0
+    return formatted
@@ -0,0 +1,192 @@
+# utils/file_index.py
+
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+from loguru import logger
+from weaviate.classes.config import Configure, Property, DataType
+from weaviate.classes.data import DataObject
+from weaviate.classes.query import Filter
+from weaviate.util import generate_uuid5
+
+from utils.collection_names import get_file_weaviate_class_name
+from utils.setup_weaviate_schema import PATH_PROPERTY
+
+_REBUILD_BATCH_SIZE = 200
+
+
+def file_uuid(path: str) -> str:
+    """The id of a file's vector: derived from its path, so a file has one vector."""
+    return generate_uuid5(path)
+
+
+def file_vector(embeddings: List[List[float]]) -> List[float]:
+    """The vector of a file: the normalized mean of its chunk vectors."""
+    mean = np.asarray(embeddings, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return (mean / norm if norm else mean).tolist()
+
+
+def setup_file_index_schema(weaviate_client, class_name: str, delete: bool = False) -> bool:
+    """
+    Create the file-level collection paired with the chunk collection `class_name`.
+
+    Returns:
+        True when the collection was created, False when it already existed.
+    """
+    file_class_name = get_file_weaviate_class_name(class_name)
+    if weaviate_client.collections.exists(file_class_name):
+        if not delete:
+            return False
+        weaviate_client.collections.delete(file_class_name)
+    weaviate_client.collections.create(
+        name=file_class_name,
+        description=f"One vector per file of '{class_name}': the mean of its chunk vectors",
+        vectorizer_config=Configure.Vectorizer.none(),
+        properties=[
+            Property(name="filePath", data_type=DataType.TEXT),
+            PATH_PROPERTY,
+            Property(name="language", data_type=DataType.TEXT, index_filterable=True),
+            Property(name="chunkCount", data_type=DataType.INT),
+        ]
+    )
+    logger.info(f"Collection '{file_class_name}' created successfully.")
+    return True
+
+
+def delete_file_index(weaviate_client, class_name: str) -> None:
+    """Delete the file-level collection of a chunk collection, if any."""
+    file_class_name = get_file_weaviate_class_name(class_name)
+    if weaviate_client.collections.exists(file_class_name):
+        weaviate_client.collections.delete(file_class_name)
+        logger.info(f"Weaviate collection '{file_class_name}' deleted.")
+
+
+def rebuild_file_index(weaviate_client, class_name: str) -> int:
+    """
+    Recreate the file-level collection from the vectors stored in the chunk
+    collection, for collections nothing else writes to (such as the target of
+    an embedding migration).
+
+    Returns:
+        The number of files indexed.
+    """
+    setup_file_index_schema(weaviate_client, class_name, delete=True)
+    return fill_file_index(weaviate_client, class_name)
+
+
+def fill_file_index(weaviate_client, class_name: str) -> int:
+    """
+    Add the files missing from the file-level collection, from the vectors
+    stored in the chunk collection. Chunk vectors are summed per file as they
+    are read, so memory grows with the number of files rather than chunks.
+    Files that already have a vector keep it: it was written with their
+    latest chunks.
+
+    Returns:
+        The number of files added.
+    """
+    files = weaviate_client.collections.get(get_file_weaviate_class_name(class_name))
+    indexed = _indexed_paths(files)
+    sums: Dict[str, np.ndarray] = {}
+    counts: Dict[str, int] = defaultdict(int)
+    languages: Dict[str, str] = {}
+    chunks = weaviate_client.collections.get(class_name)
+    for obj in chunks.iterator(include_vector=True, return_properties=["filePath", "language"]):
+        vector = obj.vector["default"] if isinstance(obj.vector, dict) else obj.vector
+        path = obj.properties["filePath"]
+        if path in indexed:
+            continue
+        if path in sums:
+            sums[path] += np.asarray(vector, dtype=np.float32)
+        else:
+            sums[path] = np.asarray(vector, dtype=np.float32)
+        counts[path] += 1
+        languages[path] = obj.properties.get("language")
+
+    # Files written while the chunks were read have a newer vector: keep it
+    indexed = _indexed_paths(files)
+    objects = []
+    for path, total in sums.items():
+        if path in indexed:
+            continue
+        norm = np.linalg.norm(total)
+        objects.append(DataObject(
+            properties={"filePath": path, "path": path, "language": languages[path], "chunkCount": counts[path]},
+            vector=(total / norm if norm else total).tolist(),
+            uuid=file_uuid(path),
+        ))
+    for i in range(0, len(objects), _REBUILD_BATCH_SIZE):
+        result = files.data.insert_many(objects[i:i + _REBUILD_BATCH_SIZE])
+        if result.errors:
+            logger.error(f"Failed to insert {len(result.errors)} file vectors into '{files.name}'.")
+    logger.info(f"Built the file index of '{class_name}': {len(objects)} files added.")
+    return len(objects)
+
+
+def _indexed_paths(files) -> Set[str]:
+    return {obj.properties["path"] for obj in files.iterator(return_properties=["path"])}
+
+
+def _ensure_file_index_schema(weaviate_client, class_name: str) -> None:
+    try:
+        setup_file_index_schema(weaviate_client, class_name)
+    except Exception:
+        # Another process created it first
+        if not weaviate_client.collections.exists(get_file_weaviate_class_name(class_name)):
+            raise
+
+
+async def open_file_index(db, weaviate_client, project: str, class_name: str):
+    """
+    Return the file-level collection of a project's chunk collection,
+    creating it if needed. The first caller for a collection claims the build
+    on the project ('fileIndexCollection') before filling it from the stored
+    chunk vectors; every other caller only writes the files it indexes.
+    """
+    await asyncio.to_thread(_ensure_file_index_schema, weaviate_client, class_name)
+    claimed = await db["projects"].find_one_and_update(
+        {"normalized_name": project, "fileIndexCollection": {"$ne": class_name}},
+        {"$set": {"fileIndexCollection": class_name}},
+    )
+    if claimed is not None:
+        await asyncio.to_thread(fill_file_index, weaviate_client, class_name)
+    return weaviate_client.collections.get(get_file_weaviate_class_name(class_name))
+
+
+def write_file_vector(file_collection, fp: str, chunks: List[Dict[str, Any]], embeddings: List[List[float]]) -> None:
+    """Replace the vector of a file after its chunks were written."""
+    delete_file_vector(file_collection, fp)
+    if not embeddings:
+        return
+    file_collection.data.insert(
+        properties={"filePath": fp, "path": fp, "language": chunks[0]["language"], "chunkCount": len(chunks)},
+        vector=file_vector(embeddings),
+        uuid=file_uuid(fp),
+    )
+
+
+def delete_file_vector(file_collection, fp: str) -> None:
+    file_collection.data.delete_many(where=Filter.by_property(name="path").equal(fp))
+
+
+async def search_files(weaviate_async_client, class_name: str, query_emb: List[float],
+                       top_files: int) -> Optional[List[str]]:
+    """
+    First stage of two-stage retrieval: the paths of the `top_files` files
+    closest to the query.
+
+    Returns:
+        The file paths, or None when the project has no file index.
+    """
+    file_class_name = get_file_weaviate_class_name(class_name)
+    if not await weaviate_async_client.collections.exists(file_class_name):
+        return None
+    result = await weaviate_async_client.collections.get(file_class_name).query.near_vector(
+        near_vector=query_emb,
+        limit=top_files,
+        return_properties=["path"],
+    )
+    return [item.properties["path"] for item in result.objects] or None
@@ -1,8 +1,132 @@
 # utils/hashing.py
 
 import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from config import HASH_ALGORITHM
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+SUPPORTED_ALGORITHMS = ("blake2b", "xxhash", "sha256")
+
+# Digest prefix -> algorithm; unprefixed digests are the legacy SHA-256 hashes
+PREFIX_ALGORITHMS = {"blake2b": "blake2b", "xxh3_128": "xxhash", "sha256": "sha256"}
+
+
+def _resolve_algorithm(algorithm: str) -> str:
+    algorithm = algorithm.lower()
+    if algorithm not in SUPPORTED_ALGORITHMS:
+        logger.warning(f"Unknown hash algorithm '{algorithm}'. Falling back to blake2b.")
+        return "blake2b"
+    if algorithm == "xxhash" and xxhash is None:
+        logger.warning("xxhash is not installed. Falling back to blake2b.")
+        return "blake2b"
+    return algorithm
+
+
+DIGEST_ALGORITHM = _resolve_algorithm(HASH_ALGORITHM)
+
 
 def calculate_hash(content: str) -> str:
     """Calculate SHA-256 hash of a string."""
     return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
+
+def digest_bytes(data: bytes, algorithm: str = DIGEST_ALGORITHM) -> str:
+    """
+    Digest raw bytes with the configured algorithm.
+
+    Digests are prefixed with the algorithm name (e.g. 'blake2b:...') so they
+    can be told apart from the legacy unprefixed SHA-256 hashes.
+    """
+    if algorithm == "xxhash":
+        return f"xxh3_128:{xxhash.xxh3_128_hexdigest(data)}"
+    if algorithm == "blake2b":
+        return f"blake2b:{hashlib.blake2b(data, digest_size=16).hexdigest()}"
+    return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+
+def is_legacy_hash(digest: str) -> bool:
+    """Legacy hashes are unprefixed SHA-256 hex digests of the stripped chunk text."""
+    return ":" not in digest
+
+
+def digest_prefix(digest: str) -> str:
+    """The algorithm prefix of a digest, or '' for a legacy hash."""
+    return "" if is_legacy_hash(digest) else digest.split(":", 1)[0]
+
+
+def digest_text_as(text: str, prefix: str) -> Optional[str]:
+    """
+    Digest chunk text the way digests with this prefix were computed, or None
+    when their algorithm is unknown or not installed.
+    """
+    if not prefix:
+        return calculate_hash(text)
+    algorithm = PREFIX_ALGORITHMS.get(prefix)
+    if algorithm is None or (algorithm == "xxhash" and xxhash is None):
+        return None
+    return digest_bytes(text.encode("utf-8"), algorithm)
+
+
+def hash_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Strip, encode and digest every chunk once, caching the result on the chunk
+    record as 'text' and 'hash'. Empty chunks are dropped.
+    """
+    hashed = []
+    for ch in chunks:
+        text = ch["content"].strip()
+        if not text:
+            continue
+        ch["text"] = text
+        ch["hash"] = digest_bytes(text.encode("utf-8"))
+        hashed.append(ch)
+    return hashed
+
+
+def file_hash_matches(file_hash: str, stored_docs: Iterable[Dict[str, Any]]) -> bool:
+    """True when the file's stored chunk hashes were recorded for exactly these raw bytes."""
+    stored_docs = list(stored_docs)
+    return bool(stored_docs) and all(doc.get("fileHash") == file_hash for doc in stored_docs)
+
+
+def compare_chunk_hashes(chunks: List[Dict[str, Any]], stored_docs: Iterable[Dict[str, Any]]) -> Tuple[bool, Dict[str, str]]:
+    """
+    Compare hashed chunks against the stored hash documents of their file.
+
+    Stored hashes made with another algorithm (legacy SHA-256 hashes, or
+    digests from before DIGEST_ALGORITHM changed) are matched by recomputing
+    the chunk digest with that algorithm, only for the algorithms the file
+    still has hashes of. A stored hash that no longer matches any chunk also
+    marks the file changed.
+
+    Returns:
+        A (changed, upgrades) tuple, where upgrades maps each matched outdated
+        hash to the chunk's new digest.
+    """
+    stored = {doc["hash"] for doc in stored_docs}
+    current_prefix = digest_prefix(digest_bytes(b""))
+    outdated_prefixes = {digest_prefix(h) for h in stored} - {current_prefix}
+    upgrades = {}
+    matched = set()
+
+    for ch in chunks:
+        if ch["hash"] in stored:
+            matched.add(ch["hash"])
+            continue
+        for prefix in outdated_prefixes:
+            outdated_hash = digest_text_as(ch["text"], prefix)
+            if outdated_hash in stored:
+                upgrades[outdated_hash] = ch["hash"]
+                matched.add(outdated_hash)
+                break
+        else:
+            return True, {}
+
+    return matched != stored, upgrades
@@ -0,0 +1,22 @@
+# utils/index_version.py
+
+from typing import Tuple
+
+from loguru import logger
+
+
+async def bump_index_version(db, project: str) -> None:
+    """
+    Record that a project's indexed content changed, so that anything derived
+    from the previous index (such as cached answers) is no longer served.
+    """
+    await db["projects"].update_one({"normalized_name": project}, {"$inc": {"indexVersion": 1}})
+    logger.debug(f"Bumped index version of project '{project}'.")
+
+
+def get_index_version(project_data: dict) -> Tuple[str, int]:
+    """
+    Identify the index a project is served from. The project id is part of it
+    so a deleted and recreated project never matches its predecessor.
+    """
+    return str(project_data.get("_id")), project_data.get("indexVersion", 0)
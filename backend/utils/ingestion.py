@@ -0,0 +1,155 @@
+# utils/ingestion.py
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List
+
+from loguru import logger
+from openai import AsyncOpenAI
+from weaviate.classes.query import Filter
+
+from config import EMBEDDING_MODEL
+from utils.chunking import chunk_file, read_file_bytes, looks_like_binary
+from utils.embedding import get_embedding
+from utils.file_index import write_file_vector
+from utils.hashing import digest_bytes, hash_chunks, compare_chunk_hashes, file_hash_matches
+from utils.scheduler import IngestionScheduler
+from utils.symbol_index import extract_symbols, replace_file_symbols
+from utils.tokens import count_chunk_tokens
+
+
+async def chunk_stage(fp: str, hashes_collection) -> Dict[str, Any]:
+    """
+    Read, digest and chunk a file, and compare its chunks with the stored hashes.
+
+    Returns:
+        A dict with the file 'status' ('ignored', 'unchanged' or 'changed') and,
+        for changed files, the hashed 'chunks' and the raw 'fileHash'.
+    """
+    _, ext = os.path.splitext(fp)
+    if looks_like_binary(ext):
+        logger.debug(f"File '{fp}' identified as binary and will be ignored.")
+        return {"status": "ignored"}
+
+    raw = read_file_bytes(fp)
+    if raw is None:
+        return {"status": "ignored"}
+
+    # Unchanged raw bytes: skip decoding, chunking and chunk hashing
+    file_hash = digest_bytes(raw)
+    stored_docs = await hashes_collection.find(
+        {"filePath": fp}, {"_id": 0, "hash": 1, "fileHash": 1}
+    ).to_list(length=None)
+    if file_hash_matches(file_hash, stored_docs):
+        logger.debug(f"No changes detected for file '{fp}'. Skipping re-chunking.")
+        return {"status": "unchanged"}
+
+    chunks = hash_chunks(chunk_file(fp, raw))
+    logger.debug(f"Number of chunks generated for file '{fp}': {len(chunks)}")
+    if not chunks:
+        logger.debug(f"No chunks generated for file '{fp}'")
+        return {"status": "ignored"}
+
+    # Check for changes in chunk hashes
+    file_changed, hash_upgrades = compare_chunk_hashes(chunks, stored_docs)
+    if not file_changed:
+        # Migrate legacy and other-algorithm hashes in place and record the file digest
+        for outdated_hash, new_hash in hash_upgrades.items():
+            await hashes_collection.update_one(
+                {"filePath": fp, "hash": outdated_hash},
+                {"$set": {"hash": new_hash}}
+            )
+        await hashes_collection.update_many({"filePath": fp}, {"$set": {"fileHash": file_hash}})
+        logger.debug(f"No changes detected for file '{fp}'. Skipping re-chunking.")
+        return {"status": "unchanged"}
+
+    return {"status": "changed", "chunks": chunks, "fileHash": file_hash}
+
+
+async def embed_stage(chunks: List[Dict[str, Any]], openai_client: AsyncOpenAI, scheduler: IngestionScheduler,
+                      project: str, weight: float = 1.0, model: str = EMBEDDING_MODEL) -> List[List[float]]:
+    """Embed the cached text of every chunk, one scheduler embedding slot per call."""
+    async def embed(ch):
+        async with scheduler.slot("embed", project, weight):
+            return await get_embedding(ch["text"], openai_client, model)
+
+    return await asyncio.gather(*(embed(ch) for ch in chunks))
+
+
+async def write_stage(fp: str, chunks: List[Dict[str, Any]], embeddings: List[List[float]], file_hash: str,
+                      hashes_collection, chunk_collection, file_collection=None, symbols_collection=None) -> None:
+    """
+    Replace the file's chunks in Weaviate and its chunk hashes in MongoDB,
+    along with its symbols in the symbol index and its vector in the
+    file-level index when those collections are given. The Weaviate client is
+    synchronous: its calls run in a thread so the event loop keeps serving
+    other files while this one holds its write slot.
+    """
+    logger.debug(f"Executing deletion for file '{fp}'.")
+    await asyncio.to_thread(
+        chunk_collection.data.delete_many, where=Filter.by_property(name="filePath").equal(fp)
+    )
+    await hashes_collection.delete_many({"filePath": fp})
+
+    symbols = []
+    for ch, embedding in zip(chunks, embeddings):
+        data_object = {
+            "content": ch["content"],
+            "filePath": ch["filePath"],
+            "path": ch["filePath"],
+            "language": ch["language"],
+            "functionName": ch["functionName"],
+            "startLine": ch["startLine"],
+            "endLine": ch["endLine"],
+            "tokenCount": ch["tokenCount"],
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        chunk_id = await asyncio.to_thread(chunk_collection.data.insert, properties=data_object, vector=embedding)
+        logger.debug(f"Inserted chunk into Weaviate for file '{fp}'")
+        symbols.extend(extract_symbols(ch, str(chunk_id)))
+
+        await hashes_collection.update_one(
+            {"filePath": ch["filePath"], "hash": ch["hash"]},
+            {"$set": {"hash": ch["hash"], "fileHash": file_hash}},
+            upsert=True
+        )
+        logger.debug(f"Updated MongoDB for chunk in file '{fp}'")
+
+    if symbols_collection is not None:
+        await replace_file_symbols(symbols_collection, fp, symbols)
+    if file_collection is not None:
+        await asyncio.to_thread(write_file_vector, file_collection, fp, chunks, embeddings)
+
+
+async def index_file(fp: str, hashes_collection, chunk_collection, openai_client: AsyncOpenAI,
+                     scheduler: IngestionScheduler, project: str, weight: float = 1.0,
+                     model: str = EMBEDDING_MODEL, file_collection=None,
+                     symbols_collection=None) -> Dict[str, Any]:
+    """
+    Run the chunk, embed and write stages for one file. Embedding calls and
+    writes wait for their slots in the ingestion scheduler. The file's symbols
+    and vector are kept up to date in `symbols_collection` and
+    `file_collection`, the project's symbol and file-level indexes, if given.
+
+    Returns:
+        A dict with the file 'status' ('chunked' or 'ignored') and the number
+        of 'chunks_embedded'.
+    """
+    planned = await chunk_stage(fp, hashes_collection)
+    if planned["status"] == "ignored":
+        return {"status": "ignored", "chunks_embedded": 0}
+    if planned["status"] == "unchanged":
+        return {"status": "chunked", "chunks_embedded": 0}
+
+    chunks = planned["chunks"]
+    # Counted once here so queries can pack context without tokenizing
+    count_chunk_tokens(chunks)
+    embeddings = await embed_stage(chunks, openai_client, scheduler, project, weight, model)
+    logger.debug(f"Generated embeddings for {len(chunks)} chunks in file '{fp}'")
+    async with scheduler.slot("write", project, weight, cost=len(chunks)):
+        await write_stage(
+            fp, chunks, embeddings, planned["fileHash"], hashes_collection, chunk_collection,
+            file_collection, symbols_collection
+        )
+    return {"status": "chunked", "chunks_embedded": len(chunks)}
@@ -0,0 +1,57 @@
+# utils/metrics.py
+
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict
+
+
+class _Latency:
+    __slots__ = ("samples", "count", "total")
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+
+class Metrics:
+    """
+    In-process counters and latency summaries. Each API process or worker keeps
+    its own; percentiles are computed over the most recent samples.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._latencies: Dict[str, _Latency] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value_ms: float) -> None:
+        with self._lock:
+            latency = self._latencies.get(name)
+            if latency is None:
+                latency = self._latencies[name] = _Latency(self._window)
+            latency.samples.append(value_ms)
+            latency.count += 1
+            latency.total += value_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = {}
+            for name, latency in self._latencies.items():
+                ordered = sorted(latency.samples)
+                latencies[name] = {
+                    "count": latency.count,
+                    "avg_ms": round(latency.total / latency.count, 2),
+                    "p50_ms": round(ordered[len(ordered) // 2], 2),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+                    "max_ms": round(ordered[-1], 2),
+                }
+            return {"counters": dict(self._counters), "latencies": latencies}
+
+
+metrics = Metrics()
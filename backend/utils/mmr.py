@@ -0,0 +1,43 @@
+# utils/mmr.py
+
+from typing import List
+
+import numpy as np
+
+
+def mmr_select(query_emb: List[float], vectors: List[List[float]], k: int, lambda_: float = 0.7) -> List[int]:
+    """
+    Select `k` candidates by Maximal Marginal Relevance: each pick maximizes
+    lambda * sim(query, c) - (1 - lambda) * max sim(c, picked), so
+    near-duplicates of a picked candidate lose out to different ones.
+
+    Args:
+        query_emb: The query embedding.
+        vectors: The candidate embeddings, in rank order.
+        k: Number of candidates to select.
+        lambda_: 1 ranks by relevance only, 0 by diversity only.
+
+    Returns:
+        The indices of the selected candidates, in selection order.
+    """
+    if not vectors:
+        return []
+    candidates = np.asarray(vectors, dtype=np.float32)
+    candidates /= np.linalg.norm(candidates, axis=1, keepdims=True)
+    query = np.asarray(query_emb, dtype=np.float32)
+    query /= np.linalg.norm(query)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    max_similarity = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+
+    selected = []
+    for _ in range(min(k, len(candidates))):
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = np.where(available, lambda_ * relevance - (1.0 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
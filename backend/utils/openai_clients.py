@@ -0,0 +1,59 @@
+# utils/openai_clients.py
+
+import importlib.util
+from typing import Any, Dict
+
+import httpx
+from fastapi import Request
+from loguru import logger
+from openai import AsyncOpenAI
+
+from config import (
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+    OPENAI_TIMEOUT_SECONDS,
+)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def create_openai_client() -> AsyncOpenAI:
+    """
+    Create the process-wide OpenAI client, backed by one pooled httpx client
+    with tuned connection limits and keep-alive, and HTTP/2 when h2 is installed.
+    """
+    http_client = httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=10.0),
+    )
+    logger.info(f"OpenAI client created (max connections: {OPENAI_MAX_CONNECTIONS}, HTTP/2: {HTTP2_AVAILABLE}).")
+    return AsyncOpenAI(http_client=http_client)
+
+
+def get_openai_client(request: Request) -> AsyncOpenAI:
+    return request.app.state.openai_client
+
+
+def pool_stats(openai_client: AsyncOpenAI) -> Dict[str, Any]:
+    """Report the utilization of the OpenAI client's connection pool."""
+    stats = {"max_connections": OPENAI_MAX_CONNECTIONS, "http2": HTTP2_AVAILABLE}
+    try:
+        # httpx does not expose its pool publicly; read httpcore's connection list
+        pool = openai_client._client._transport._pool
+        connections = pool.connections
+        idle = sum(1 for conn in connections if conn.is_idle())
+        stats.update({
+            "connections": len(connections),
+            "idle": idle,
+            "active": len(connections) - idle,
+            "utilization": round((len(connections) - idle) / OPENAI_MAX_CONNECTIONS, 4),
+        })
+    except AttributeError:
+        logger.debug("Connection pool statistics are not available for this httpx version.")
+    return stats
@@ -0,0 +1,65 @@
+# utils/query_filters.py
+
+import os
+from typing import Optional
+
+from fastapi import HTTPException
+from weaviate.classes.query import Filter
+
+from models import QueryFilters
+from utils.symbol_index import lookup_symbols
+
+# Most chunks a functionName filter matches; a name defined more often is
+# restricted to its first definitions
+FUNCTION_FILTER_MAX_CHUNKS = 200
+# Matches no chunk: used when the filtered function is not defined anywhere
+_NO_CHUNK_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def _glob_to_like(pattern: str) -> str:
+    # Weaviate's `like` supports `*` and `?`; `*` already spans directories
+    while "**" in pattern:
+        pattern = pattern.replace("**", "*")
+    return pattern
+
+
+async def build_chunk_filter(filters: Optional[QueryFilters], project_folder: str, symbols_collection):
+    """
+    Translate query filters into a Weaviate filter on the chunk properties.
+    Path prefixes and globs are relative to the project's folder. A
+    functionName filter keeps the chunks the project's symbol index lists as
+    defining that function or class.
+
+    Returns:
+        The combined filter, or None when no filter is set.
+
+    Raises:
+        HTTPException: When a line range is inverted.
+    """
+    if filters is None:
+        return None
+
+    base = os.path.join("codebase", project_folder, "")
+    conditions = []
+    if filters.languages:
+        conditions.append(Filter.by_property("language").contains_any(filters.languages))
+    if filters.pathPrefix:
+        conditions.append(Filter.by_property("path").like(base + _glob_to_like(filters.pathPrefix.lstrip("/")) + "*"))
+    if filters.pathGlob:
+        conditions.append(Filter.by_property("path").like(base + _glob_to_like(filters.pathGlob.lstrip("/"))))
+    if filters.functionName:
+        chunk_ids = await lookup_symbols(
+            symbols_collection, [filters.functionName], FUNCTION_FILTER_MAX_CHUNKS, include_references=False
+        )
+        conditions.append(Filter.by_id().contains_any(chunk_ids or [_NO_CHUNK_ID]))
+    if filters.minLine is not None and filters.maxLine is not None and filters.minLine > filters.maxLine:
+        raise HTTPException(status_code=400, detail="minLine must not exceed maxLine.")
+    # Keep chunks that overlap [minLine, maxLine]
+    if filters.maxLine is not None:
+        conditions.append(Filter.by_property("startLine").less_or_equal(filters.maxLine))
+    if filters.minLine is not None:
+        conditions.append(Filter.by_property("endLine").greater_or_equal(filters.minLine))
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else Filter.all_of(conditions)
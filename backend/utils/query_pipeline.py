@@ -0,0 +1,803 @@
+# utils/query_pipeline.py
+
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from loguru import logger
+from weaviate.classes.query import Filter, HybridFusion, MetadataQuery
+
+from models import QueryRequest, QuerySettings, QueryFilters
+from config import (
+    COMPLETION_MODEL,
+    COMPLETION_MAX_TOKENS,
+    FEDERATED_MAX_PROJECTS,
+    ANSWER_CACHE_MAX_DISTANCE,
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    RETRIEVAL_MODE,
+    HYBRID_ALPHA,
+    HYBRID_FUSION,
+    KEYWORD_SEARCH_PROPERTIES,
+    MMR_ENABLED,
+    MMR_LAMBDA,
+    MMR_OVER_FETCH,
+    QUERY_DEADLINE_SECONDS,
+    QUERY_EMBEDDING_TIMEOUT_SECONDS,
+    QUERY_SEARCH_TIMEOUT_SECONDS,
+    QUERY_SUMMARY_TIMEOUT_SECONDS,
+    QUERY_COMPLETION_TIMEOUT_SECONDS,
+    QUERY_MIN_COMPLETION_SECONDS,
+    CONTEXT_COMPRESSION,
+    FILE_INDEX_TOP_FILES,
+    SYMBOL_ROUTING_ENABLED,
+)
+from utils.deadline import Deadline
+from utils.context_compressor import COMPRESSION_LEVELS
+from utils.context_packer import get_context_budget, pack_context
+from utils.collection_names import (
+    get_active_weaviate_class_name,
+    get_mongo_answers_collection_name,
+    get_mongo_symbols_collection_name,
+)
+from utils.embedding import get_project_embedding_model
+from utils.embedding_cache import normalize_query
+from utils.file_index import search_files
+from utils.index_version import get_index_version
+from utils.metrics import metrics
+from utils.mmr import mmr_select
+from utils.query_filters import build_chunk_filter, FUNCTION_FILTER_MAX_CHUNKS
+from utils.normalizer import normalize_project_name
+from utils.sanitizer import sanitize_keys
+from utils.symbol_index import detect_identifiers, lookup_symbols
+from utils.summarizer import summarize_interactions, update_rolling_summary, CONVERSATION_SUMMARIES_COLLECTION
+from utils.tokens import estimate_token_count
+
+
+RETRIEVAL_MODES = ("vector", "hybrid", "keyword", "symbol")
+HYBRID_FUSIONS = {"ranked": HybridFusion.RANKED, "relativeScore": HybridFusion.RELATIVE_SCORE}
+
+
+_TRUE_VALUES = ("true", "1", "yes", "on")
+_FALSE_VALUES = ("false", "0", "no", "off")
+
+
+def get_flag(settings: Dict[str, Any], key: str, default: bool) -> bool:
+    """
+    Read a boolean setting, which clients may send as a JSON boolean, a
+    number or a string such as "false".
+
+    Raises:
+        HTTPException: When the value is not a recognizable boolean.
+    """
+    value = settings.get(key, default)
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in _TRUE_VALUES:
+        return True
+    if str(value).strip().lower() in _FALSE_VALUES:
+        return False
+    raise HTTPException(status_code=400, detail=f"{key} must be true or false.")
+
+
+def parse_query_options(settings: QuerySettings) -> Dict[str, Any]:
+    """
+    Read and validate the query and history settings of a request.
+
+    Returns:
+        A dict with the number of chunks to retrieve ('limit'), the 'search'
+        keyword arguments of search_chunks, the 'context_budget' in tokens,
+        the 'compression' level of the context, the 'per_project_quota' of
+        federated queries, the answer cache options, the 'history_settings'
+        for the summary lookup and update, the 'deadline_seconds' of the
+        query and whether questions naming identifiers are answered from the
+        symbol index ('symbol_routing').
+
+    Raises:
+        HTTPException: On invalid settings.
+    """
+    nb_chunks_used_for_query = int(settings.querySettings.get("nbChunksUsedForQuery", 10))
+    nb_literal_items = int(settings.historySummarizerSettings.get("nbLiteralItems", 2))
+    max_total_history_items = int(settings.historySummarizerSettings.get("maxTotalHistoryItems", 10))
+    logger.debug(f'settings -  nb_chunks_used_for_query: {nb_chunks_used_for_query}')
+    logger.debug(f'settings -  nb_literal_items: {nb_literal_items}')
+    logger.debug(f'settings -  max_total_history_items: {max_total_history_items}')
+    retrieval_mode = settings.querySettings.get("retrievalMode", RETRIEVAL_MODE)
+    hybrid_alpha = float(settings.querySettings.get("hybridAlpha", HYBRID_ALPHA))
+    hybrid_fusion = settings.querySettings.get("hybridFusion", HYBRID_FUSION)
+    diversify = get_flag(settings.querySettings, "diversify", MMR_ENABLED)
+    mmr_lambda = float(settings.querySettings.get("mmrLambda", MMR_LAMBDA))
+    mmr_over_fetch = int(settings.querySettings.get("mmrOverFetch", MMR_OVER_FETCH))
+    max_context_tokens = settings.querySettings.get("maxContextTokens")
+    context_budget = get_context_budget(int(max_context_tokens) if max_context_tokens else None)
+    logger.debug(f'settings -  context_budget: {context_budget}')
+    deadline_seconds = float(settings.querySettings.get("deadlineSeconds", QUERY_DEADLINE_SECONDS))
+    compression = settings.querySettings.get("contextCompression", CONTEXT_COMPRESSION)
+    two_stage = get_flag(settings.querySettings, "twoStage", False)
+    top_files = int(settings.querySettings.get("topFiles", FILE_INDEX_TOP_FILES))
+
+    if retrieval_mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval mode '{retrieval_mode}'.")
+    if hybrid_fusion not in HYBRID_FUSIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown hybrid fusion '{hybrid_fusion}'.")
+    if not 0.0 <= hybrid_alpha <= 1.0:
+        raise HTTPException(status_code=400, detail="hybridAlpha must be between 0 and 1.")
+    if not 0.0 <= mmr_lambda <= 1.0 or mmr_over_fetch < 1:
+        raise HTTPException(status_code=400, detail="mmrLambda must be between 0 and 1 and mmrOverFetch at least 1.")
+    if compression not in COMPRESSION_LEVELS:
+        raise HTTPException(status_code=400, detail=f"Unknown context compression '{compression}'.")
+    if two_stage and top_files < 1:
+        raise HTTPException(status_code=400, detail="topFiles must be at least 1.")
+    if deadline_seconds <= 0:
+        raise HTTPException(status_code=400, detail="deadlineSeconds must be positive.")
+
+    return {
+        "limit": nb_chunks_used_for_query,
+        "search": {
+            "mode": retrieval_mode,
+            "alpha": hybrid_alpha,
+            "fusion": hybrid_fusion,
+            "mmr_lambda": mmr_lambda if diversify else None,
+            "over_fetch": mmr_over_fetch,
+            "top_files": top_files if two_stage else 0,
+        },
+        "context_budget": context_budget,
+        "compression": compression,
+        "per_project_quota": int(settings.querySettings.get("perProjectQuota", 0)),
+        "use_answer_cache": not get_flag(settings.querySettings, "bypassAnswerCache", False),
+        "answer_cache_distance": float(
+            settings.querySettings.get("answerCacheMaxDistance", ANSWER_CACHE_MAX_DISTANCE)
+        ),
+        "history_settings": {"max_literal": nb_literal_items, "max_fold": max_total_history_items},
+        "deadline_seconds": deadline_seconds,
+        "symbol_routing": get_flag(settings.querySettings, "symbolRouting", SYMBOL_ROUTING_ENABLED),
+    }
+
+
+async def load_query_scope(request: Request, project_name: str, filters: Optional[QueryFilters]) -> Dict[str, Any]:
+    """
+    Resolve what a query searches: the project, its active collection, the
+    chunk filter and the answers collection.
+
+    Raises:
+        HTTPException: When the project name is empty or the filters are invalid.
+    """
+    project = normalize_project_name(project_name)
+    if not project.strip():
+        logger.warning("Empty project name received.")
+        raise HTTPException(status_code=400, detail="Project name cannot be empty.")
+
+    # The project records which collection and embedding model serve its queries
+    db = request.app.state.db
+    project_data = await db["projects"].find_one({"normalized_name": project}) or {"normalized_name": project}
+    symbols_collection = db[get_mongo_symbols_collection_name(project)]
+    return {
+        "project": project,
+        "project_data": project_data,
+        "weaviate_class_name": get_active_weaviate_class_name(project_data),
+        "chunk_filter": await build_chunk_filter(filters, project_data.get("folder", ""), symbols_collection),
+        # Filtered queries only share cached answers with identically filtered ones
+        "answer_scope": filters.model_dump_json(exclude_none=True) if filters else "",
+        "answers_collection": db[get_mongo_answers_collection_name(project)],
+        "symbols_collection": symbols_collection,
+    }
+
+
+async def get_coalescing_key(request: Request, body: QueryRequest) -> str:
+    """
+    Key identical queries: same projects, normalized question, settings and
+    filters, against the same index versions. Answers computed before a
+    project is re-indexed are never shared with queries made after it.
+    """
+    project_names = [normalize_project_name(name) for name in [body.project] + (body.projects or [])]
+    projects = await request.app.state.db["projects"].find(
+        {"normalized_name": {"$in": project_names}}, {"normalized_name": 1, "indexVersion": 1}
+    ).to_list(length=None)
+    index_versions = sorted((p["normalized_name"], *map(str, get_index_version(p))) for p in projects)
+    return json.dumps([
+        project_names,
+        normalize_query(body.query),
+        body.model_dump(exclude={"query", "project", "projects"}),
+        index_versions,
+    ], sort_keys=True, default=str)
+
+
+def start_history_lookup(request: Request, scope: Dict[str, Any], options: Dict[str, Any],
+                         session_id: Optional[str] = None) -> asyncio.Task:
+    """Start reading the session's history; it runs alongside the embedding and search."""
+    return asyncio.create_task(summarize_interactions(
+        scope["answers_collection"],
+        request.app.state.db[CONVERSATION_SUMMARIES_COLLECTION],
+        scope["project"],
+        max_literal=options["history_settings"]["max_literal"],
+        session_id=session_id,
+    ))
+
+
+def merge_federated_results(results: List[List[Dict[str, Any]]], limit: int, quota: int,
+                            by_rank: bool = False) -> List[Dict[str, Any]]:
+    """
+    Merge the chunks retrieved from several projects, taking at most `quota`
+    chunks per project, then filling any slots left over by projects with
+    fewer results from the remaining chunks.
+
+    Chunks are ordered by distance, which is only meaningful when every
+    project was searched by vector with the same embedding model. Otherwise
+    (`by_rank`), they are interleaved by their rank within their project:
+    each project's best chunk, then each project's second best, and so on.
+    """
+    if by_rank:
+        ranked = {
+            id(chunk): (rank, index) for index, chunks in enumerate(results) for rank, chunk in enumerate(chunks)
+        }
+        order = lambda chunk: ranked[id(chunk)]
+    else:
+        order = lambda chunk: chunk["distance"] if chunk["distance"] is not None else 1.0
+    candidates = sorted((chunk for chunks in results for chunk in chunks), key=order)
+    merged, leftovers = [], []
+    taken: Dict[str, int] = {}
+    for chunk in candidates:
+        if len(merged) < limit and taken.get(chunk["project"], 0) < quota:
+            merged.append(chunk)
+            taken[chunk["project"]] = taken.get(chunk["project"], 0) + 1
+        else:
+            leftovers.append(chunk)
+    merged.extend(leftovers[:limit - len(merged)])
+    merged.sort(key=order)
+    return merged
+
+
+async def federated_search(request: Request, scopes: List[Dict[str, Any]], query_embs: Dict[str, List[float]],
+                           user_query: str, options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Search every project's collection concurrently with the query embedding
+    of its model and merge the results with per-project quotas
+    (querySettings.perProjectQuota, by default an even share of the chunks).
+    Results are merged by distance only when the distances are comparable:
+    vector searches with a single embedding model. Keyword and hybrid
+    distances are relative to each project's best hit, so those results are
+    merged by rank.
+    """
+    async def search(scope):
+        chunks = await search_chunks(
+            request.app.state.weaviate_async_client, scope["weaviate_class_name"],
+            query_embs[get_project_embedding_model(scope["project_data"])], options["limit"],
+            query_text=user_query, filters=scope["chunk_filter"], symbols_collection=scope["symbols_collection"],
+            **options["search"]
+        )
+        for chunk in chunks:
+            chunk["project"] = scope["project"]
+        return chunks
+
+    results = await asyncio.gather(*(search(scope) for scope in scopes))
+    if len(scopes) == 1:
+        return results[0]
+    quota = options["per_project_quota"] or -(-options["limit"] // len(scopes))
+    comparable = options["search"]["mode"] == "vector" and len(query_embs) == 1
+    return merge_federated_results(results, options["limit"], quota, by_rank=not comparable)
+
+
+async def search_within_deadline(request: Request, scopes: List[Dict[str, Any]], query_embs: Dict[str, List[float]],
+                                 user_query: str, options: Dict[str, Any], deadline: Deadline) -> List[Dict[str, Any]]:
+    """
+    Run the search within its budget. When it times out, it is retried once
+    for half the chunks, without MMR over-fetching.
+
+    Raises:
+        HTTPException: 504 when the retry times out as well.
+    """
+    try:
+        return await deadline.run(
+            federated_search(request, scopes, query_embs, user_query, options), QUERY_SEARCH_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        deadline.degrade("search")
+
+    fallback = {
+        **options,
+        "limit": max(1, options["limit"] // 2),
+        "search": {**options["search"], "mmr_lambda": None},
+    }
+    try:
+        return await deadline.run(
+            federated_search(request, scopes, query_embs, user_query, fallback), QUERY_SEARCH_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        logger.error("Search timed out.")
+        raise HTTPException(status_code=504, detail="Search timed out.")
+
+
+async def route_symbols(request: Request, scopes: List[Dict[str, Any]], user_query: str,
+                        options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Fetch the chunks of the functions, classes and files named in the question:
+    definitions from the symbol index first, then references, then the chunks
+    of the files named. No embedding is needed.
+
+    Returns:
+        At most `limit` chunks at distance 0, or an empty list when the question
+        names no identifier or none of them is indexed.
+    """
+    identifiers = detect_identifiers(user_query)
+    if not identifiers["symbols"] and not identifiers["files"]:
+        return []
+    limit = options["limit"]
+    weaviate_async_client = request.app.state.weaviate_async_client
+
+    async def route(scope):
+        ids = await lookup_symbols(scope["symbols_collection"], identifiers["symbols"], limit)
+        chunks = await fetch_chunks_by_id(
+            weaviate_async_client, scope["weaviate_class_name"], ids, scope["chunk_filter"]
+        )
+        for name in identifiers["files"]:
+            if len(chunks) >= limit:
+                break
+            chunks += await fetch_file_chunks(
+                weaviate_async_client, scope["weaviate_class_name"], name, limit - len(chunks), scope["chunk_filter"]
+            )
+        for chunk in chunks:
+            chunk["project"] = scope["project"]
+        return chunks
+
+    results = await asyncio.gather(*(route(scope) for scope in scopes))
+    chunks, seen = [], set()
+    for chunk in (chunk for chunks in results for chunk in chunks):
+        key = (chunk["project"], chunk["file"], chunk["lines"])
+        if key not in seen:
+            seen.add(key)
+            chunks.append(chunk)
+    return chunks[:limit]
+
+
+async def retrieve_context(request: Request, body: QueryRequest) -> Dict[str, Any]:
+    """
+    Validate a query, then run the query embedding and the history lookup
+    concurrently, followed by the search. Queries close enough to a cached
+    one are answered from the answer cache, unless the request sets
+    'bypassAnswerCache'.
+
+    Questions naming functions, classes or files that the symbol index knows
+    are answered from their chunks directly, without embedding the query
+    (unless querySettings.symbolRouting is off); their 'query_emb' is None.
+
+    When the request lists further 'projects', the query is embedded once
+    per embedding model and every project is searched concurrently; the
+    history stays with the request's main 'project'.
+
+    The query's 'deadline' starts here and bounds the embedding and the search;
+    it is returned for the later stages.
+
+    Returns:
+        A dict with the 'user_query', 'project', 'project_data', the
+        'answers_collection', the 'query_emb', the 'retrieved_chunks', the
+        'summary_task' (still running, to be awaited when the prompt is built),
+        the 'context_budget' in tokens, the 'answer_scope' of the answer cache,
+        the 'history_settings' and 'session_id' for the summary update, the 'deadline' and the
+        'cached_answer' (None unless the answer cache was hit).
+
+    Raises:
+        HTTPException: On invalid input or when the embedding or the search
+            fails, 504 when either runs out of time.
+    """
+    user_query = body.query
+    options = parse_query_options(body.settings)
+    deadline = Deadline(options["deadline_seconds"])
+
+    # Input validation
+    if not user_query.strip():
+        logger.warning("Empty query received.")
+        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+
+    project_names = [body.project] + [name for name in body.projects or [] if name != body.project]
+    if len(project_names) > FEDERATED_MAX_PROJECTS:
+        raise HTTPException(status_code=400, detail=f"At most {FEDERATED_MAX_PROJECTS} projects per query.")
+    scopes = await asyncio.gather(*(load_query_scope(request, name, body.filters) for name in project_names))
+    scope = scopes[0]
+    project_data = scope["project_data"]
+    for extra_scope in scopes[1:]:
+        if "_id" not in extra_scope["project_data"]:
+            raise HTTPException(status_code=404, detail=f"Project '{extra_scope['project']}' not found.")
+    if len(scopes) > 1:
+        # Answers depend on every searched project's index
+        scope["answer_scope"] += "|" + ",".join(
+            f"{s['project']}:{':'.join(map(str, get_index_version(s['project_data'])))}" for s in scopes[1:]
+        )
+    retrieval = {
+        "user_query": user_query,
+        "project": scope["project"],
+        "project_data": project_data,
+        "answers_collection": scope["answers_collection"],
+        "context_budget": options["context_budget"],
+        "compression": options["compression"],
+        "answer_scope": scope["answer_scope"],
+        "history_settings": options["history_settings"],
+        "session_id": body.sessionId,
+        "deadline": deadline,
+    }
+
+    # The query embedding and the history lookup are independent: run them concurrently
+    openai_client = request.app.state.openai_client
+    summary_task = start_history_lookup(request, scope, options, body.sessionId)
+    try:
+        if options["symbol_routing"]:
+            try:
+                routed_chunks = await deadline.run(
+                    route_symbols(request, scopes, user_query, options), QUERY_SEARCH_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Symbol lookup timed out; falling back to search.")
+                routed_chunks = []
+            if routed_chunks:
+                metrics.increment("query.symbol_routed")
+                logger.info(f"Answered from the symbol index: {len(routed_chunks)} chunks.")
+                return {
+                    **retrieval,
+                    "query_emb": None,
+                    "retrieved_chunks": routed_chunks,
+                    "summary_task": summary_task,
+                    "cached_answer": None,
+                }
+
+        try:
+            # One embedding per model: projects may have been migrated to different ones
+            models = list(dict.fromkeys(get_project_embedding_model(s["project_data"]) for s in scopes))
+            query_embs = dict(zip(models, await deadline.run(asyncio.gather(*(
+                request.app.state.embedding_cache.get_embedding(user_query, openai_client, model)
+                for model in models
+            )), QUERY_EMBEDDING_TIMEOUT_SECONDS)))
+            query_emb = query_embs[models[0]]
+        except asyncio.TimeoutError:
+            logger.error("Embedding generation timed out.")
+            raise HTTPException(status_code=504, detail="Embedding generation timed out.")
+        except Exception as e:
+            logger.error(f"Embedding generation failed: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to generate embedding for query.")
+
+        cached_answer = None
+        if options["use_answer_cache"]:
+            cached_answer = request.app.state.answer_cache.lookup(
+                project_data, query_emb, options["answer_cache_distance"], scope["answer_scope"]
+            )
+        if cached_answer is not None:
+            summary_task.cancel()
+            logger.info("Answered from the answer cache.")
+            return {
+                **retrieval,
+                "query_emb": query_emb,
+                "retrieved_chunks": [],
+                "summary_task": None,
+                "cached_answer": cached_answer,
+            }
+
+        retrieved_chunks = await search_within_deadline(request, scopes, query_embs, user_query, options, deadline)
+    except HTTPException:
+        summary_task.cancel()
+        raise
+
+    return {
+        **retrieval,
+        "query_emb": query_emb,
+        "retrieved_chunks": retrieved_chunks,
+        "summary_task": summary_task,
+        "cached_answer": None,
+    }
+
+
+async def search_chunks(weaviate_async_client, weaviate_class_name: str, query_emb: List[float],
+                        limit: int, query_text: str = "", mode: str = "vector",
+                        alpha: float = HYBRID_ALPHA, fusion: str = HYBRID_FUSION,
+                        mmr_lambda: Optional[float] = None, over_fetch: int = MMR_OVER_FETCH,
+                        filters=None, offset: int = 0, top_files: int = 0,
+                        symbols_collection=None) -> List[Dict[str, Any]]:
+    """
+    Run the search and return the retrieved chunks in rank order.
+
+    Args:
+        mode: 'vector' (near_vector on the query embedding), 'keyword' (BM25 on
+            the content, file path and function name), 'hybrid' (both, fused
+            with `fusion` and weighted by `alpha`, 1 being pure vector) or
+            'symbol' (the chunks `symbols_collection`, the project's symbol
+            index, lists as defining the query, then as referencing it, as
+            exact matches at distance 0; no embedding needed, no MMR).
+        mmr_lambda: When set, `limit * over_fetch` candidates are fetched with
+            their vectors in the same request and `limit` of them re-selected
+            by Maximal Marginal Relevance.
+        filters: A Weaviate filter restricting the searched chunks (see build_chunk_filter).
+        offset: Number of ranked chunks to skip, for pagination.
+        top_files: When set, vector and hybrid searches run in two stages: the
+            `top_files` files closest to the query are selected from the
+            project's file-level index, then only their chunks are searched.
+            Projects without a file index are searched in one stage.
+
+    Keyword and hybrid results carry a 'score' rather than a distance; their
+    'distance' is derived from the score relative to the best result of the
+    search, so that distances compare across pages.
+    """
+    if mode == "symbol":
+        return await search_symbol(
+            weaviate_async_client, weaviate_class_name, symbols_collection, query_text.strip(), limit, filters, offset
+        )
+
+    diversify = mmr_lambda is not None
+    fetch_limit = limit * over_fetch if diversify else limit
+    # Scores are relative to the best one: fetch the skipped results too to know it
+    scored = mode in ("hybrid", "keyword")
+    query_offset, query_limit = (0, offset + fetch_limit) if scored else (offset, fetch_limit)
+    if top_files and mode in ("vector", "hybrid"):
+        try:
+            paths = await search_files(weaviate_async_client, weaviate_class_name, query_emb, top_files)
+        except Exception as e:
+            logger.error(f"File index query failed: {e}")
+            raise HTTPException(status_code=500, detail="Weaviate query failed.")
+        if paths:
+            file_filter = Filter.by_property("path").contains_any(paths)
+            filters = file_filter & filters if filters is not None else file_filter
+    try:
+        chunk_collection = weaviate_async_client.collections.get(weaviate_class_name)
+        if mode == "hybrid":
+            result = await chunk_collection.query.hybrid(
+                query=query_text,
+                vector=query_emb,
+                alpha=alpha,
+                fusion_type=HYBRID_FUSIONS[fusion],
+                query_properties=KEYWORD_SEARCH_PROPERTIES,
+                limit=query_limit,
+                offset=query_offset,
+                include_vector=diversify,
+                filters=filters,
+                return_metadata=MetadataQuery(score=True)
+            )
+        elif mode == "keyword":
+            result = await chunk_collection.query.bm25(
+                query=query_text,
+                query_properties=KEYWORD_SEARCH_PROPERTIES,
+                limit=query_limit,
+                offset=query_offset,
+                include_vector=diversify,
+                filters=filters,
+                return_metadata=MetadataQuery(score=True)
+            )
+        else:
+            result = await chunk_collection.query.near_vector(
+                near_vector=query_emb,
+                limit=fetch_limit,
+                offset=offset,
+                include_vector=diversify,
+                filters=filters,
+                return_metadata=MetadataQuery(distance=True)
+            )
+        logger.debug("Weaviate query executed successfully.")
+    except Exception as e:
+        logger.error(f"Weaviate query failed: {e}")
+        raise HTTPException(status_code=500, detail="Weaviate query failed.")
+
+    objects = result.objects
+    best_score = max((item.metadata.score or 0.0 for item in objects), default=0.0) if scored else 0.0
+    if scored:
+        objects = objects[offset:]
+    if diversify and objects:
+        objects = [
+            objects[i] for i in mmr_select(query_emb, [_get_vector(item) for item in objects], limit, mmr_lambda)
+        ]
+
+    # Process retrieved chunks
+    retrieved_chunks = []
+    for item in objects:
+        if mode == "vector":
+            distance = item.metadata.distance
+        else:
+            distance = 1.0 - (item.metadata.score or 0.0) / best_score if best_score else 1.0
+        retrieved_chunks.append(_to_chunk_record(item, distance))
+    return retrieved_chunks
+
+
+async def search_symbol(weaviate_async_client, weaviate_class_name: str, symbols_collection, name: str,
+                        limit: int, filters=None, offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    The chunks defining `name`, then the chunks referencing it, from the
+    project's symbol index. Filters apply before paging.
+    """
+    if symbols_collection is None:
+        raise HTTPException(status_code=400, detail="Symbol search needs the project's symbol index.")
+    # Filtered out chunks leave gaps: look further than the page when filtering
+    lookup_limit = offset + limit + (FUNCTION_FILTER_MAX_CHUNKS if filters is not None else 0)
+    ids = await lookup_symbols(symbols_collection, [name], lookup_limit)
+    chunks = await fetch_chunks_by_id(weaviate_async_client, weaviate_class_name, ids, filters)
+    return chunks[offset:offset + limit]
+
+
+def _to_chunk_record(item, distance: float) -> Dict[str, Any]:
+    try:
+        return {
+            "file": item.properties["filePath"],
+            "lines": f"{item.properties['startLine']}-{item.properties['endLine']}",
+            "startLine": item.properties["startLine"],
+            "endLine": item.properties["endLine"],
+            "content": item.properties["content"],
+            "distance": distance,
+            "score": item.metadata.score if item.metadata else None,
+            "functionName": item.properties.get("functionName"),
+            # Chunks ingested before token counts were stored fall back to an estimate
+            "tokens": item.properties.get("tokenCount") or estimate_token_count(item.properties["content"]),
+        }
+    except KeyError:
+        logger.warning("Unexpected response format from Weaviate.")
+        raise HTTPException(status_code=500, detail="Invalid response from Weaviate.")
+
+
+async def fetch_chunks_by_id(weaviate_async_client, weaviate_class_name: str, ids: List[str],
+                             filters=None) -> List[Dict[str, Any]]:
+    """Fetch chunks by their Weaviate ids, in the order of `ids`, as exact matches at distance 0."""
+    if not ids:
+        return []
+    id_filter = Filter.by_id().contains_any(ids)
+    try:
+        result = await weaviate_async_client.collections.get(weaviate_class_name).query.fetch_objects(
+            filters=id_filter & filters if filters is not None else id_filter,
+            limit=len(ids),
+        )
+    except Exception as e:
+        logger.error(f"Weaviate query failed: {e}")
+        raise HTTPException(status_code=500, detail="Weaviate query failed.")
+    by_id = {str(item.uuid): item for item in result.objects}
+    return [_to_chunk_record(by_id[chunk_id], 0.0) for chunk_id in ids if chunk_id in by_id]
+
+
+async def fetch_file_chunks(weaviate_async_client, weaviate_class_name: str, file_name: str, limit: int,
+                            filters=None) -> List[Dict[str, Any]]:
+    """Fetch the first chunks, in line order, of the files named `file_name` in any folder."""
+    file_filter = Filter.any_of([
+        Filter.by_property("path").equal(file_name),
+        Filter.by_property("path").like(f"*/{file_name}"),
+    ])
+    try:
+        result = await weaviate_async_client.collections.get(weaviate_class_name).query.fetch_objects(
+            filters=file_filter & filters if filters is not None else file_filter,
+            limit=limit,
+        )
+    except Exception as e:
+        logger.error(f"Weaviate query failed: {e}")
+        raise HTTPException(status_code=500, detail="Weaviate query failed.")
+    chunks = [_to_chunk_record(item, 0.0) for item in result.objects]
+    return sorted(chunks, key=lambda chunk: (chunk["file"], chunk["startLine"]))
+
+
+def _get_vector(item) -> List[float]:
+    # Collections with a single unnamed vector return it under "default"
+    return item.vector["default"] if isinstance(item.vector, dict) else item.vector
+
+
+def build_prompt(retrieved_chunks: List[Dict[str, Any]], summary: str, user_query: str,
+                 max_token_length: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+                 compression: str = "none") -> Tuple[str, int, int]:
+    """
+    Pack the retrieved chunks into the token budget, using their stored token
+    counts, compressed at the `compression` level, and append the history summary.
+
+    Returns:
+        The prompt, its estimated token count and the tokens saved by compression.
+    """
+    packed = pack_context(retrieved_chunks, max_token_length, compression)
+    context = packed["blocks"]
+    token_count = packed["tokens"]
+    if packed["tokens_saved"]:
+        metrics.increment("query.context_tokens_saved", packed["tokens_saved"])
+
+    context.append(summary)
+    context_str = "\n---\n".join(context)
+    prompt = f"Context:\n{context_str}\n\nQuestion: {user_query}\nAnswer:"
+
+    logger.info(f"Generated prompt for AI: {prompt}")
+    prompt_tokens = token_count + estimate_token_count(summary) + estimate_token_count(user_query)
+    return prompt, prompt_tokens, packed["tokens_saved"]
+
+
+async def prepare_prompt(retrieval: Dict[str, Any]) -> Tuple[str, int, int]:
+    """
+    Build the prompt of a retrieval within its deadline. The history summary
+    is dropped when it is not ready within its budget, leaving time for the
+    completion, and the context is cut in proportion when less time remains
+    than the completion's budget.
+
+    Returns:
+        The prompt, its estimated token count and the tokens saved by compression.
+    """
+    deadline = retrieval["deadline"]
+    summary_task = retrieval["summary_task"]
+    summary = ""
+    summary_budget = min(QUERY_SUMMARY_TIMEOUT_SECONDS, deadline.remaining() - QUERY_MIN_COMPLETION_SECONDS)
+    if summary_task.done() or summary_budget > 0:
+        try:
+            summary = await asyncio.wait_for(summary_task, max(summary_budget, 0))
+        except asyncio.TimeoutError:
+            deadline.degrade("summary")
+    else:
+        summary_task.cancel()
+        deadline.degrade("summary")
+
+    context_budget = retrieval["context_budget"]
+    remaining = deadline.remaining()
+    if remaining < QUERY_COMPLETION_TIMEOUT_SECONDS:
+        # Fewer context tokens make for a faster completion
+        context_budget = max(1, int(context_budget * remaining / QUERY_COMPLETION_TIMEOUT_SECONDS))
+        deadline.degrade("context")
+
+    return build_prompt(
+        retrieval["retrieved_chunks"], summary, retrieval["user_query"], context_budget, retrieval["compression"]
+    )
+
+
+def has_time_for_completion(deadline: Deadline) -> bool:
+    """Whether the completion can still start; if not, the query is answered with its chunks only."""
+    if deadline.remaining() < QUERY_MIN_COMPLETION_SECONDS:
+        deadline.degrade("completion")
+        return False
+    return True
+
+
+def format_chunk_refs(retrieved_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The references of retrieved chunks, without their content."""
+    return [
+        {"project": chunk["project"], "file": chunk["file"], "lines": chunk["lines"], "distance": chunk["distance"]}
+        for chunk in retrieved_chunks
+    ]
+
+
+async def generate_answer(openai_client, prompt: str, prompt_tokens: int) -> Dict[str, Any]:
+    """
+    Run the completion for a prompt. A failed call is reported in the answer
+    rather than raised, as /api/query always did.
+
+    Returns:
+        A dict with the 'answer', 'tokens_submitted', 'tokens_returned' (from
+        the completion's usage when reported) and whether the call 'failed'.
+    """
+    try:
+        completion = await openai_client.chat.completions.create(
+            model=COMPLETION_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=COMPLETION_MAX_TOKENS
+        )
+    except Exception as e:
+        logger.error(f"OpenAI API call failed: {e}")
+        return {"answer": f"Error calling OpenAI: {e}", "tokens_submitted": prompt_tokens,
+                "tokens_returned": 0, "failed": True}
+
+    ai_answer = completion.choices[0].message.content.strip()
+    logger.info("AI responded successfully.")
+    if completion.usage:
+        return {"answer": ai_answer, "tokens_submitted": completion.usage.prompt_tokens,
+                "tokens_returned": completion.usage.completion_tokens, "failed": False}
+    return {"answer": ai_answer, "tokens_submitted": prompt_tokens,
+            "tokens_returned": estimate_token_count(ai_answer), "failed": False}
+
+
+async def store_answer(answers_collection, user_query: str, ai_answer: str,
+                       session_id: Optional[str] = None) -> None:
+    """Sanitize and store a Q&A record in the history of its session."""
+    doc = {
+        "query": user_query,
+        "answer": ai_answer,
+        "sessionId": session_id,
+        "timestamp": datetime.utcnow()
+    }
+    sanitized_doc = sanitize_keys(doc)
+    await answers_collection.insert_one(sanitized_doc)
+    logger.debug("Sanitized Q&A stored in MongoDB.")
+
+
+def schedule_summary_update(request: Request, retrieval: Dict[str, Any]) -> None:
+    """Fold newly aged-out interactions into the rolling summary, off the request path."""
+    task = asyncio.create_task(update_rolling_summary(
+        retrieval["answers_collection"],
+        request.app.state.db[CONVERSATION_SUMMARIES_COLLECTION],
+        retrieval["project"],
+        request.app.state.openai_client,
+        **retrieval["history_settings"],
+        session_id=retrieval.get("session_id"),
+    ))
+    # Keep a reference until the task is done so it is not garbage collected
+    request.app.state.background_tasks.add(task)
+    task.add_done_callback(request.app.state.background_tasks.discard)
@@ -0,0 +1,162 @@
+# utils/scheduler.py
+
+import asyncio
+import itertools
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+from config import (
+    SCHEDULER_EMBED_SLOTS,
+    SCHEDULER_WRITE_SLOTS,
+    SCHEDULER_PROJECT_EMBED_LIMIT,
+    SCHEDULER_PROJECT_WRITE_LIMIT,
+)
+
+
+class _Waiter:
+    __slots__ = ("tag", "start", "seq", "project", "future", "enqueued_at")
+
+    def __init__(self, tag: float, start: float, seq: int, project: str, future: asyncio.Future):
+        self.tag = tag
+        self.start = start
+        self.seq = seq
+        self.project = project
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _ProjectStats:
+    __slots__ = ("granted", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class FairSlotPool:
+    """
+    A pool of slots shared by all projects, granted by weighted fair queuing.
+
+    Each request gets a virtual finish tag of start + cost / weight, where start
+    is the later of the pool's virtual time and the project's previous finish
+    tag. Free slots go to the waiter with the smallest tag whose project is
+    below its own limit, so a project with many queued requests cannot starve
+    the others.
+    """
+
+    def __init__(self, name: str, capacity: int, per_project_limit: int):
+        self.name = name
+        self.capacity = capacity
+        self.per_project_limit = per_project_limit
+        self.in_use = 0
+        self.in_use_by_project: Dict[str, int] = defaultdict(int)
+        self.waiters: List[_Waiter] = []
+        self.virtual_time = 0.0
+        self.finish_tags: Dict[str, float] = {}
+        self.stats: Dict[str, _ProjectStats] = defaultdict(_ProjectStats)
+        self._seq = itertools.count()
+
+    def _eligible(self, project: str) -> bool:
+        return self.in_use < self.capacity and self.in_use_by_project.get(project, 0) < self.per_project_limit
+
+    def _grant(self, project: str, start: float, waited: float) -> None:
+        self.in_use += 1
+        self.in_use_by_project[project] += 1
+        self.virtual_time = max(self.virtual_time, start)
+        stats = self.stats[project]
+        stats.granted += 1
+        stats.total_wait += waited
+        stats.max_wait = max(stats.max_wait, waited)
+
+    def _dispatch(self) -> None:
+        while self.waiters and self.in_use < self.capacity:
+            eligible = [w for w in self.waiters if self._eligible(w.project)]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: (w.tag, w.seq))
+            self.waiters.remove(waiter)
+            self._grant(waiter.project, waiter.start, time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    async def acquire(self, project: str, weight: float = 1.0, cost: float = 1.0) -> None:
+        start = max(self.virtual_time, self.finish_tags.get(project, 0.0))
+        tag = start + cost / max(weight, 1e-6)
+        self.finish_tags[project] = tag
+
+        waiter = _Waiter(tag, start, next(self._seq), project, asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # Granted just before the cancellation: hand the slot back
+                self.release(project)
+            raise
+
+    def release(self, project: str) -> None:
+        self.in_use -= 1
+        self.in_use_by_project[project] -= 1
+        if not self.in_use_by_project[project]:
+            del self.in_use_by_project[project]
+        self._dispatch()
+
+    def project_stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        projects = set(self.stats) | {w.project for w in self.waiters}
+        result = {}
+        for project in sorted(projects):
+            queued = [w for w in self.waiters if w.project == project]
+            stats = self.stats[project]
+            result[project] = {
+                "queue_depth": len(queued),
+                "in_use": self.in_use_by_project.get(project, 0),
+                "granted": stats.granted,
+                "avg_wait_seconds": round(stats.total_wait / stats.granted, 4) if stats.granted else 0.0,
+                "max_wait_seconds": round(stats.max_wait, 4),
+                "oldest_wait_seconds": round(max((now - w.enqueued_at for w in queued), default=0.0), 4),
+            }
+        return result
+
+
+class IngestionScheduler:
+    """
+    Scheduler for the ingestion work of a process: one fair slot pool for
+    embedding calls and one for Weaviate/MongoDB writes, each with a
+    concurrency cap and a per-project limit.
+
+    The pools are in memory and not shared between processes: the API and
+    every worker enforce the caps on their own work only.
+    """
+
+    def __init__(self):
+        self.pools = {
+            "embed": FairSlotPool("embed", SCHEDULER_EMBED_SLOTS, SCHEDULER_PROJECT_EMBED_LIMIT),
+            "write": FairSlotPool("write", SCHEDULER_WRITE_SLOTS, SCHEDULER_PROJECT_WRITE_LIMIT),
+        }
+
+    @asynccontextmanager
+    async def slot(self, kind: str, project: str, weight: float = 1.0, cost: float = 1.0):
+        pool = self.pools[kind]
+        await pool.acquire(project, weight, cost)
+        try:
+            yield
+        finally:
+            pool.release(project)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "capacity": pool.capacity,
+                "per_project_limit": pool.per_project_limit,
+                "in_use": pool.in_use,
+                "queue_depth": len(pool.waiters),
+                "projects": pool.project_stats(),
+            }
+            for name, pool in self.pools.items()
+        }
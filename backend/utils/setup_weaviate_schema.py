@@ -1,39 +1,93 @@
 # utils/setup_weaviate_schema.py
 
 from weaviate import Client
-from weaviate.classes.config import Configure, Property, DataType
+from weaviate.classes.config import Configure, Property, DataType, Tokenization
 from loguru import logger
-#from config import CLASSNAME
+from config import EMBEDDING_MODEL
 from utils.collection_names import (
     get_weaviate_class_name,
+    get_file_weaviate_class_name,
 )
 
+# The file path as a single token, so path prefixes and globs can be matched
+# with `like` filters; 'filePath' stays word-tokenized for keyword search
+PATH_PROPERTY = Property(
+    name="path",
+    data_type=DataType.TEXT,
+    tokenization=Tokenization.FIELD,
+    index_filterable=True,
+    index_searchable=False,
+    skip_vectorization=True,
+)
+
+
+def ensure_filter_properties(weaviate_client: Client, class_name: str) -> None:
+    """
+    Add the 'path' property to a collection created before it existed, so
+    that it gets its field tokenization rather than an auto-schema default.
+    """
+    collection = weaviate_client.collections.get(class_name)
+    if not any(prop.name == "path" for prop in collection.config.get().properties):
+        collection.config.add_property(PATH_PROPERTY)
+        logger.info(f"Added the 'path' property to collection '{class_name}'.")
+
+
+def backfill_path_property(weaviate_client: Client, class_name: str) -> int:
+    """
+    Copy 'filePath' into 'path' for the chunks stored before the property
+    existed. Analyze skips unchanged files, so it would never set it on them.
+
+    Their 'startLine' and 'endLine' keep the indexes they were created with:
+    Weaviate cannot add range indexes to existing properties, so line filters
+    on these collections use the slower filterable index until the collection
+    is recreated (by an embedding migration, or deleting the project).
+
+    Returns:
+        The number of chunks updated.
+    """
+    collection = weaviate_client.collections.get(class_name)
+    updated = 0
+    for obj in collection.iterator(return_properties=["filePath", "path"]):
+        if obj.properties.get("path") is None and obj.properties.get("filePath"):
+            collection.data.update(uuid=obj.uuid, properties={"path": obj.properties["filePath"]})
+            updated += 1
+    logger.info(f"Backfilled the 'path' property of {updated} chunks in '{class_name}'.")
+    return updated
+
 
-def setup_weaviate_schema(weaviate_client: Client, project: str, delete: bool = False):
+def setup_weaviate_schema(weaviate_client: Client, project: str, delete: bool = False,
+                          class_name: str = None, embedding_model: str = EMBEDDING_MODEL):
     """
     Create or recreate the 'CodeChunk' collection using Weaviate's Collections API.
+    The embedding model of the stored vectors is recorded in the collection's description.
     """
     existing_collections = weaviate_client.collections.list_all()
-    class_name = get_weaviate_class_name(project)
+    class_name = class_name or get_weaviate_class_name(project)
     if class_name in existing_collections:
         if delete:
             logger.info(f"Collection '{class_name}' already exists. Deleting it for fresh setup.")
             weaviate_client.collections.delete(class_name)
+            # The file-level index is derived from the chunks: it goes with them
+            if get_file_weaviate_class_name(class_name) in existing_collections:
+                weaviate_client.collections.delete(get_file_weaviate_class_name(class_name))
         else:
             logger.info(f"Collection '{class_name}' already exists. Returning.")
+            ensure_filter_properties(weaviate_client, class_name)
             return
     logger.info(f"Creating collection '{class_name}'.")
     weaviate_client.collections.create(
         name=class_name,
-        description="Store code chunks and their embeddings",
+        description=f"Store code chunks and their embeddings (embedding model: {embedding_model})",
         vectorizer_config=Configure.Vectorizer.text2vec_openai(),
         properties=[
             Property(name="content", data_type=DataType.TEXT),
             Property(name="filePath", data_type=DataType.TEXT),
-            Property(name="language", data_type=DataType.TEXT),
-            Property(name="functionName", data_type=DataType.TEXT),
-            Property(name="startLine", data_type=DataType.INT),
-            Property(name="endLine", data_type=DataType.INT),
+            PATH_PROPERTY,
+            Property(name="language", data_type=DataType.TEXT, index_filterable=True),
+            Property(name="functionName", data_type=DataType.TEXT, index_filterable=True),
+            Property(name="startLine", data_type=DataType.INT, index_filterable=True, index_range_filters=True),
+            Property(name="endLine", data_type=DataType.INT, index_filterable=True, index_range_filters=True),
+            Property(name="tokenCount", data_type=DataType.INT),
         ]
     )
     logger.info(f"Collection '{class_name}' created successfully.")
@@ -0,0 +1,121 @@
+# utils/single_flight.py
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from utils.metrics import metrics
+
+
+class _StreamFlight:
+    """The events of one in-flight stream, replayed to every subscriber."""
+
+    def __init__(self):
+        self.events: List[str] = []
+        self.done = False
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def publish(self, event: str) -> None:
+        async with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+
+    async def close(self) -> None:
+        async with self.changed:
+            self.done = True
+            self.changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Yield every event from the first one, then the new ones until the stream ends."""
+        sent = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.events) > sent or self.done)
+                pending = self.events[sent:]
+                finished = self.done
+            for event in pending:
+                yield event
+            sent += len(pending)
+            if finished and sent == len(self.events):
+                return
+
+
+class SingleFlight:
+    """
+    Coalesce identical in-flight computations.
+
+    The first caller of a key starts the computation as a task of its own;
+    concurrent callers with the same key attach to it and receive the same
+    result (or error) instead of computing it again. The computation is
+    shielded from its callers, so a caller that goes away does not cancel it
+    for the others. Keys are forgotten as soon as the computation ends:
+    nothing is cached past that point.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _count(self, coalesced: bool) -> None:
+        if coalesced:
+            self.coalesced += 1
+            metrics.increment("single_flight.coalesced")
+        else:
+            self.leaders += 1
+            metrics.increment("single_flight.leaders")
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the result of `compute()`, shared with every concurrent call of `key`.
+        """
+        task = self._calls.get(key)
+        self._count(task is not None)
+        if task is None:
+            task = self._calls[key] = asyncio.create_task(compute())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def stream(self, key: str, open_stream: Callable[[], Awaitable[AsyncIterator[str]]]) -> AsyncIterator[str]:
+        """
+        Start or join the stream of `key`.
+
+        `open_stream()` does the work that may still fail with an error (such
+        as an HTTPException) and returns the iterator of the events; that error
+        is raised to every caller. Once it succeeds, each caller gets an
+        iterator over all the events, including the ones sent before it joined.
+        """
+        flight = self._streams.get(key)
+        self._count(flight is not None)
+        if flight is None:
+            flight = self._streams[key] = _StreamFlight()
+            flight.task = asyncio.create_task(self._run_stream(key, flight, open_stream))
+        await asyncio.shield(flight.ready)
+        return flight.subscribe()
+
+    async def _run_stream(self, key: str, flight: _StreamFlight,
+                          open_stream: Callable[[], Awaitable[AsyncIterator[str]]]) -> None:
+        try:
+            events = await open_stream()
+            flight.ready.set_result(None)
+            async for event in events:
+                await flight.publish(event)
+        except Exception as e:
+            if not flight.ready.done():
+                flight.ready.set_exception(e)
+            else:
+                logger.error(f"Coalesced stream failed: {e}")
+        finally:
+            self._streams.pop(key, None)
+            await flight.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -1,63 +1,75 @@
 # utils/summarizer.py
 
-from typing import Any
 from datetime import datetime
-from fastapi import HTTPException
+from typing import Any, Dict, List, Optional
+
 from loguru import logger
-from openai import OpenAI
+from openai import AsyncOpenAI
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+CONVERSATION_SUMMARIES_COLLECTION = "conversation_summaries"
+
+
+async def ensure_summary_indexes(db) -> None:
+    summaries = db[CONVERSATION_SUMMARIES_COLLECTION]
+    try:
+        # Summaries used to be unique per project; they are now per session
+        await summaries.drop_index("unique_project_summary")
+    except OperationFailure:
+        pass
+    await summaries.create_index(
+        [("project", 1), ("sessionId", 1)], unique=True, name="unique_session_summary"
+    )
+
+
+async def ensure_answer_indexes(answers_collection) -> None:
+    """Create the indexes history reads use: by session, then by time."""
+    await answers_collection.create_index([("timestamp", -1)], name="answers_timestamp")
+    await answers_collection.create_index([("sessionId", 1), ("timestamp", -1)], name="answers_session_timestamp")
 
-openai_client = OpenAI()
 
-async def summarize_interactions(collection, max_literal=2, max_total=10) -> str:
+def _format_interactions(interactions: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"Query: {entry['query']}\nAnswer: {entry['answer']}" for entry in interactions)
+
+
+async def summarize_interactions(collection, summaries_collection, project: str, max_literal=2,
+                                 session_id: Optional[str] = None) -> str:
     """
-    Summarize the last `max_total` interactions, keeping the last `max_literal`
-    interactions literal and summarizing the rest.
+    Build the conversation history of a session from its last `max_literal`
+    interactions, kept literal, and the persisted rolling summary of the
+    earlier ones. No LLM call is made; the summary is maintained by
+    update_rolling_summary.
 
     Args:
         collection: The MongoDB collection containing the query history.
+        summaries_collection: The MongoDB collection of rolling summaries.
+        project: The normalized project name.
         max_literal: Number of most recent interactions to include as-is.
-        max_total: Total number of interactions to process.
+        session_id: The session whose history is read; interactions without
+            a session form one shared conversation per project.
 
     Returns:
         A formatted string with the last `max_literal` interactions literal
         and earlier interactions summarized.
     """
-    # Fetch the last `max_total` interactions
-    recent_history = await collection.find(
-        {},
+    literal_history = await collection.find(
+        {"sessionId": session_id},
         {"_id": 0, "query": 1, "answer": 1}
-    ).sort("timestamp", -1).limit(max_total).to_list(length=max_total)
+    ).sort("timestamp", -1).limit(max_literal).to_list(length=max_literal)
 
-    if not recent_history:
+    if not literal_history:
         return "No previous interactions available."
 
-    # Split history into literal and to summarize
-    literal_history = recent_history[:max_literal]
-    to_summarize = recent_history[max_literal:]
+    summary_doc = await summaries_collection.find_one(
+        {"project": project, "sessionId": session_id}, {"_id": 0, "summary": 1}
+    )
+    summary = summary_doc["summary"] if summary_doc else "No earlier interactions available."
 
     # Format the literal history
     literal_formatted = "\n".join(
         [f"{i + 1}. Query: {entry['query']}\n   Answer: {entry['answer']}" for i, entry in enumerate(literal_history)]
     )
 
-    # Summarize the rest using OpenAI
-    if to_summarize:
-        summarize_prompt = "\n".join(
-            [f"Query: {entry['query']}\nAnswer: {entry['answer']}" for entry in to_summarize]
-        )
-        try:
-            summary_response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": f"Summarize these interactions:\n{summarize_prompt}"}],
-                temperature=0.0,
-                max_tokens=400
-            )
-            summary = summary_response.choices[0].message["content"].strip()
-        except Exception as e:
-            summary = f"Error summarizing interactions: {e}"
-    else:
-        summary = "No earlier interactions available."
-
     # Combine literal and summarized history
     combined_history = f"""
 Previous Interactions:
@@ -70,3 +82,73 @@ Summarized History:
     """
     return combined_history
 
+
+async def update_rolling_summary(collection, summaries_collection, project: str, openai_client: AsyncOpenAI,
+                                 max_literal=2, max_fold=10, session_id: Optional[str] = None) -> None:
+    """
+    Fold the interactions that aged out of the literal window since the last
+    update into the session's rolling summary.
+
+    Args:
+        collection: The MongoDB collection containing the query history.
+        summaries_collection: The MongoDB collection of rolling summaries.
+        project: The normalized project name.
+        openai_client: The shared OpenAI client.
+        max_literal: Number of most recent interactions kept out of the summary.
+        max_fold: Maximum number of interactions folded per update; any
+            remainder is folded by the next update.
+        session_id: The session whose summary is updated.
+    """
+    summary_key = {"project": project, "sessionId": session_id}
+    summary_doc = await summaries_collection.find_one(summary_key)
+    folded_until = summary_doc["foldedUntil"] if summary_doc else None
+
+    # The newest interaction that is no longer literal
+    newest_aged = await collection.find(
+        {"sessionId": session_id}, {"timestamp": 1}
+    ).sort("timestamp", -1).skip(max_literal).limit(1).to_list(length=1)
+    if not newest_aged:
+        return
+    aged_filter = {"sessionId": session_id, "timestamp": {"$lte": newest_aged[0]["timestamp"]}}
+    if folded_until is not None:
+        aged_filter["timestamp"]["$gt"] = folded_until
+
+    to_fold = await collection.find(
+        aged_filter, {"_id": 0, "query": 1, "answer": 1, "timestamp": 1}
+    ).sort("timestamp", 1).limit(max_fold).to_list(length=max_fold)
+    if not to_fold:
+        return
+
+    previous = summary_doc["summary"] if summary_doc else ""
+    prompt = (
+        f"Here is a summary of a conversation so far:\n{previous}\n\n"
+        f"Update it with these later interactions:\n{_format_interactions(to_fold)}"
+        if previous else
+        f"Summarize these interactions:\n{_format_interactions(to_fold)}"
+    )
+    try:
+        summary_response = await openai_client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=400
+        )
+        summary = summary_response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Failed to update the conversation summary of project '{project}' (session {session_id}): {e}")
+        return
+
+    update = {"$set": {
+        "summary": summary,
+        "foldedUntil": to_fold[-1]["timestamp"],
+        "updatedAt": datetime.utcnow(),
+    }, "$inc": {"foldedCount": len(to_fold)}}
+    try:
+        # Only apply the fold if no concurrent update moved the summary on
+        result = await summaries_collection.update_one(
+            {**summary_key, "foldedUntil": folded_until}, update, upsert=summary_doc is None
+        )
+    except DuplicateKeyError:
+        return
+    if result.matched_count or result.upserted_id:
+        logger.debug(f"Folded {len(to_fold)} interactions into the summary of project '{project}' (session {session_id}).")
@@ -0,0 +1,213 @@
+# utils/symbol_index.py
+
+import asyncio
+import os
+import re
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from config import SYMBOL_INDEX_REFERENCES
+from utils.context_compressor import get_language
+
+_PYTHON_DEFINITIONS = [
+    ("function", re.compile(r"^\s*(?:async\s+)?def\s+([A-Za-z_]\w*)")),
+    ("class", re.compile(r"^\s*class\s+([A-Za-z_]\w*)")),
+]
+_JS_DEFINITIONS = [
+    ("function", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)")),
+    ("class", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?class\s+([A-Za-z_$][\w$]*)")),
+    ("function", re.compile(
+        r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|[\w$]+\s*=>)"
+    )),
+    ("function", re.compile(
+        r"^\s*(?!(?:if|for|while|switch|catch|with|return|else)\b)(?:static\s+|async\s+|get\s+|set\s+)*"
+        r"([A-Za-z_$][\w$]*)\s*\([^)]*\)\s*\{"
+    )),
+]
+_CALL = re.compile(r"\b([A-Za-z_$][\w$]*)\s*\(")
+_KEYWORDS = {
+    "if", "for", "while", "switch", "catch", "with", "return", "else", "def", "class", "function",
+    "print", "len", "str", "int", "float", "dict", "list", "set", "tuple", "range", "super", "isinstance",
+}
+
+# Identifiers worth looking up: `quoted`, snake_case, camelCase, PascalCase
+# with an inner capital or led by an acronym (HTTPException), name() calls and
+# file names. Plain words and all-caps acronyms are left out
+_QUOTED = re.compile(r"`([^`\s]+)`")
+_IDENTIFIER = re.compile(
+    r"\b([A-Za-z_$][\w$]*_[\w$]+|[a-z$][\w$]*[A-Z][\w$]*|[A-Z][a-z0-9]+[A-Z][\w$]*|[A-Z]{2,}[a-z][\w$]*"
+    r"|[A-Za-z_$][\w$]*(?=\(\)))"
+)
+_FILE_NAME = re.compile(r"\b([\w.-]+\.(?:py|js|jsx|mjs|cjs|ts|md))\b")
+
+# A backfill claimed longer ago than this is assumed to have crashed and is claimed again
+_BACKFILL_STALE_SECONDS = 3600
+
+
+async def ensure_symbol_indexes(symbols_collection) -> None:
+    """Create the indexes used to look symbols up and to replace a file's symbols."""
+    await symbols_collection.create_index([("symbol", 1), ("kind", 1)], name="symbols_by_name")
+    await symbols_collection.create_index([("filePath", 1)], name="symbols_by_file")
+
+
+def extract_symbols(chunk: Dict[str, Any], chunk_id: str) -> List[Dict[str, Any]]:
+    """
+    List the definitions of a chunk (functions and classes, with their line)
+    and, when SYMBOL_INDEX_REFERENCES is set, the names it calls.
+    """
+    language = get_language(chunk["filePath"])
+    patterns = _PYTHON_DEFINITIONS if language == "python" else _JS_DEFINITIONS if language == "javascript" else []
+
+    symbols = []
+    seen = set()
+
+    def add(name, kind, line):
+        if (name, kind) not in seen:
+            seen.add((name, kind))
+            symbols.append({
+                "symbol": name,
+                "kind": kind,
+                "filePath": chunk["filePath"],
+                "line": line,
+                "chunkId": chunk_id,
+                "chunkHash": chunk["hash"],
+            })
+
+    for offset, line in enumerate(chunk["content"].split("\n")):
+        for kind, pattern in patterns:
+            match = pattern.match(line)
+            if match:
+                add(match.group(1), kind, chunk["startLine"] + offset)
+                break
+    if chunk.get("functionName"):
+        add(chunk["functionName"], "function", chunk["startLine"])
+
+    if SYMBOL_INDEX_REFERENCES and patterns:
+        for offset, line in enumerate(chunk["content"].split("\n")):
+            for match in _CALL.finditer(line):
+                name = match.group(1)
+                if name not in _KEYWORDS and (name, "function") not in seen and (name, "class") not in seen:
+                    add(name, "reference", chunk["startLine"] + offset)
+    return symbols
+
+
+async def replace_file_symbols(symbols_collection, fp: str, symbols: List[Dict[str, Any]]) -> None:
+    """Replace the symbols of a file, alongside its chunk hashes."""
+    await symbols_collection.delete_many({"filePath": fp})
+    if symbols:
+        await symbols_collection.insert_many(symbols)
+    logger.debug(f"Indexed {len(symbols)} symbols for file '{fp}'.")
+
+
+async def backfill_symbols(chunk_collection, symbols_collection, batch_size: int = 500) -> int:
+    """
+    Index the symbols of chunks stored before the symbol index existed, from
+    their content in Weaviate. Their hashes are not stored there, so these
+    symbols carry no 'chunkHash'. Files that already have symbols were
+    indexed by an analyze running alongside, from their latest chunks, and
+    are left alone.
+
+    Returns:
+        The number of symbols indexed.
+    """
+    iterator = chunk_collection.iterator(
+        return_properties=["content", "filePath", "startLine", "functionName"]
+    )
+    backfilled, skipped = set(), set()
+    total = 0
+    while True:
+        objects = await asyncio.to_thread(lambda: list(islice(iterator, batch_size)))
+        if not objects:
+            break
+        new_paths = {obj.properties["filePath"] for obj in objects} - backfilled - skipped
+        if new_paths:
+            indexed = await symbols_collection.distinct("filePath", {"filePath": {"$in": list(new_paths)}})
+            skipped.update(indexed)
+            backfilled.update(new_paths - set(indexed))
+        symbols = [
+            symbol
+            for obj in objects
+            if obj.properties["filePath"] in backfilled
+            for symbol in extract_symbols({**obj.properties, "hash": None}, str(obj.uuid))
+        ]
+        if symbols:
+            await symbols_collection.insert_many(symbols)
+        total += len(symbols)
+    logger.info(f"Backfilled {total} symbols from '{chunk_collection.name}' "
+                f"({len(skipped)} files already indexed).")
+    return total
+
+
+async def ensure_symbols_backfilled(db, project: str, chunk_collection, symbols_collection) -> None:
+    """
+    Backfill the symbol index of a project indexed before it existed, once:
+    the backfill is claimed on the project first, so concurrent analyzes do
+    not run it twice. A claim left by a crashed backfill expires after an hour.
+    """
+    now = datetime.utcnow()
+    claimed = await db["projects"].find_one_and_update(
+        {
+            "normalized_name": project,
+            "symbolIndexed": {"$ne": True},
+            "$or": [
+                {"symbolBackfillStartedAt": {"$exists": False}},
+                {"symbolBackfillStartedAt": {"$lt": now - timedelta(seconds=_BACKFILL_STALE_SECONDS)}},
+            ],
+        },
+        {"$set": {"symbolBackfillStartedAt": now}},
+    )
+    if claimed is None:
+        return
+    try:
+        await ensure_symbol_indexes(symbols_collection)
+        await backfill_symbols(chunk_collection, symbols_collection)
+    except Exception as e:
+        logger.error(f"Symbol backfill of project '{project}' failed: {e}")
+        # Let the next analyze try again
+        await db["projects"].update_one({"normalized_name": project}, {"$unset": {"symbolBackfillStartedAt": ""}})
+        raise
+    await db["projects"].update_one(
+        {"normalized_name": project},
+        {"$set": {"symbolIndexed": True}, "$unset": {"symbolBackfillStartedAt": ""}},
+    )
+
+
+def detect_identifiers(query: str) -> Dict[str, List[str]]:
+    """
+    Find the names in a question that look like code identifiers or file names.
+
+    Returns:
+        A dict with the 'symbols' and 'files' mentioned, in order of appearance.
+    """
+    files = list(dict.fromkeys(_FILE_NAME.findall(query)))
+    candidates = _QUOTED.findall(query) + _IDENTIFIER.findall(query)
+    symbols = []
+    for name in candidates:
+        if _FILE_NAME.fullmatch(name):
+            continue
+        name = name.rstrip("()").split(".")[-1]
+        if name and name not in symbols and not any(name == os.path.splitext(f)[0] for f in files):
+            symbols.append(name)
+    return {"symbols": symbols, "files": files}
+
+
+async def lookup_symbols(symbols_collection, names: List[str], limit: int,
+                         include_references: bool = True) -> List[str]:
+    """
+    The ids of the chunks defining `names`, then of the chunks referencing
+    them unless `include_references` is False, at most `limit` of them.
+    """
+    if not names:
+        return []
+    query = {"symbol": {"$in": names}}
+    if not include_references:
+        query["kind"] = {"$ne": "reference"}
+    # 'class' and 'function' sort before 'reference'
+    docs = await symbols_collection.find(
+        query, {"_id": 0, "symbol": 1, "kind": 1, "chunkId": 1}
+    ).sort("kind", 1).limit(limit * len(names)).to_list(length=None)
+    docs.sort(key=lambda doc: (doc["kind"] == "reference", names.index(doc["symbol"])))
+    return list(dict.fromkeys(doc["chunkId"] for doc in docs))[:limit]
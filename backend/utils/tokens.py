@@ -0,0 +1,34 @@
+# utils/tokens.py
+
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from loguru import logger
+from tiktoken import encoding_for_model, get_encoding
+
+from config import COMPLETION_MODEL
+
+
+@lru_cache(maxsize=None)
+def get_token_encoder(model: str = COMPLETION_MODEL):
+    """
+    Return the tiktoken encoder of the completion model. Encoders are loaded
+    once per process and reused.
+    """
+    try:
+        return encoding_for_model(model)
+    except KeyError:
+        logger.warning(f"No tiktoken encoding registered for '{model}'. Falling back to cl100k_base.")
+        return get_encoding("cl100k_base")
+
+
+def count_chunk_tokens(chunks: List[Dict[str, Any]]) -> None:
+    """Store the completion-model token count of every chunk's content in ch['tokenCount']."""
+    encoder = get_token_encoder()
+    for ch in chunks:
+        ch["tokenCount"] = len(encoder.encode(ch["content"]))
+
+
+def estimate_token_count(text: str) -> int:
+    """Cheap token estimate (about four characters per token) for text that was not counted at ingest."""
+    return len(text) // 4 + 1
@@ -60,3 +60,18 @@ async def validate_project(
             detail="Internal server error during project validation."
         )
 
+
+
+async def load_project(db, project: str) -> dict:
+    """
+    Fetch a project's metadata by name.
+
+    Raises:
+        HTTPException: If the project does not exist.
+    """
+    normalized_name = normalize_project_name(project)
+    project_data = await db["projects"].find_one({"normalized_name": normalized_name})
+    if not project_data:
+        logger.warning(f"Project '{project}' not found in the database.")
+        raise HTTPException(status_code=404, detail=f"Project '{project}' not found.")
+    return project_data
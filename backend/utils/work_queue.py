@@ -0,0 +1,270 @@
+# utils/work_queue.py
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from loguru import logger
+from pymongo import ReturnDocument
+
+from config import WORK_QUEUE_BATCH_SIZE, WORK_QUEUE_LEASE_SECONDS, WORK_QUEUE_MAX_ATTEMPTS
+from utils.collection_names import get_active_weaviate_class_name
+from utils.embedding import get_project_embedding_model
+from utils.index_version import bump_index_version
+
+WORK_QUEUE_COLLECTION = "ingest_queue"
+ANALYZE_JOBS_COLLECTION = "analyze_jobs"
+
+
+async def ensure_work_queue_indexes(db) -> None:
+    """Create the indexes used to claim batches and to follow job progress."""
+    queue = db[WORK_QUEUE_COLLECTION]
+    await queue.create_index([("status", 1), ("leaseExpiresAt", 1), ("createdAt", 1)], name="claim_order")
+    await queue.create_index([("jobId", 1)], name="batches_by_job")
+    await db[ANALYZE_JOBS_COLLECTION].create_index([("project", 1), ("createdAt", -1)], name="jobs_by_project")
+
+
+async def enqueue_analyze_job(db, project_data: dict, file_paths: List[str],
+                              batch_size: int = WORK_QUEUE_BATCH_SIZE) -> ObjectId:
+    """
+    Create an analyze job and split its files into batches on the work queue.
+
+    Returns:
+        The id of the analyze job.
+    """
+    now = datetime.utcnow()
+    batches = [file_paths[i:i + batch_size] for i in range(0, len(file_paths), batch_size)]
+
+    job = {
+        "project": project_data["normalized_name"],
+        "status": "queued",
+        "totalFiles": len(file_paths),
+        "totalBatches": len(batches),
+        "completedBatches": 0,
+        "failedBatches": 0,
+        "chunkedFiles": 0,
+        "ignoredFiles": 0,
+        "chunksEmbedded": 0,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    result = await db[ANALYZE_JOBS_COLLECTION].insert_one(job)
+    job_id = result.inserted_id
+
+    await db[WORK_QUEUE_COLLECTION].insert_many([
+        {
+            "jobId": job_id,
+            "project": project_data["normalized_name"],
+            "weight": project_data.get("weight", 1.0),
+            "collectionName": get_active_weaviate_class_name(project_data),
+            "embeddingModel": get_project_embedding_model(project_data),
+            "files": files,
+            "reportedFiles": [],
+            "status": "pending",
+            "attempts": 0,
+            "leaseOwner": None,
+            "leaseExpiresAt": None,
+            "createdAt": now,
+        }
+        for files in batches
+    ])
+    logger.info(f"Queued analyze job {job_id} for project '{project_data['normalized_name']}': "
+                f"{len(file_paths)} files in {len(batches)} batches.")
+    return job_id
+
+
+async def start_inline_job(db, project_data: dict, total_files: int) -> ObjectId:
+    """
+    Record an analyze run by the API process itself as a running job, so that
+    migrations see it. The job must be kept alive with touch_inline_job.
+    """
+    now = datetime.utcnow()
+    result = await db[ANALYZE_JOBS_COLLECTION].insert_one({
+        "project": project_data["normalized_name"],
+        "status": "running",
+        "inline": True,
+        "totalFiles": total_files,
+        "totalBatches": 0,
+        "completedBatches": 0,
+        "failedBatches": 0,
+        "chunkedFiles": 0,
+        "ignoredFiles": 0,
+        "chunksEmbedded": 0,
+        "createdAt": now,
+        "startedAt": now,
+        "updatedAt": now,
+    })
+    return result.inserted_id
+
+
+async def touch_inline_job(db, job_id: ObjectId) -> None:
+    """Mark an inline job alive every third of the lease duration until cancelled."""
+    while True:
+        await asyncio.sleep(WORK_QUEUE_LEASE_SECONDS / 3)
+        await db[ANALYZE_JOBS_COLLECTION].update_one(
+            {"_id": job_id, "status": "running"}, {"$set": {"updatedAt": datetime.utcnow()}}
+        )
+
+
+async def finish_inline_job(db, job_id: ObjectId, status: str, counts: Optional[Dict[str, int]] = None) -> None:
+    """Record the outcome ('completed', 'failed' or 'cancelled') of an inline job, once."""
+    now = datetime.utcnow()
+    await db[ANALYZE_JOBS_COLLECTION].update_one(
+        {"_id": job_id, "status": "running"},
+        {"$set": {**(counts or {}), "status": status, "completedAt": now, "updatedAt": now}}
+    )
+
+
+async def cancel_analyze_job(db, job_id: ObjectId) -> None:
+    """Cancel a queued job before any worker processes it: its pending batches are dropped."""
+    await db[WORK_QUEUE_COLLECTION].delete_many({"jobId": job_id, "status": "pending"})
+    await db[ANALYZE_JOBS_COLLECTION].update_one(
+        {"_id": job_id}, {"$set": {"status": "cancelled", "updatedAt": datetime.utcnow()}}
+    )
+
+
+async def get_active_analyze_job(db, project: str) -> Optional[Dict[str, Any]]:
+    """
+    Return a queued or running analyze job of a project, if any. Inline jobs
+    not touched within a lease died with their process and are ignored.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=WORK_QUEUE_LEASE_SECONDS)
+    return await db[ANALYZE_JOBS_COLLECTION].find_one({
+        "project": project,
+        "status": {"$in": ["queued", "running"]},
+        "$or": [{"inline": {"$ne": True}}, {"updatedAt": {"$gt": stale_before}}],
+    })
+
+
+async def claim_batch(db, worker_id: str, lease_seconds: int = WORK_QUEUE_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+    """
+    Atomically lease the oldest pending batch, or a batch whose lease expired
+    because its worker crashed or stalled.
+
+    Batches that exhausted their attempts are marked failed on the job.
+
+    Returns:
+        The leased batch document, or None when the queue is empty.
+    """
+    while True:
+        now = datetime.utcnow()
+        batch = await db[WORK_QUEUE_COLLECTION].find_one_and_update(
+            {"$or": [
+                {"status": "pending"},
+                {"status": "leased", "leaseExpiresAt": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "leased",
+                    "leaseOwner": worker_id,
+                    "leaseExpiresAt": now + timedelta(seconds=lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("createdAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if batch is None:
+            return None
+
+        if batch["attempts"] > WORK_QUEUE_MAX_ATTEMPTS:
+            logger.error(f"Batch {batch['_id']} of job {batch['jobId']} failed after "
+                         f"{WORK_QUEUE_MAX_ATTEMPTS} attempts.")
+            await finish_batch(db, batch, worker_id, status="failed")
+            continue
+
+        if batch["attempts"] > 1:
+            logger.warning(f"Worker '{worker_id}' reclaimed expired batch {batch['_id']} "
+                           f"(attempt {batch['attempts']}).")
+        await db[ANALYZE_JOBS_COLLECTION].update_one(
+            {"_id": batch["jobId"], "status": "queued"},
+            {"$set": {"status": "running", "startedAt": now}}
+        )
+        return batch
+
+
+async def heartbeat(db, batch_id: ObjectId, worker_id: str, lease_seconds: int = WORK_QUEUE_LEASE_SECONDS) -> bool:
+    """
+    Extend the lease of a batch.
+
+    Returns:
+        False when the lease was lost to another worker.
+    """
+    result = await db[WORK_QUEUE_COLLECTION].update_one(
+        {"_id": batch_id, "status": "leased", "leaseOwner": worker_id},
+        {"$set": {"leaseExpiresAt": datetime.utcnow() + timedelta(seconds=lease_seconds)}}
+    )
+    return result.modified_count == 1
+
+
+async def report_file(db, batch: Dict[str, Any], fp: str, result: Dict[str, Any]) -> None:
+    """
+    Add the result of one indexed file to the progress of the batch's job.
+    Files are recorded on the batch as they are reported, so that a batch
+    reclaimed after its lease expired does not count them twice.
+    """
+    first_report = await db[WORK_QUEUE_COLLECTION].update_one(
+        {"_id": batch["_id"], "reportedFiles": {"$ne": fp}},
+        {"$addToSet": {"reportedFiles": fp}}
+    )
+    if first_report.modified_count != 1:
+        logger.debug(f"File '{fp}' of batch {batch['_id']} was already reported.")
+        return
+
+    counter = "chunkedFiles" if result["status"] == "chunked" else "ignoredFiles"
+    await db[ANALYZE_JOBS_COLLECTION].update_one(
+        {"_id": batch["jobId"]},
+        {
+            "$inc": {counter: 1, "chunksEmbedded": result["chunks_embedded"]},
+            "$set": {"updatedAt": datetime.utcnow()},
+        }
+    )
+
+
+async def finish_batch(db, batch: Dict[str, Any], worker_id: str, status: str = "done") -> None:
+    """
+    Release a batch as 'done' or 'failed' and complete its job once every
+    batch is accounted for. Nothing is recorded if the lease was lost.
+    """
+    now = datetime.utcnow()
+    released = await db[WORK_QUEUE_COLLECTION].update_one(
+        {"_id": batch["_id"], "leaseOwner": worker_id, "status": "leased"},
+        {"$set": {"status": status, "leaseExpiresAt": None, "finishedAt": now}}
+    )
+    if released.modified_count != 1:
+        logger.warning(f"Worker '{worker_id}' lost the lease on batch {batch['_id']}.")
+        return
+    # Each batch changes what queries can retrieve
+    await bump_index_version(db, batch["project"])
+
+    counter = "completedBatches" if status == "done" else "failedBatches"
+    job = await db[ANALYZE_JOBS_COLLECTION].find_one_and_update(
+        {"_id": batch["jobId"]},
+        {"$inc": {counter: 1}, "$set": {"updatedAt": now}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if job is None or job["completedBatches"] + job["failedBatches"] < job["totalBatches"]:
+        return
+
+    completed = await db[ANALYZE_JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "status": {"$ne": "completed"}},
+        {"$set": {"status": "completed", "completedAt": now}}
+    )
+    if completed.modified_count == 1:
+        # Record the run so the planner can estimate durations from recent throughput
+        await db["analyze_runs"].insert_one({
+            "project": job["project"],
+            "chunks_embedded": job["chunksEmbedded"],
+            "duration_seconds": (now - job.get("startedAt", job["createdAt"])).total_seconds(),
+            "timestamp": now,
+        })
+        logger.info(f"Analyze job {job['_id']} completed for project '{job['project']}'.")
+
+
+def format_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Format an analyze job record for a JSON response."""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in job.items()
+    }
@@ -0,0 +1,148 @@
+# worker.py
+#
+# Standalone ingestion worker. Run one or more alongside the API:
+#
+#     python -m worker [--worker-id NAME]
+#
+# Workers lease batches of files from the Mongo work queue filled by
+# /api/analyze (with "useWorkers": true), run the chunk, embed and write
+# stages and report progress on the analyze job.
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from openai import AsyncOpenAI
+
+from config import (
+    MONGO_URL,
+    MONGO_DB_NAME,
+    WORK_QUEUE_LEASE_SECONDS,
+    WORKER_POLL_INTERVAL_SECONDS,
+    FILE_INDEX_ENABLED,
+)
+from database import connect_weaviate
+from logging_config import setup_logging
+from utils.collection_names import (
+    get_active_weaviate_class_name,
+    get_mongo_chunk_hashes_collection_name,
+    get_mongo_symbols_collection_name,
+)
+from utils.embedding import get_project_embedding_model
+from utils.file_index import open_file_index
+from utils.ingestion import index_file
+from utils.openai_clients import create_openai_client
+from utils.scheduler import IngestionScheduler
+from utils.tokens import get_token_encoder
+from utils.work_queue import (
+    ensure_work_queue_indexes,
+    claim_batch,
+    heartbeat,
+    report_file,
+    finish_batch,
+)
+
+
+async def keep_lease(db, batch_id, worker_id: str, lease_lost: asyncio.Event) -> None:
+    """Extend the batch lease every third of its duration until cancelled."""
+    while True:
+        await asyncio.sleep(WORK_QUEUE_LEASE_SECONDS / 3)
+        if not await heartbeat(db, batch_id, worker_id):
+            lease_lost.set()
+            return
+
+
+async def process_batch(db, weaviate_client, openai_client: AsyncOpenAI, scheduler: IngestionScheduler,
+                        batch: dict, worker_id: str) -> None:
+    project = batch["project"]
+    hashes_collection = db[get_mongo_chunk_hashes_collection_name(project)]
+    symbols_collection = db[get_mongo_symbols_collection_name(project)]
+    collection_name = batch.get("collectionName")
+    model = batch.get("embeddingModel")
+    if collection_name is None or model is None:
+        # Batches queued before migrations recorded their target: use the project's active one
+        project_data = await db["projects"].find_one({"normalized_name": project}) or {"normalized_name": project}
+        collection_name = collection_name or get_active_weaviate_class_name(project_data)
+        model = model or get_project_embedding_model(project_data)
+    chunk_collection = weaviate_client.collections.get(collection_name)
+    file_collection = None
+    if FILE_INDEX_ENABLED:
+        file_collection = await open_file_index(db, weaviate_client, project, collection_name)
+
+    lease_lost = asyncio.Event()
+    heartbeat_task = asyncio.create_task(keep_lease(db, batch["_id"], worker_id, lease_lost))
+    try:
+        for fp in batch["files"]:
+            if lease_lost.is_set():
+                logger.warning(f"Lease on batch {batch['_id']} lost. Abandoning it.")
+                return
+            try:
+                result = await index_file(
+                    fp, hashes_collection, chunk_collection, openai_client, scheduler, project,
+                    batch.get("weight", 1.0), model, file_collection, symbols_collection
+                )
+            except Exception as e:
+                logger.error(f"Failed to process file '{fp}': {e}")
+                result = {"status": "ignored", "chunks_embedded": 0}
+            await report_file(db, batch, fp, result)
+    finally:
+        heartbeat_task.cancel()
+
+    await finish_batch(db, batch, worker_id)
+
+
+async def run_worker(worker_id: str) -> None:
+    mongo_client = AsyncIOMotorClient(MONGO_URL)
+    db = mongo_client[MONGO_DB_NAME]
+    await ensure_work_queue_indexes(db)
+    weaviate_client = connect_weaviate()
+    openai_client = create_openai_client()
+    scheduler = IngestionScheduler()
+    get_token_encoder()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    logger.info(f"Worker '{worker_id}' started.")
+    try:
+        while not stopping.is_set():
+            batch = await claim_batch(db, worker_id)
+            if batch is None:
+                try:
+                    await asyncio.wait_for(stopping.wait(), timeout=WORKER_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info(f"Worker '{worker_id}' processing batch {batch['_id']} "
+                        f"({len(batch['files'])} files) of job {batch['jobId']}.")
+            await process_batch(db, weaviate_client, openai_client, scheduler, batch, worker_id)
+    finally:
+        # An interrupted batch is picked up by another worker once its lease expires
+        mongo_client.close()
+        weaviate_client.close()
+        await openai_client.close()
+        logger.info(f"Worker '{worker_id}' stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion worker for analyze jobs.")
+    parser.add_argument(
+        "--worker-id",
+        default=f"{socket.gethostname()}-{os.getpid()}",
+        help="Unique name used to own leases (default: hostname-pid)."
+    )
+    args = parser.parse_args()
+
+    setup_logging()
+    asyncio.run(run_worker(args.worker_id))
+
+
+if __name__ == "__main__":
+    main()
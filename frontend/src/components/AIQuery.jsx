@@ -3,6 +3,7 @@ import axios from 'axios';
 import ReactMarkdown from 'react-markdown';
 import { Prism as SyntaxHighlighter } from 'react-syntax-highlighter';
 import { solarizedlight } from 'react-syntax-highlighter/dist/esm/styles/prism';
+import { getSessionId } from '../session';
 
 function AIQuery({ project, settings }) {
   const [query, setQuery] = useState(() => localStorage.getItem('query') || '');
@@ -54,6 +55,7 @@ function AIQuery({ project, settings }) {
         project,
         query,
         settings,
+        sessionId: getSessionId(),
       });
 
       logEvent('Received API response', { response: response.data });
@@ -3,6 +3,7 @@ import axios from 'axios';
 import ReactMarkdown from 'react-markdown';
 import { Prism as SyntaxHighlighter } from 'react-syntax-highlighter';
 import { solarizedlight } from 'react-syntax-highlighter/dist/esm/styles/prism';
+import { getSessionId } from '../session';
 
 function QueryHistory({ project }) {
   const [history, setHistory] = useState([]);
@@ -47,7 +48,7 @@ function QueryHistory({ project }) {
 
     try {
       const response = await axios.get(`${process.env.REACT_APP_API_BASE_URL}/history`, {
-        params: { project },
+        params: { project, sessionId: getSessionId() },
       });
       logEvent('Received history data', { response: response.data });
       setHistory(response.data || []);
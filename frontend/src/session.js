@@ -0,0 +1,10 @@
+// The conversation id of this browser tab, sent with queries so that each tab
+// gets its own history. Kept in sessionStorage: it survives reloads, not new tabs.
+export function getSessionId() {
+  let sessionId = sessionStorage.getItem('sessionId');
+  if (!sessionId) {
+    sessionId = crypto.randomUUID();
+    sessionStorage.setItem('sessionId', sessionId);
+  }
+  return sessionId;
+}